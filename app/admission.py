@@ -0,0 +1,302 @@
+"""
+Admission control for AI Task API
+Requests to the /ai-task/ dispatcher spend tokens from a per-client token bucket (429 when empty),
+and every upstream OpenRouter call takes a slot from its model's concurrency limit. Calls beyond
+the limit wait in a bounded per-model queue; when that queue is full, or a call has waited
+ADMISSION_QUEUE_TIMEOUT, the call is shed and the request fails fast with 503 + Retry-After
+instead of piling up behind a rate-limited model.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, Optional
+
+from app.metrics import ADMISSION_REJECTED, ADMISSION_WAIT
+from app.settings import settings
+from app.timing import record_span
+
+# Set while background work (image jobs) calls upstream: it waits for a slot instead of being shed
+_background: ContextVar[bool] = ContextVar("admission_background", default=False)
+
+
+class AdmissionError(Exception):
+    """
+    A request or upstream call refused by admission control
+    """
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Retry-After": str(max(1, int(self.retry_after + 0.999)))}
+
+
+class RateLimitedError(AdmissionError):
+    """
+    The client's token bucket is empty
+    """
+    status_code = 429
+
+
+class OverloadedError(AdmissionError):
+    """
+    A model's wait queue is full, or the call waited longer than ADMISSION_QUEUE_TIMEOUT
+    """
+    def __init__(self, model: str, reason: str, retry_after: float):
+        super().__init__(f"Model {model} is overloaded ({reason.replace('_', ' ')}), retry later", retry_after)
+        self.model = model
+        self.reason = reason
+
+
+def parse_model_limits(spec: str) -> Dict[str, int]:
+    """
+    "deepseek/deepseek-r1-0528:free=2,openai/dall-e-3=4" -> {model: limit}
+    """
+    limits: Dict[str, int] = {}
+    for item in spec.split(","):
+        model, _, limit = item.strip().rpartition("=")
+        if model.strip() and limit.strip():
+            limits[model.strip()] = int(limit)
+    return limits
+
+
+class TokenBucket:
+    """
+    `rate` tokens per second, holding at most `burst`
+    """
+    def __init__(self, burst: float):
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float, rate: float, burst: float) -> float:
+        """
+        Spend `cost` tokens; returns 0 on success, else the seconds until they would be available
+        """
+        now = time.monotonic()
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / rate
+
+
+class ClientLimiter:
+    """
+    Token buckets for the most recently seen ADMISSION_MAX_CLIENTS clients (a forgotten client starts full)
+    """
+    def __init__(self, max_clients: int):
+        self.max_clients = max_clients
+        self.buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.admitted = 0
+        self.rejected = 0
+
+    def check(self, client: str, cost: float = 1.0) -> None:
+        rate, burst = settings.admission_client_rate, settings.admission_client_burst
+        if rate <= 0:
+            return
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            bucket = self.buckets[client] = TokenBucket(burst)
+            while len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+        self.buckets.move_to_end(client)
+        # A batch larger than the burst could never be admitted; it empties the bucket instead
+        wait = bucket.take(min(cost, burst), rate, burst)
+        if wait:
+            self.rejected += 1
+            ADMISSION_REJECTED.inc(reason="rate_limited", model="")
+            raise RateLimitedError(f"Rate limit exceeded ({rate:g} requests/s, burst {burst:g})", wait)
+        self.admitted += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "rate": settings.admission_client_rate,
+            "burst": settings.admission_client_burst,
+            "clients": len(self.buckets),
+            "admitted": self.admitted,
+            "rejected": self.rejected
+        }
+
+
+class ModelLimiter:
+    """
+    Concurrency limit for one model with a FIFO queue of waiting calls. A released slot is handed
+    directly to the next waiter, so `in_flight` never exceeds `limit` and late arrivals cannot
+    overtake the queue. `limit` may be changed at runtime with set_limit().
+    """
+    def __init__(self, model: str, limit: int):
+        self.model = model
+        self.limit = max(1, limit)
+        # The configured limit; set_limit() may lower `limit` below it while the model is rate limited
+        self.ceiling = self.limit
+        self.in_flight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.waiters)
+
+    async def acquire(self, background: bool = False) -> float:
+        """
+        Take a slot, waiting in the queue if the model is at its limit; returns the seconds waited.
+        Raises OverloadedError when the queue is full or the wait times out (never for background work).
+        """
+        if self.in_flight < self.limit and not self.queue_depth:
+            self.in_flight += 1
+            self.admitted += 1
+            return 0.0
+        if not background and self.queue_depth >= settings.admission_queue_size:
+            self.shed += 1
+            ADMISSION_REJECTED.inc(reason="queue_full", model=self.model)
+            raise OverloadedError(self.model, "queue_full", settings.admission_retry_after)
+
+        started = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self.queued += 1
+        try:
+            if background or settings.admission_queue_timeout <= 0:
+                await waiter
+            else:
+                await asyncio.wait_for(waiter, settings.admission_queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ended: pass it on
+                self.release()
+            elif waiter in self.waiters:
+                self.waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                ADMISSION_REJECTED.inc(reason="queue_timeout", model=self.model)
+                raise OverloadedError(self.model, "queue_timeout", settings.admission_retry_after)
+            raise
+        waited = time.perf_counter() - started
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def set_limit(self, limit: int) -> None:
+        self.limit = max(1, limit)
+        self._wake()
+
+    def _wake(self) -> None:
+        while self.waiters and self.in_flight < self.limit:
+            waiter = self.waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+            "avg_wait_ms": round(self.total_wait / self.queued * 1000, 2) if self.queued else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2)
+        }
+
+
+class AdmissionController:
+    """
+    Per-client buckets and per-model limiters (created on first use)
+    """
+    def __init__(self):
+        self.clients = ClientLimiter(settings.admission_max_clients)
+        self.models: Dict[str, ModelLimiter] = {}
+        self.model_limits = parse_model_limits(settings.admission_model_limits)
+
+    def model(self, model: str) -> ModelLimiter:
+        limiter = self.models.get(model)
+        if limiter is None:
+            limit = self.model_limits.get(model, settings.admission_model_concurrency)
+            limiter = self.models[model] = ModelLimiter(model, limit)
+        return limiter
+
+    def check_client(self, client: str, cost: float = 1.0) -> None:
+        """
+        Charge a client for `cost` requests; raises RateLimitedError when its bucket is empty
+        """
+        if settings.admission_enabled:
+            self.clients.check(client, cost)
+
+    @asynccontextmanager
+    async def slot(self, model: str) -> AsyncIterator[None]:
+        """
+        Hold one of `model`'s concurrency slots for the duration of an upstream call
+        """
+        if not settings.admission_enabled or settings.admission_model_concurrency <= 0:
+            yield
+            return
+        limiter = self.model(model)
+        waited = await limiter.acquire(background=_background.get())
+        ADMISSION_WAIT.observe(waited, model=model)
+        if waited:
+            record_span("admission_wait", waited, model)
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.admission_enabled,
+            "clients": self.clients.snapshot(),
+            "queue_size": settings.admission_queue_size,
+            "queue_timeout": settings.admission_queue_timeout,
+            "queue_depth": sum(limiter.queue_depth for limiter in self.models.values()),
+            "models": {model: limiter.snapshot() for model, limiter in self.models.items()}
+        }
+
+
+admission = AdmissionController()
+
+
+@contextmanager
+def background() -> Iterator[None]:
+    """
+    Mark upstream calls made inside the block (and tasks it starts) as background work that queues without limit
+    """
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+def client_key(client_header: Optional[str], client_host: Optional[str]) -> str:
+    """
+    Identify the client by ADMISSION_CLIENT_HEADER when configured and sent, else by its address
+    """
+    if settings.admission_client_header and client_header:
+        return f"id:{client_header}"
+    return f"ip:{client_host or 'unknown'}"
+
+
+def get_admission_stats() -> Dict[str, Any]:
+    """
+    Get client rate limiting counters and per-model concurrency, queue depth and wait times
+    """
+    return admission.snapshot()
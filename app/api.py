@@ -1,50 +1,399 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
-from app.models import QATask, LatestAnswerTask, ImageGenerationTask, ContentGenerationTask, TaskResponse
-from app.services.qa_service import perform_qa, get_latest_answer
-from app.services.image_service import generate_image
-from app.services.content_service import generate_content
-from app.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Body, Request, Header
+from fastapi.responses import StreamingResponse, Response
+from app.models import (
+    QATask, LatestAnswerTask, ImageGenerationTask, ContentGenerationTask, TaskResponse,
+    AITask, BatchTaskRequest, BatchItemResult, BatchTaskResponse, ProfileRequest
+)
+from app.services.qa_service import perform_qa, stream_qa
+from app.services.image_service import generate_image, image_media_type, IMAGE_ROUTE
+from app.services.content_service import generate_content, generate_multi_content, stream_content
+from app.database import get_db, SessionLocal, deferred_records, save_records
 from app.model_utils import get_available_models, get_model_status, get_popular_models, validate_model_config
+from app.model_router import get_routing_snapshot
+from app.openrouter_client import get_pool_stats
+from app.hedging import get_hedging_stats
+from app.cache import get_cache_stats
+from app.blob_store import blob_store, is_digest
+from app.image_variants import variant_digest
+from app.coalescing import single_flight, task_key, get_coalescing_stats
+from app.history_writer import get_history_writer_stats
+from app.retrieval import get_retrieval_stats
+from app.latest_answer import latest_answer
+from app.image_jobs import image_jobs, QueueFullError, get_image_job_stats
+from app.admission import admission, client_key, AdmissionError, get_admission_stats
+from app.rate_limits import get_rate_limit_stats
+from app.key_pool import key_pool, get_key_pool_stats
+from app.metrics import track_task
+from app.profiler import ProfiledRoute, profiler
+from app.responses import FastJSONResponse, task_response, dumps
+from app.settings import settings
 from sqlalchemy.orm import Session
-from typing import Union
+from starlette.concurrency import run_in_threadpool
+from typing import AsyncIterator, Literal, Optional, Tuple, Union
+import asyncio
+import json
+import re
+import secrets
 
-router = APIRouter(prefix="/ai-task")
+router = APIRouter(prefix="/ai-task", route_class=ProfiledRoute)
 
 @router.post("/", response_model=TaskResponse)
 async def handle_ai_task(
+    request: Request,
     task_data: Union[QATask, LatestAnswerTask, ImageGenerationTask, ContentGenerationTask] = Body(..., discriminator="task"),
     db: Session = Depends(get_db)
 ):
     """
     Handle various AI tasks based on the task field
     """
+    with track_task(task_data.task):
+        admit(request)
+        
+        if wants_stream(task_data, request):
+            return stream_task(task_data)
+        
+        if isinstance(task_data, LatestAnswerTask):
+            return await latest_answer_response(request)
+        
+        if isinstance(task_data, ImageGenerationTask) and wants_job(task_data, request):
+            job = await submit_image_job(task_data)
+            return task_response(
+                TaskResponse(task="image_generation", result=job), status_code=202, headers={"Location": job["status_url"]}
+            )
+        
+        if isinstance(task_data, ImageGenerationTask) and wants_image_bytes(task_data, request):
+            task_data = task_data.model_copy(update={"response_format": "binary"})
+            return await image_bytes_response(await execute_task(task_data, db))
+        
+        # Already a validated TaskResponse: skip FastAPI's response_model re-validation and jsonable_encoder
+        return task_response(await execute_task(task_data, db))
+
+@router.get("/latest-answer", response_model=TaskResponse)
+async def get_latest_answer_task(request: Request):
+    """
+    Latest answer for pollers: send the returned ETag back in If-None-Match to get a 304 while it is unchanged
+    """
+    return await latest_answer_response(request)
+
+def admit(request: Request, cost: int = 1) -> None:
+    """
+    Charge the client's token bucket for `cost` tasks, answering 429 with Retry-After when it is empty
+    """
+    header = request.headers.get(settings.admission_client_header) if settings.admission_client_header else None
+    try:
+        admission.check_client(client_key(header, request.client.host if request.client else None), cost)
+    except AdmissionError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=e.headers)
+
+async def latest_answer_response(request: Request) -> Response:
+    answer, etag = await latest_answer.current()
+    if not answer:
+        raise HTTPException(status_code=404, detail="No previous answers found")
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return task_response(TaskResponse(task="latest_answer", result=answer), headers=headers)
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    If-None-Match comparison (weak, as for GET): `*` or any listed tag equal to `etag`, ignoring W/ prefixes
+    """
+    if not if_none_match:
+        return False
+    tag = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if (candidate[2:] if candidate.startswith("W/") else candidate) == tag:
+            return True
+    return False
+
+def wants_job(task_data: ImageGenerationTask, request: Request) -> bool:
+    """
+    Image generation runs as a background job when asked via `job` or `Prefer: respond-async`
+    """
+    return task_data.job or "respond-async" in request.headers.get("prefer", "")
+
+async def submit_image_job(task_data: ImageGenerationTask) -> dict:
+    try:
+        return await image_jobs.submit(task_data.prompt, task_data.priority, task_data.webhook_url)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@router.get("/jobs/{job_id}")
+async def get_image_job(job_id: str):
+    """
+    Status of an image job; `result` is the image URL once it has succeeded
+    """
+    job = await image_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def wants_image_bytes(task_data: ImageGenerationTask, request: Request) -> bool:
+    """
+    Image generation returns the raw image instead of JSON when asked via `response_format` or an image Accept header
+    """
+    return task_data.response_format == "binary" or request.headers.get("accept", "").startswith("image/")
+
+async def image_bytes_response(response: TaskResponse) -> Response:
+    """
+    The stored image bytes for an image task result (no base64 inflation); errors stay JSON
+    """
+    url = response.result
+    digest = url[len(IMAGE_ROUTE) + 1:] if isinstance(url, str) and url.startswith(IMAGE_ROUTE + "/") else ""
+    data = await run_in_threadpool(blob_store.get, digest) if is_digest(digest) else None
+    if data is None:
+        return task_response(response)
+    return Response(
+        data,
+        media_type=image_media_type(data[:16]),
+        headers={"ETag": f'"{digest}"', "Content-Location": url, "Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
+async def execute_task(task_data: AITask, db: Session) -> TaskResponse:
+    """
+    Run a task, sharing the execution with identical in-flight tasks when coalescing is enabled.
+    Raises a 503 HTTPException with Retry-After when the task's models are overloaded.
+    """
+    try:
+        # Callers opting out of the cache want a fresh sample of their own, not a shared one
+        if not settings.coalesce_requests or getattr(task_data, "cache", True) is False:
+            return await run_task(task_data, db)
+        
+        # Identical concurrent requests share a single execution (and a single upstream call and DB row)
+        return await single_flight.do(task_data.task, task_key(task_data), lambda: run_shared_task(task_data))
+    except AdmissionError as e:
+        # Every model was shed by admission control: tell the client when to retry
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=e.headers)
+
+async def run_shared_task(task_data: AITask) -> TaskResponse:
+    """
+    Run a coalesced task with its own session: the execution can outlive the leader request's session
+    """
+    db = SessionLocal()
+    try:
+        return await run_task(task_data, db)
+    finally:
+        db.close()
+
+async def run_task(
+    task_data: Union[QATask, LatestAnswerTask, ImageGenerationTask, ContentGenerationTask],
+    db: Session
+) -> TaskResponse:
+    """
+    Execute a single validated task
+    """
     task_type = task_data.task
     
     if task_type == "qa" and isinstance(task_data, QATask):
         # task_data is validated as QATask
-        answer = perform_qa(task_data.question, task_data.context, db)
-        return TaskResponse(task="qa", result=answer)
+        metadata = {}
+        answer = await perform_qa(task_data.question, task_data.context, db, use_cache=task_data.cache, metadata=metadata)
+        return TaskResponse(task="qa", result=answer, metadata=metadata or None)
     
     elif task_type == "latest_answer" and isinstance(task_data, LatestAnswerTask):
         # task_data is validated as LatestAnswerTask
-        latest_answer = get_latest_answer(db)
-        if not latest_answer:
+        answer, _ = await latest_answer.current()
+        if not answer:
             raise HTTPException(status_code=404, detail="No previous answers found")
-        return TaskResponse(task="latest_answer", result=latest_answer)
+        return TaskResponse(task="latest_answer", result=answer)
     
     elif task_type == "image_generation" and isinstance(task_data, ImageGenerationTask):
         # task_data is validated as ImageGenerationTask
-        image_data = generate_image(task_data.prompt, db)
+        if task_data.job:
+            return TaskResponse(task="image_generation", result=await submit_image_job(task_data))
+        image_data = await generate_image(
+            task_data.prompt, db, response_format=task_data.response_format,
+            variant=task_data.variant, image_format=task_data.image_format
+        )
         return TaskResponse(task="image_generation", result=image_data)
     
     elif task_type == "content_generation" and isinstance(task_data, ContentGenerationTask):
         # task_data is validated as ContentGenerationTask
-        content = generate_content(task_data.prompt, task_data.platform, db)
+        if task_data.platforms:
+            variations = await generate_multi_content(task_data.prompt, task_data.platforms, db, use_cache=task_data.cache)
+            return TaskResponse(task="content_generation", result=variations)
+        content = await generate_content(task_data.prompt, task_data.platform, db, use_cache=task_data.cache)
         return TaskResponse(task="content_generation", result=content)
     
     else:
         raise HTTPException(status_code=400, detail=f"Unknown task type: {task_type}")
 
+def wants_stream(task_data: Union[QATask, LatestAnswerTask, ImageGenerationTask, ContentGenerationTask], request: Request) -> bool:
+    """
+    QA and single-platform content generation stream when asked via the `stream` flag or an SSE Accept header
+    """
+    if not isinstance(task_data, (QATask, ContentGenerationTask)):
+        return False
+    if isinstance(task_data, ContentGenerationTask) and task_data.platforms:
+        return False
+    return task_data.stream or "text/event-stream" in request.headers.get("accept", "")
+
+def _sse(data: dict, event: str = "") -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def stream_task(task_data: Union[QATask, ContentGenerationTask]) -> StreamingResponse:
+    """
+    Stream a QA or content generation task as Server-Sent Events:
+    `data: {"token": ...}` per chunk, then `event: done` with the assembled result (and metadata, if any)
+    """
+    async def events():
+        # The stream outlives the request-scoped session dependency, so it uses its own session
+        db = SessionLocal()
+        metadata = {}
+        try:
+            if isinstance(task_data, QATask):
+                tokens = stream_qa(task_data.question, task_data.context, db, use_cache=task_data.cache, metadata=metadata)
+            else:
+                tokens = stream_content(task_data.prompt, task_data.platform, db, use_cache=task_data.cache)
+            parts = []
+            async for token in tokens:
+                parts.append(token)
+                yield _sse({"token": token})
+            done = {"task": task_data.task, "result": "".join(parts)}
+            if metadata:
+                done["metadata"] = metadata
+            yield _sse(done, event="done")
+        except Exception as e:
+            yield _sse({"detail": str(e)}, event="error")
+        finally:
+            db.close()
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/batch", response_model=BatchTaskResponse)
+async def handle_batch_tasks(batch: BatchTaskRequest, request: Request, db: Session = Depends(get_db)):
+    """
+    Run many tasks concurrently (bounded by `concurrency`) and return per-item results and errors.
+    Results come back in input order, or as NDJSON lines in completion order when `stream` is set.
+    History records for the whole batch are committed in a single transaction.
+    """
+    if len(batch.tasks) > settings.batch_max_tasks:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds the maximum of {settings.batch_max_tasks} tasks")
+    # Each task in the batch counts against the client's rate limit
+    admit(request, cost=len(batch.tasks))
+    
+    concurrency = min(batch.concurrency or settings.batch_concurrency, settings.batch_max_concurrency)
+    
+    if batch.stream:
+        return StreamingResponse(stream_batch(batch.tasks, concurrency), media_type="application/x-ndjson")
+    
+    with deferred_records() as records:
+        results = await asyncio.gather(*run_batch(batch.tasks, concurrency, db))
+    await save_records(db, records)
+    return FastJSONResponse({"results": [result.model_dump() for result in results]})
+
+def run_batch(tasks: list, concurrency: int, db: Session) -> list:
+    """
+    One awaitable per task, each waiting on a shared semaphore and capturing its own error
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def run_item(index: int, task_data: AITask) -> BatchItemResult:
+        async with semaphore:
+            try:
+                response = await execute_task(task_data, db)
+                return BatchItemResult(index=index, task=task_data.task, result=response.result, metadata=response.metadata)
+            except HTTPException as e:
+                return BatchItemResult(index=index, task=task_data.task, status_code=e.status_code, error=str(e.detail))
+            except Exception as e:
+                return BatchItemResult(index=index, task=task_data.task, status_code=500, error=str(e))
+    
+    return [run_item(index, task_data) for index, task_data in enumerate(tasks)]
+
+async def stream_batch(tasks: list, concurrency: int) -> AsyncIterator[bytes]:
+    """
+    Yield one JSON line per item as it finishes, then commit the batch's history records
+    """
+    # The stream outlives the request-scoped session dependency, so it uses its own session
+    db = SessionLocal()
+    try:
+        with deferred_records() as records:
+            for item in asyncio.as_completed(run_batch(tasks, concurrency, db)):
+                result = await item
+                yield dumps(result.model_dump()) + b"\n"
+        await save_records(db, records)
+    finally:
+        db.close()
+
+@router.get("/images/{digest}")
+async def get_image(
+    digest: str,
+    request: Request,
+    variant: str = "original",
+    format: Optional[Literal["webp", "jpeg", "png"]] = None
+):
+    """
+    Serve a stored image by content digest, with ETag revalidation and single-range requests.
+    `variant` (e.g. thumbnail) and `format` select a rendition, rendered on first use.
+    """
+    if not is_digest(digest):
+        raise HTTPException(status_code=404, detail="Image not found")
+    if variant != "original" or format:
+        try:
+            digest = await variant_digest(digest, variant.lower(), format)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except LookupError:
+            raise HTTPException(status_code=404, detail="Image not found")
+    size = await run_in_threadpool(blob_store.size, digest)
+    if size is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    # Content-addressed blobs never change, so the digest is a strong ETag
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": "public, max-age=31536000, immutable"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    media_type = image_media_type(await run_in_threadpool(blob_store.head, digest))
+    byte_range = _parse_range(request.headers.get("range"), size)
+    if byte_range is None:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+    
+    start, end = byte_range
+    status_code = 200
+    if (start, end) != (0, size - 1):
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    # A sync iterator: Starlette reads each chunk in the threadpool
+    return StreamingResponse(
+        blob_store.read_range(digest, start, end), status_code=status_code, media_type=media_type, headers=headers
+    )
+
+_BYTE_RANGE = re.compile(r"^bytes=\s*(\d*)-(\d*)\s*$")
+
+def _parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end) inclusive for a `bytes=` Range header; the whole blob when absent, malformed or not a
+    single byte range (a server ignores a Range it cannot parse), None when unsatisfiable
+    """
+    match = _BYTE_RANGE.match(header or "")
+    if match is None or match.group(1) == match.group(2) == "":
+        return 0, size - 1
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes (the last 0 bytes are unsatisfiable)
+        start, end = max(0, size - int(last)), size - 1
+        return (start, end) if int(last) and size else None
+    start = int(first)
+    if last and int(last) < start:
+        return 0, size - 1
+    if start >= size:
+        return None
+    return start, min(int(last), size - 1) if last else size - 1
+
 @router.get("/models/info")
 async def get_models_info():
     """
@@ -66,9 +415,149 @@ async def get_popular_models_list():
     """
     return get_popular_models()
 
+@router.get("/models/pool")
+async def get_models_pool():
+    """
+    Get the routing policy and each pooled model's weight, tier, latency, load and eligibility
+    """
+    return get_routing_snapshot()
+
 @router.get("/models/validate")
 async def validate_models_config():
     """
     Validate current model configuration
     """
-    return validate_model_config()
\ No newline at end of file
+    return validate_model_config()
+
+@router.get("/stats/pool")
+async def get_openrouter_pool_stats():
+    """
+    Get OpenRouter connection pool usage (active/idle connections, connection wait time)
+    """
+    return get_pool_stats()
+
+@router.get("/stats/hedging")
+async def get_fallback_hedging_stats():
+    """
+    Get the hedging policy and which model won each call per task type
+    """
+    return get_hedging_stats()
+
+@router.get("/stats/cache")
+async def get_response_cache_stats():
+    """
+    Get response cache size and hit/miss/eviction counters
+    """
+    return await run_in_threadpool(get_cache_stats)
+
+@router.get("/stats/coalescing")
+async def get_request_coalescing_stats():
+    """
+    Get how many identical in-flight tasks were collapsed onto a shared execution
+    """
+    return get_coalescing_stats()
+
+@router.get("/stats/history")
+async def get_history_write_stats():
+    """
+    Get write-behind history queue depth and flush latency
+    """
+    return get_history_writer_stats()
+
+@router.get("/stats/jobs")
+async def get_image_job_queue_stats():
+    """
+    Get image job queue depth, wait and run times, and webhook deliveries
+    """
+    return get_image_job_stats()
+
+@router.get("/stats/admission")
+async def get_admission_control_stats():
+    """
+    Get client rate limiting counters and per-model concurrency, queue depth and shed calls
+    """
+    return get_admission_stats()
+
+@router.get("/stats/rate-limits")
+async def get_upstream_rate_limit_stats():
+    """
+    Get per-model AIMD concurrency limits and OpenRouter 429 retry counters
+    """
+    return get_rate_limit_stats()
+
+@router.get("/stats/keys")
+async def get_api_key_pool_stats():
+    """
+    Get per-key usage, error counters and quarantine state, identified by fingerprint
+    """
+    return get_key_pool_stats()
+
+@router.get("/stats/retrieval")
+async def get_context_retrieval_stats():
+    """
+    Get QA context retrieval settings and passage index cache hits
+    """
+    return get_retrieval_stats()
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """
+    Admin endpoints need X-Admin-Token to match ADMIN_TOKEN; they do not exist while ADMIN_TOKEN is unset
+    """
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@router.post("/admin/keys/reload", dependencies=[Depends(require_admin)])
+async def reload_api_keys():
+    """
+    Re-read OPENROUTER_API_KEYS_FILE now instead of waiting for the change to be noticed
+    """
+    await run_in_threadpool(key_pool.load)
+    key_pool.reloads += 1
+    return get_key_pool_stats()
+
+@router.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def start_profile(profile_request: ProfileRequest):
+    """
+    Profile the next N matching /ai-task/ requests and/or a time window
+    """
+    try:
+        return profiler.start(
+            profile_request.mode, profile_request.task, profile_request.requests,
+            profile_request.seconds, profile_request.interval_ms
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def get_profile_status():
+    """
+    Get the running profiling session and a summary of the last finished one
+    """
+    return profiler.status()
+
+@router.delete("/admin/profile", dependencies=[Depends(require_admin)])
+async def stop_profile():
+    """
+    Stop the running profiling session early and keep what it captured
+    """
+    summary = profiler.stop()
+    if summary is None:
+        raise HTTPException(status_code=404, detail="No profiling session is running")
+    return summary
+
+@router.get("/admin/profile/result", dependencies=[Depends(require_admin)])
+async def download_profile():
+    """
+    Download the last result: collapsed stacks (for flamegraph.pl / speedscope) or a pstats file
+    """
+    profiler.status()
+    if profiler.result is None:
+        raise HTTPException(status_code=404, detail="No finished profiling session")
+    result = profiler.result
+    return Response(
+        result["body"],
+        media_type=result["media_type"],
+        headers={"Content-Disposition": f'attachment; filename="{result["filename"]}"'}
+    )
@@ -0,0 +1,129 @@
+"""
+Content-addressed blob store for AI Task API
+Generated images are stored once as raw bytes keyed by their SHA-256 digest; the database keeps
+only the digest. Backends are pluggable; the local filesystem backend is the default.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from typing import Iterator, Optional
+
+from app.settings import settings
+
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_digest(value: str) -> bool:
+    return bool(DIGEST_PATTERN.match(value or ""))
+
+
+def blob_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore(ABC):
+    """
+    Interface every blob store backend implements. All methods are blocking and meant to run in the threadpool.
+    A backend missing put, size or read_range cannot be instantiated.
+    """
+    @abstractmethod
+    def put(self, data: bytes) -> str:
+        """
+        Store the bytes (a no-op if identical content is already stored) and return their digest
+        """
+        ...
+
+    @abstractmethod
+    def size(self, digest: str) -> Optional[int]:
+        """
+        Size in bytes of a stored blob, None if it does not exist
+        """
+        ...
+
+    @abstractmethod
+    def read_range(self, digest: str, start: int, end: int, chunk_size: int = 65536) -> Iterator[bytes]:
+        """
+        Yield the bytes from `start` to `end` inclusive in chunks
+        """
+        ...
+
+    def head(self, digest: str, length: int = 16) -> bytes:
+        return b"".join(self.read_range(digest, 0, length - 1))
+
+    def get(self, digest: str) -> Optional[bytes]:
+        """
+        Whole blob, None if it does not exist
+        """
+        size = self.size(digest)
+        if size is None:
+            return None
+        return b"".join(self.read_range(digest, 0, size - 1))
+
+
+class LocalBlobStore(BlobStore):
+    """
+    Blobs as files under `root`, fanned out by digest prefix (ab/cd/abcd...)
+    """
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, digest: str) -> str:
+        if not is_digest(digest):
+            raise ValueError(f"Invalid blob digest: {digest}")
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def put(self, data: bytes) -> str:
+        digest = blob_digest(data)
+        path = self.path(digest)
+        if os.path.exists(path):
+            return digest
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file and rename so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest
+
+    def size(self, digest: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self.path(digest))
+        except (OSError, ValueError):
+            return None
+
+    def get(self, digest: str) -> Optional[bytes]:
+        try:
+            with open(self.path(digest), "rb") as blob:
+                return blob.read()
+        except (OSError, ValueError):
+            return None
+
+    def read_range(self, digest: str, start: int, end: int, chunk_size: int = 65536) -> Iterator[bytes]:
+        with open(self.path(digest), "rb") as blob:
+            blob.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = blob.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+def create_blob_store(backend_name: str) -> BlobStore:
+    if backend_name == "local":
+        return LocalBlobStore(settings.blob_store_path)
+    raise ValueError(f"Unknown blob store backend: {backend_name}")
+
+
+blob_store = create_blob_store(settings.blob_store_backend.lower())
@@ -0,0 +1,241 @@
+"""
+Response cache for AI Task API
+Caches model answers for QA and content generation, keyed on the model parameters and the
+normalized request. Backends are pluggable: an in-process LRU and a SQLite file that survives restarts.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.settings import settings
+from app.timing import span
+
+
+class CacheStats:
+    """
+    Hit/miss/eviction counters shared by every backend
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "sets": self.sets,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+class MemoryCacheBackend:
+    """
+    In-process LRU cache bounded by entry count and total value size
+    """
+    blocking = False
+
+    def __init__(self, stats: CacheStats, max_entries: int, max_bytes: int):
+        self.stats = stats
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            self._remove(key)
+            self.stats.expirations += 1
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (time.time() + ttl, value)
+        self.size_bytes += len(value)
+        while self.entries and (
+            len(self.entries) > self.max_entries or (self.max_bytes and self.size_bytes > self.max_bytes)
+        ):
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.stats.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, value = self.entries.pop(key)
+        self.size_bytes -= len(value)
+
+    def info(self) -> Dict[str, Any]:
+        return {"backend": "memory", "entries": len(self.entries), "size_bytes": self.size_bytes}
+
+
+class SQLiteCacheBackend:
+    """
+    SQLite-backed LRU cache that survives restarts (kept separate from the history database)
+    """
+    blocking = True
+
+    def __init__(self, stats: CacheStats, path: str, max_entries: int, max_bytes: int):
+        self.stats = stats
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_last_access ON response_cache (last_access)")
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self.conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                self.stats.expirations += 1
+                return None
+            self.conn.execute("UPDATE response_cache SET last_access = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now + ttl, now)
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        count, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM response_cache").fetchone()
+        while count > self.max_entries or (self.max_bytes and size > self.max_bytes and count > 1):
+            row = self.conn.execute("SELECT key, size FROM response_cache ORDER BY last_access LIMIT 1").fetchone()
+            if row is None:
+                break
+            self.conn.execute("DELETE FROM response_cache WHERE key = ?", (row[0],))
+            self.stats.evictions += 1
+            count -= 1
+            size -= row[1]
+
+    def info(self) -> Dict[str, Any]:
+        with self.lock:
+            count, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM response_cache").fetchone()
+        return {"backend": "sqlite", "path": self.path, "entries": count, "size_bytes": size}
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """
+    Collapse whitespace and case so trivially different repeats share a cache entry
+    """
+    return " ".join((text or "").split()).lower()
+
+
+class ResponseCache:
+    """
+    Front for the configured backend; blocking backends run in the threadpool
+    """
+    def __init__(self, backend_name: str):
+        self.stats = CacheStats()
+        self.ttl = settings.cache_ttl_seconds
+        self.backend = None
+        if backend_name == "memory":
+            self.backend = MemoryCacheBackend(self.stats, settings.cache_max_entries, settings.cache_max_bytes)
+        elif backend_name == "sqlite":
+            self.backend = SQLiteCacheBackend(
+                self.stats, settings.cache_sqlite_path, settings.cache_max_entries, settings.cache_max_bytes
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    @staticmethod
+    def make_key(kind: str, model: str, temperature: float, max_tokens: int, text: str, context: Optional[str] = None, **extra: Any) -> str:
+        """
+        Build a cache key from the model parameters, the normalized prompt/question and a hash of the context
+        """
+        context_hash = hashlib.sha256(normalize_text(context).encode()).hexdigest() if context else ""
+        material = json.dumps(
+            [kind, model, temperature, max_tokens, normalize_text(text), context_hash, sorted(extra.items())],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        if self.backend is None:
+            return None
+        with span("cache"):
+            if self.backend.blocking:
+                value = await run_in_threadpool(self.backend.get, key)
+            else:
+                value = self.backend.get(key)
+        if value is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return value
+
+    async def set(self, key: str, value: str) -> None:
+        if self.backend is None:
+            return
+        self.stats.sets += 1
+        with span("cache"):
+            if self.backend.blocking:
+                await run_in_threadpool(self.backend.set, key, value, self.ttl)
+            else:
+                self.backend.set(key, value, self.ttl)
+
+    def info(self) -> Dict[str, Any]:
+        if self.backend is None:
+            return {"backend": "none", **self.stats.snapshot()}
+        return {
+            **self.backend.info(),
+            "ttl_seconds": self.ttl,
+            "max_entries": settings.cache_max_entries,
+            "max_bytes": settings.cache_max_bytes,
+            **self.stats.snapshot()
+        }
+
+
+response_cache = ResponseCache(settings.cache_backend.lower())
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """
+    Get response cache configuration, size and hit/miss/eviction counters
+    """
+    return response_cache.info()
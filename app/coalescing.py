@@ -0,0 +1,77 @@
+"""
+Request coalescing (single-flight) for AI Task API
+Concurrent identical tasks share one in-flight execution: the first request runs the task and
+every identical request that arrives before it finishes awaits the same result.
+"""
+
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict
+
+from pydantic import BaseModel
+
+
+class SingleFlight:
+    """
+    Tracks in-flight executions by key and how many callers were collapsed onto them
+    """
+    def __init__(self):
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def _stats(self, kind: str) -> Dict[str, int]:
+        if kind not in self.stats:
+            self.stats[kind] = {"executions": 0, "collapsed": 0}
+        return self.stats[kind]
+
+    async def do(self, kind: str, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `fn` once per key at a time; identical concurrent callers receive the same result (or exception)
+        """
+        future = self.in_flight.get(key)
+        if future is not None:
+            self._stats(kind)["collapsed"] += 1
+            return await asyncio.shield(future)
+
+        self._stats(kind)["executions"] += 1
+        future = asyncio.ensure_future(fn())
+        self.in_flight[key] = future
+
+        def _done(finished: asyncio.Future) -> None:
+            if self.in_flight.get(key) is finished:
+                del self.in_flight[key]
+            # Retrieve the exception so an execution whose callers all went away is not reported as unhandled
+            if not finished.cancelled():
+                finished.exception()
+
+        future.add_done_callback(_done)
+        # Shield so a disconnecting leader does not cancel the execution shared with the followers
+        return await asyncio.shield(future)
+
+    def snapshot(self) -> Dict[str, Any]:
+        executions = sum(stats["executions"] for stats in self.stats.values())
+        collapsed = sum(stats["collapsed"] for stats in self.stats.values())
+        return {
+            "in_flight": len(self.in_flight),
+            "executions": executions,
+            "collapsed": collapsed,
+            "collapse_rate": round(collapsed / (executions + collapsed), 3) if executions + collapsed else 0.0,
+            "tasks": self.stats
+        }
+
+
+single_flight = SingleFlight()
+
+
+def task_key(task_data: BaseModel) -> str:
+    """
+    Identity of a task request: every validated field, in a stable order
+    """
+    return json.dumps(task_data.model_dump(), sort_keys=True, ensure_ascii=False)
+
+
+def get_coalescing_stats() -> Dict[str, Any]:
+    """
+    Get how many identical in-flight tasks were collapsed onto a shared execution
+    """
+    return single_flight.snapshot()
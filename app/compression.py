@@ -0,0 +1,160 @@
+"""
+Negotiated response compression for AI Task API
+Compresses complete response bodies above a size threshold with the best encoding the client
+accepts: zstd and brotli when their packages are installed, gzip always. Streamed responses
+(SSE, NDJSON), images and already-encoded or partial responses pass through untouched.
+Bodies of at least COMPRESSION_OFFLOAD_SIZE bytes are compressed in the threadpool so a large
+response (a b64_json image) does not stall every other request on the event loop.
+"""
+
+import gzip
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.settings import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Never compressed: streams must flush per event, images are already compressed
+_SKIPPED_TYPES = ("text/event-stream", "application/x-ndjson", "image/")
+
+
+def _encoders() -> Dict[str, Callable[[bytes], bytes]]:
+    """
+    Available encoders, most preferred first
+    """
+    encoders: Dict[str, Callable[[bytes], bytes]] = {}
+    if zstandard is not None:
+        # A ZstdCompressor must not be shared between threads: one per thread
+        local = threading.local()
+
+        def zstd(data: bytes) -> bytes:
+            compressor = getattr(local, "compressor", None)
+            if compressor is None:
+                compressor = local.compressor = zstandard.ZstdCompressor(level=settings.compression_zstd_level)
+            return compressor.compress(data)
+
+        encoders["zstd"] = zstd
+    if brotli is not None:
+        encoders["br"] = lambda data: brotli.compress(data, quality=settings.compression_brotli_quality)
+    encoders["gzip"] = lambda data: gzip.compress(data, compresslevel=settings.compression_gzip_level)
+    return encoders
+
+
+ENCODERS = _encoders()
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick the encoding with the highest q-value in Accept-Encoding, preferring zstd > br > gzip on ties
+    """
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in ENCODERS:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing single-message response bodies of at least COMPRESSION_MIN_SIZE bytes
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.compression_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = scope.get("headers", [])
+        encoding = choose_encoding((_header(request_headers, b"accept-encoding") or b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                content_type = (_header(headers, b"content-type") or b"").decode("latin-1")
+                if (
+                    _header(headers, b"content-encoding") is not None
+                    or message["status"] in (204, 206, 304)
+                    or content_type.startswith(_SKIPPED_TYPES)
+                ):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Hold the headers until the body shows whether it is worth compressing
+                    start_message = message
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            if start_message is not None:
+                held, start_message = start_message, None
+                body = message.get("body", b"")
+                headers = [(k, v) for k, v in held.get("headers", []) if k.lower() != b"vary"]
+                vary = _header(held.get("headers", []), b"vary")
+                headers.append((b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"))
+
+                if message.get("more_body", False) or len(body) < settings.compression_min_size:
+                    # Streamed in several messages, or too small to be worth it
+                    passthrough = True
+                    await send({**held, "headers": headers})
+                    await send(message)
+                    return
+
+                if len(body) >= settings.compression_offload_size:
+                    compressed = await run_in_threadpool(ENCODERS[encoding], body)
+                else:
+                    compressed = ENCODERS[encoding](body)
+                headers = [(k, v) for k, v in headers if k.lower() != b"content-length"]
+                headers.append((b"content-encoding", encoding.encode()))
+                headers.append((b"content-length", str(len(compressed)).encode()))
+                await send({**held, "headers": headers})
+                await send({"type": "http.response.body", "body": compressed, "more_body": False})
+                return
+
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
@@ -1,12 +1,77 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
+from sqlalchemy import create_engine, event, Column, Index, Integer, String, Text, DateTime
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import StaticPool
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+from app.settings import settings
+from app.history_writer import history_writer
+from app.metrics import DB_WRITE_LATENCY, DB_RECORDS
+from app.timing import span
 import os
+import time
 
-DATABASE_URL = "sqlite:///./app/database/app.db"
+def _sqlite_path(url: str) -> Optional[str]:
+    """
+    Filesystem path of a file-backed SQLite URL, None for in-memory or non-SQLite databases
+    """
+    if not url.startswith("sqlite:///"):
+        return None
+    path = url[len("sqlite:///"):]
+    if not path or path == ":memory:":
+        return None
+    return path
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """
+    Tune every new SQLite connection: WAL so readers do not block on the writer, and larger caches
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+    cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout * 1000)}")
+    cursor.execute(f"PRAGMA mmap_size={settings.sqlite_mmap_size}")
+    # Negative cache_size is in KiB rather than pages
+    cursor.execute(f"PRAGMA cache_size=-{settings.sqlite_cache_size_kb}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def build_engine(url: str) -> Engine:
+    """
+    Create the engine for DATABASE_URL with a bounded connection pool (and pragmas for SQLite)
+    """
+    if not url.startswith("sqlite"):
+        return create_engine(
+            url,
+            pool_size=settings.database_pool_size,
+            max_overflow=settings.database_max_overflow,
+            pool_timeout=settings.database_pool_timeout,
+            pool_pre_ping=True
+        )
+    
+    path = _sqlite_path(url)
+    if path is None:
+        # One shared connection, otherwise every pooled connection would see its own empty in-memory database
+        return create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    sqlite_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": settings.sqlite_busy_timeout},
+        pool_size=settings.database_pool_size,
+        max_overflow=settings.database_max_overflow,
+        pool_timeout=settings.database_pool_timeout
+    )
+    event.listen(sqlite_engine, "connect", _apply_sqlite_pragmas)
+    return sqlite_engine
+
+engine = build_engine(settings.database_url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -18,18 +83,23 @@ class QAHistory(Base):
     question = Column(Text, nullable=False)
     answer = Column(Text, nullable=False)
     context = Column(Text)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)  # Latest-answer lookups
 
 class ImageRecord(Base):
     __tablename__ = "image_records"
     
     id = Column(Integer, primary_key=True, index=True)
     prompt = Column(Text, nullable=False)
-    image_data = Column(Text)  # Store base64 encoded image or URL
-    created_at = Column(DateTime, default=datetime.utcnow)
+    image_data = Column(Text)  # Legacy inline base64 image; new rows store the blob digest instead
+    blob_hash = Column(String(64), index=True)  # SHA-256 of the image bytes in the blob store
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
 class ContentRecord(Base):
     __tablename__ = "content_records"
+    __table_args__ = (
+        # Recent content per platform
+        Index("ix_content_records_platform_created_at", "platform", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     prompt = Column(Text, nullable=False)
@@ -37,12 +107,120 @@ class ContentRecord(Base):
     content = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+class ImageJob(Base):
+    __tablename__ = "image_jobs"
+    __table_args__ = (
+        # Restoring unfinished jobs in priority order at startup
+        Index("ix_image_jobs_status_priority_created_at", "status", "priority", "created_at"),
+    )
+    
+    id = Column(String(32), primary_key=True)
+    prompt = Column(Text, nullable=False)
+    priority = Column(Integer, nullable=False, default=0)  # Higher runs first
+    status = Column(String(16), nullable=False, default="queued")  # queued, running, succeeded, failed
+    webhook_url = Column(Text)
+    result = Column(Text)  # URL of the stored image
+    blob_hash = Column(String(64))
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+class ImageVariant(Base):
+    __tablename__ = "image_variants"
+    __table_args__ = (
+        Index("ix_image_variants_source_hash_spec", "source_hash", "spec", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    source_hash = Column(String(64), nullable=False)  # Digest of the generated image
+    spec = Column(String(64), nullable=False)  # variant:max edge:format:quality
+    blob_hash = Column(String(64), nullable=False)  # Digest of the rendered variant
+    width = Column(Integer)
+    height = Column(Integer)
+    size_bytes = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+def init_db(bind: Optional[Engine] = None) -> None:
+    """
+    Create missing tables and indexes. Runs at startup (and from `python -m app.migrations`), not at import.
+    """
+    bind = bind or engine
+    Base.metadata.create_all(bind=bind)
+    # create_all skips tables that already exist, so indexes added since are created here
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# When set (batch requests), history records are collected here and committed together
+_pending_records: ContextVar[Optional[List[Base]]] = ContextVar("pending_records", default=None)
+
+@contextmanager
+def deferred_records():
+    """
+    Collect history records saved within this context instead of committing each one
+    """
+    records: List[Base] = []
+    token = _pending_records.set(records)
+    try:
+        yield records
+    finally:
+        _pending_records.reset(token)
+
+async def save_record(db: Session, record: Base) -> None:
+    """
+    Persist a history record in a worker thread so the event loop is never blocked on SQLite
+    (or hand it to the write-behind queue when HISTORY_WRITE_BEHIND is enabled)
+    """
+    pending = _pending_records.get()
+    if pending is not None:
+        pending.append(record)
+        return
+    if history_writer.running:
+        with span("db_queue"):
+            await history_writer.enqueue(record)
+        return
+
+    def _commit():
+        started = time.perf_counter()
+        db.add(record)
+        db.commit()
+        db.refresh(record)
+        DB_WRITE_LATENCY.observe(time.perf_counter() - started, mode="direct")
+        DB_RECORDS.inc(mode="direct")
+
+    with span("db_commit"):
+        await run_in_threadpool(_commit)
+
+async def save_records(db: Session, records: List[Base]) -> None:
+    """
+    Persist many history records in a single transaction (or add them to the enclosing deferred batch)
+    """
+    if not records:
+        return
+    pending = _pending_records.get()
+    if pending is not None:
+        pending.extend(records)
+        return
+    if history_writer.running:
+        with span("db_queue"):
+            for record in records:
+                await history_writer.enqueue(record)
+        return
+
+    def _commit():
+        started = time.perf_counter()
+        db.add_all(records)
+        db.commit()
+        DB_WRITE_LATENCY.observe(time.perf_counter() - started, mode="batch")
+        DB_RECORDS.inc(len(records), mode="batch")
+
+    with span("db_commit"):
+        await run_in_threadpool(_commit)
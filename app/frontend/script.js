@@ -4,6 +4,7 @@ const API_ENDPOINT = '/ai-task/';
 const MODEL_INFO_ENDPOINT = '/ai-task/models/info';
 const MODEL_STATUS_ENDPOINT = '/ai-task/models/status';
 const MODEL_VALIDATE_ENDPOINT = '/ai-task/models/validate';
+const STREAMING_TASKS = ['qa', 'content_generation'];
 
 // DOM Elements
 const chatMessages = document.getElementById('chatMessages');
@@ -210,6 +211,12 @@ async function sendMessage() {
                 break;
         }
 
+        // Q&A and content generation stream tokens as they are generated
+        if (STREAMING_TASKS.includes(selectedTask)) {
+            await streamMessage(payload, selectedTask, loadingElement);
+            return;
+        }
+
         // Send request to API
         const response = await fetch(`${API_BASE_URL}${API_ENDPOINT}`, {
             method: 'POST',
@@ -245,6 +252,72 @@ async function sendMessage() {
     }
 }
 
+// Stream a task over Server-Sent Events, rendering tokens as they arrive
+async function streamMessage(payload, selectedTask, loadingElement) {
+    const response = await fetch(`${API_BASE_URL}${API_ENDPOINT}`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+        },
+        body: JSON.stringify({ ...payload, stream: true }),
+    });
+
+    if (!response.ok || !response.body) {
+        const errorData = await response.json().catch(() => ({}));
+        throw new Error(errorData.detail || `API Error: ${response.status}`);
+    }
+
+    // Replace the loading indicator with a message that fills in as tokens arrive
+    loadingElement.remove();
+    const streamingElement = addLoadingIndicator();
+    const textElement = document.createElement('div');
+    textElement.className = 'text-content streaming';
+    streamingElement.querySelector('.loading-dots').replaceWith(textElement);
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let streamedText = '';
+    let finalResult = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // SSE events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let eventName = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (!data) continue;
+
+            const parsed = JSON.parse(data);
+            if (eventName === 'error') {
+                throw new Error(parsed.detail || 'Streaming failed');
+            } else if (eventName === 'done') {
+                finalResult = parsed.result;
+            } else if (parsed.token) {
+                streamedText += parsed.token;
+                textElement.textContent = streamedText;
+                chatMessages.scrollTop = chatMessages.scrollHeight;
+            }
+        }
+    }
+
+    // Swap the raw streamed text for the fully formatted message
+    streamingElement.remove();
+    addMessageToChat('ai', finalResult ?? streamedText, selectedTask);
+}
+
 // Add message to chat
 function addMessageToChat(sender, content, taskType = '') {
     const messageElement = document.createElement('div');
@@ -263,12 +336,13 @@ function addMessageToChat(sender, content, taskType = '') {
         if (content.startsWith('Error') || content.includes('simulated') || content.includes('failed')) {
             contentHtml = `<div class="error-content"><p>${escapeHtml(content)}</p></div>`;
         } else {
-            // Display actual base64 image
+            // Stored images come back as a URL; inline results are base64
+            const imageSrc = isImageUrl(content) ? content : `data:image/png;base64,${content}`;
             contentHtml = `
                 <div class="image-result">
                     <p><strong>Image generated successfully!</strong></p>
                     <div class="image-container">
-                        <img src="data:image/png;base64,${content}" alt="Generated image" class="generated-image" 
+                        <img src="${imageSrc}" alt="Generated image" class="generated-image" 
                              loading="lazy" 
                              onerror="this.onerror=null; this.src=''; this.alt='Failed to load image'; this.className='image-error';">
                         <div class="image-actions">
@@ -727,11 +801,16 @@ function formatTextContent(text) {
     return cleanHtmlEntities(result);
 }
 
+// Image results are either a URL (stored images) or a base64 string
+function isImageUrl(content) {
+    return content.startsWith('/') || content.startsWith('http');
+}
+
 // Download image function
-function downloadImage(base64Data, filename) {
+function downloadImage(imageData, filename) {
     try {
         const link = document.createElement('a');
-        link.href = `data:image/png;base64,${base64Data}`;
+        link.href = isImageUrl(imageData) ? imageData : `data:image/png;base64,${imageData}`;
         link.download = filename;
         link.style.display = 'none';
         document.body.appendChild(link);
@@ -0,0 +1,311 @@
+"""
+Hedged fallback between the primary and alternative model
+Instead of waiting for the primary model to fail before starting the alternative, the
+alternative can be fired after a latency threshold ("hedged") or immediately ("race").
+The first acceptable answer wins and the other in-flight call is cancelled.
+"""
+
+import asyncio
+import logging
+import time
+from functools import lru_cache
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.admission import OverloadedError
+from app.model_health import get_model_health, CircuitOpenError
+from app.metrics import UPSTREAM_CALLS, UPSTREAM_LATENCY
+from app.timing import record_span
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+HEDGE_POLICIES = ("sequential", "hedged", "race")
+
+# Minimum successful samples before the observed percentile is trusted as a hedge delay
+MIN_SAMPLES_FOR_PERCENTILE = 20
+
+
+class AllModelsFailed(Exception):
+    """
+    Raised when none of the routed models produced an acceptable answer; `errors` follows the order of the models
+    """
+    def __init__(self, errors: List[Optional[Exception]]):
+        self.errors = errors
+        super().__init__("; ".join(str(error) for error in errors if error is not None))
+
+    @property
+    def primary_error(self) -> Optional[Exception]:
+        return self.errors[0] if self.errors else None
+
+    @property
+    def fallback_error(self) -> Optional[Exception]:
+        return self.errors[1] if len(self.errors) > 1 else None
+
+    def describe(self, models: List[str]) -> str:
+        """
+        "model: error; model: error" for every model that failed
+        """
+        return "; ".join(f"{model}: {error}" for model, error in zip(models, self.errors) if error is not None)
+
+
+class HedgingStats:
+    """
+    Which model won each call, per task kind, so the hedging cost can be tuned
+    """
+    def __init__(self):
+        self.kinds: Dict[str, Dict[str, Any]] = {}
+
+    def _kind(self, kind: str) -> Dict[str, Any]:
+        if kind not in self.kinds:
+            self.kinds[kind] = {"calls": 0, "hedges_fired": 0, "all_failed": 0, "wins": {}}
+        return self.kinds[kind]
+
+    def record_hedge(self, kind: str) -> None:
+        self._kind(kind)["hedges_fired"] += 1
+
+    def record_result(self, kind: str, winner: Optional[str]) -> None:
+        stats = self._kind(kind)
+        stats["calls"] += 1
+        if winner is None:
+            stats["all_failed"] += 1
+        else:
+            stats["wins"][winner] = stats["wins"].get(winner, 0) + 1
+
+
+hedging_stats = HedgingStats()
+
+
+@lru_cache(maxsize=8)
+def parse_hedge_delay(value: str) -> Tuple[Optional[float], Optional[float]]:
+    """
+    HEDGE_DELAY as (percentile, None) for "p95" or (None, seconds) for "0.8"; (None, None) when it is
+    malformed, which is logged once per value and means HEDGE_DEFAULT_DELAY
+    """
+    delay = value.strip().lower()
+    try:
+        if delay.startswith("p"):
+            percentile = float(delay[1:])
+            if 0 < percentile <= 100:
+                return percentile, None
+        else:
+            seconds = float(delay)
+            if seconds >= 0:
+                return None, seconds
+    except ValueError:
+        pass
+    logger.warning("Invalid HEDGE_DELAY %r (expected seconds or a percentile such as p95); using HEDGE_DEFAULT_DELAY", value)
+    return None, None
+
+
+def get_hedge_delay(model: str) -> float:
+    """
+    Seconds to wait on `model` before firing the alternative under the "hedged" policy
+    """
+    percentile, seconds = parse_hedge_delay(settings.hedge_delay)
+    if seconds is not None:
+        return seconds
+    if percentile is not None:
+        health = get_model_health(model)
+        if health.success_count() >= MIN_SAMPLES_FOR_PERCENTILE:
+            observed = health.latency_percentile(percentile)
+            if observed is not None:
+                return observed
+    return settings.hedge_default_delay
+
+
+def _span_name(index: int) -> str:
+    return "primary" if index == 0 else "fallback"
+
+
+def _shed_outcome(error: OverloadedError) -> str:
+    return "rate_limited" if error.reason == "rate_limited" else "shed"
+
+
+def _record_call(kind: str, model: str, latency: float, ok: bool) -> None:
+    get_model_health(model).record(latency, ok=ok)
+    UPSTREAM_CALLS.inc(task=kind, model=model, outcome="ok" if ok else "error")
+    UPSTREAM_LATENCY.observe(latency, task=kind, model=model)
+
+
+async def call_with_fallback(
+    kind: str,
+    models: List[str],
+    call: Callable[[str], Awaitable[Any]],
+    policy: Optional[str] = None
+) -> Tuple[Any, str]:
+    """
+    Call `call(model)` for the primary model and, according to the hedging policy, the alternative.
+    `call` must raise if the answer is not acceptable. Returns (result, winning model).
+    """
+    policy = policy or settings.hedge_policy
+    if policy not in HEDGE_POLICIES:
+        policy = "sequential"
+
+    errors: List[Optional[Exception]] = [None] * len(models)
+    pending: Dict[asyncio.Task, int] = {}
+    next_index = 0
+
+    async def timed_call(index: int) -> Any:
+        model = models[index]
+        health = get_model_health(model)
+        # Skip models whose circuit breaker is open instead of paying their timeout
+        if not health.allow_request():
+            UPSTREAM_CALLS.inc(task=kind, model=model, outcome="circuit_open")
+            raise CircuitOpenError(model)
+        started = time.perf_counter()
+        try:
+            result = await call(model)
+        except asyncio.CancelledError:
+            health.release_probe()
+            UPSTREAM_CALLS.inc(task=kind, model=model, outcome="cancelled")
+            raise
+        except OverloadedError as error:
+            # Shed by admission control or still rate limited after retries: not a model failure
+            health.release_probe()
+            UPSTREAM_CALLS.inc(task=kind, model=model, outcome=_shed_outcome(error))
+            raise
+        except Exception:
+            _record_call(kind, model, time.perf_counter() - started, ok=False)
+            record_span(_span_name(index), time.perf_counter() - started, model)
+            raise
+        _record_call(kind, model, time.perf_counter() - started, ok=True)
+        record_span(_span_name(index), time.perf_counter() - started, model)
+        return result
+
+    def launch() -> None:
+        nonlocal next_index
+        if next_index > 0 and pending:
+            hedging_stats.record_hedge(kind)
+        pending[asyncio.ensure_future(timed_call(next_index))] = next_index
+        next_index += 1
+
+    launch()
+    if policy == "race":
+        while next_index < len(models):
+            launch()
+
+    try:
+        while pending:
+            # Under "hedged", fire the next model once the current one exceeds the latency threshold
+            timeout = None
+            if policy == "hedged" and next_index < len(models):
+                timeout = get_hedge_delay(models[next_index - 1])
+
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                launch()
+                continue
+
+            finished = sorted(((pending.pop(task), task) for task in done), key=lambda item: item[0])
+            for index, task in finished:
+                errors[index] = task.exception()
+            for index, task in finished:
+                if errors[index] is None:
+                    hedging_stats.record_result(kind, models[index])
+                    return task.result(), models[index]
+
+            # A failure frees the slot: start the next model right away
+            if not pending and next_index < len(models):
+                launch()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    hedging_stats.record_result(kind, None)
+    raise _shed_error(errors) or AllModelsFailed(errors)
+
+
+def _shed_error(errors: List[Optional[Exception]]) -> Optional[OverloadedError]:
+    """
+    The OverloadedError to raise when no model gave an answer because every one was shed, rate
+    limited or had its circuit open, so the client is told to retry instead of getting a fallback answer
+    """
+    shed = [error for error in errors if isinstance(error, OverloadedError)]
+    if shed and all(isinstance(error, (OverloadedError, CircuitOpenError)) for error in errors):
+        return shed[0]
+    return None
+
+
+async def stream_with_fallback(
+    kind: str,
+    models: List[str],
+    open_stream: Callable[[str], AsyncIterator[str]]
+) -> Tuple[AsyncIterator[str], str]:
+    """
+    Open a token stream from the first model that produces a first token.
+    A model that fails before its first token falls through to the next one; once tokens
+    have been sent the stream is committed to that model. Returns (token iterator, model).
+    """
+    errors: List[Optional[Exception]] = [None] * len(models)
+    for index, model in enumerate(models):
+        health = get_model_health(model)
+        if not health.allow_request():
+            UPSTREAM_CALLS.inc(task=kind, model=model, outcome="circuit_open")
+            errors[index] = CircuitOpenError(model)
+            continue
+
+        started = time.perf_counter()
+        stream = open_stream(model)
+        try:
+            first_token = await stream.__anext__()
+        except StopAsyncIteration:
+            errors[index] = Exception(f"Empty stream from {model}")
+        except asyncio.CancelledError:
+            health.release_probe()
+            UPSTREAM_CALLS.inc(task=kind, model=model, outcome="cancelled")
+            raise
+        except OverloadedError as error:
+            health.release_probe()
+            UPSTREAM_CALLS.inc(task=kind, model=model, outcome=_shed_outcome(error))
+            errors[index] = error
+            await stream.aclose()
+            continue
+        except Exception as error:
+            errors[index] = error
+        # Time to first token (the rest of the stream is sent after the response headers)
+        record_span(_span_name(index), time.perf_counter() - started, model)
+        if errors[index] is not None:
+            _record_call(kind, model, time.perf_counter() - started, ok=False)
+            await stream.aclose()
+            continue
+
+        hedging_stats.record_result(kind, model)
+
+        async def tokens() -> AsyncIterator[str]:
+            outcome = None
+            try:
+                yield first_token
+                async for token in stream:
+                    yield token
+                outcome = True
+            except (GeneratorExit, asyncio.CancelledError):
+                # The client went away; that says nothing about the model's health
+                health.release_probe()
+                UPSTREAM_CALLS.inc(task=kind, model=model, outcome="cancelled")
+                raise
+            except Exception:
+                outcome = False
+                raise
+            finally:
+                if outcome is not None:
+                    _record_call(kind, model, time.perf_counter() - started, ok=outcome)
+                await stream.aclose()
+
+        return tokens(), model
+
+    hedging_stats.record_result(kind, None)
+    raise _shed_error(errors) or AllModelsFailed(errors)
+
+
+def get_hedging_stats() -> Dict[str, Any]:
+    """
+    Get the configured hedging policy and per-task win counts
+    """
+    return {
+        "policy": settings.hedge_policy,
+        "delay": settings.hedge_delay,
+        "default_delay": settings.hedge_default_delay,
+        "tasks": hedging_stats.kinds
+    }
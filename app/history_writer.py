@@ -0,0 +1,171 @@
+"""
+Write-behind persistence of history records for AI Task API
+When enabled, QA/image/content history records are put on a bounded in-memory queue and a
+background task commits them in batches, so responses do not wait on SQLite's writer lock.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.settings import settings
+from app.metrics import DB_WRITE_LATENCY, DB_RECORDS, DB_WRITE_FAILURES, DB_RECORDS_DROPPED
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryWriter:
+    """
+    Bounded queue of pending records drained by one background task in batched transactions.
+    A full queue applies back-pressure: producers wait up to HISTORY_ENQUEUE_TIMEOUT seconds, then commit
+    their record directly instead of dropping it.
+    """
+    def __init__(self):
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.flushing: Optional[asyncio.Future] = None
+        self.batch: List[Any] = []  # Records taken off the queue but not yet handed to a flush
+        self.session_factory: Optional[Callable] = None
+        self.enqueued = 0
+        self.written = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.batches = 0
+        self.direct_writes = 0
+        self.backpressure_waits = 0
+        self.max_depth = 0
+        self.last_flush = 0.0
+        self.max_flush = 0.0
+        self.total_flush = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self, session_factory: Callable) -> None:
+        if self.running:
+            return
+        self.session_factory = session_factory
+        self.queue = asyncio.Queue(maxsize=settings.history_queue_size)
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stop the background task and flush everything still queued
+        """
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+        # A flush interrupted by the cancellation keeps running; wait for it before the final drain
+        if self.flushing is not None:
+            await self.flushing
+        remaining, self.batch = self.batch + self._drain(None), []
+        while remaining:
+            await self._flush(remaining[:settings.history_batch_size])
+            remaining = remaining[settings.history_batch_size:]
+
+    async def enqueue(self, record: Any) -> None:
+        if self.queue.full():
+            self.backpressure_waits += 1
+            try:
+                await asyncio.wait_for(self.queue.put(record), timeout=settings.history_enqueue_timeout)
+            except asyncio.TimeoutError:
+                # Queue still full: write through rather than lose the record
+                self.direct_writes += 1
+                await self._flush([record])
+                return
+        else:
+            self.queue.put_nowait(record)
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def _drain(self, limit: Optional[int]) -> List[Any]:
+        records = []
+        while not self.queue.empty() and (limit is None or len(records) < limit):
+            records.append(self.queue.get_nowait())
+        return records
+
+    async def _run(self) -> None:
+        while True:
+            # Wait for the first record, then collect more until the batch is full or the interval elapses
+            self.batch.append(await self.queue.get())
+            deadline = time.perf_counter() + settings.history_flush_interval
+            while len(self.batch) < settings.history_batch_size:
+                self.batch.extend(self._drain(settings.history_batch_size - len(self.batch)))
+                remaining = deadline - time.perf_counter()
+                if len(self.batch) >= settings.history_batch_size or remaining <= 0:
+                    break
+                try:
+                    self.batch.append(await asyncio.wait_for(self.queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            batch, self.batch = self.batch, []
+            # Shield the commit so shutdown waits for an in-progress flush instead of abandoning it
+            self.flushing = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self.flushing)
+
+    async def _flush(self, records: List[Any]) -> None:
+        def _commit():
+            db = self.session_factory()
+            try:
+                db.add_all(records)
+                db.commit()
+            finally:
+                db.close()
+
+        started = time.perf_counter()
+        try:
+            await run_in_threadpool(_commit)
+            self.written += len(records)
+            DB_RECORDS.inc(len(records), mode="write_behind")
+        except Exception:
+            # The records were already acknowledged to their requests: count them as lost
+            self.failed_flushes += 1
+            self.dropped += len(records)
+            DB_WRITE_FAILURES.inc(mode="write_behind")
+            DB_RECORDS_DROPPED.inc(len(records), mode="write_behind")
+            logger.exception("History write-behind flush of %d records failed", len(records))
+        elapsed = time.perf_counter() - started
+        DB_WRITE_LATENCY.observe(elapsed, mode="write_behind")
+        self.batches += 1
+        self.last_flush = elapsed
+        self.max_flush = max(self.max_flush, elapsed)
+        self.total_flush += elapsed
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.history_write_behind,
+            "running": self.running,
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "queue_capacity": settings.history_queue_size,
+            "max_queue_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "failed_flushes": self.failed_flushes,
+            "dropped_records": self.dropped,
+            "batches": self.batches,
+            "avg_batch_size": round(self.written / self.batches, 1) if self.batches else 0.0,
+            "backpressure_waits": self.backpressure_waits,
+            "direct_writes": self.direct_writes,
+            "last_flush_ms": round(self.last_flush * 1000, 2),
+            "avg_flush_ms": round(self.total_flush / self.batches * 1000, 2) if self.batches else 0.0,
+            "max_flush_ms": round(self.max_flush * 1000, 2)
+        }
+
+
+history_writer = HistoryWriter()
+
+
+def get_history_writer_stats() -> Dict[str, Any]:
+    """
+    Get write-behind queue depth, batch sizes and flush latency
+    """
+    return history_writer.snapshot()
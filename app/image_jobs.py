@@ -0,0 +1,342 @@
+"""
+Asynchronous image generation jobs for AI Task API
+Submitting an image job stores it in SQLite and returns its ID immediately; a fixed pool of
+workers takes jobs off an in-memory priority queue and generates the images. Clients poll
+GET /ai-task/jobs/{id} or receive a webhook when the job finishes. Jobs still queued or running
+when the process stops are queued again at the next startup.
+Unless IMAGE_JOB_WEBHOOK_ALLOWED_HOSTS lists the webhook host, it must resolve to public addresses
+only (no loopback, private, link-local or reserved ranges), so clients cannot make the server call
+internal services.
+"""
+
+import asyncio
+import ipaddress
+import itertools
+import logging
+import socket
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+import httpx
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.admission import background
+from app.database import ImageJob
+from app.metrics import IMAGE_JOBS, IMAGE_JOB_WAIT, IMAGE_JOB_DURATION
+from app.services.image_service import generate_image, IMAGE_ROUTE
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+JOB_ROUTE = "/ai-task/jobs"
+UNFINISHED = ("queued", "running")
+
+
+class QueueFullError(Exception):
+    """
+    The job queue is at IMAGE_JOB_QUEUE_SIZE
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        super().__init__(f"Image job queue is full ({capacity} jobs)")
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() + "Z" if value is not None else None
+
+
+def job_view(job: ImageJob) -> Dict[str, Any]:
+    """
+    Public representation of a job (status responses and webhook bodies)
+    """
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "priority": job.priority,
+        "result": job.result,
+        "error": job.error,
+        "created_at": _iso(job.created_at),
+        "started_at": _iso(job.started_at),
+        "finished_at": _iso(job.finished_at),
+        "status_url": f"{JOB_ROUTE}/{job.id}"
+    }
+
+
+def _is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%")[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def validate_webhook_url(url: str) -> None:
+    """
+    Raise ValueError unless `url` is an absolute http(s) URL on an allowed host: one listed in
+    IMAGE_JOB_WEBHOOK_ALLOWED_HOSTS or, when that is empty, any host resolving to public addresses only
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ValueError("webhook_url must be an absolute http(s) URL")
+    host = parsed.hostname.lower()
+    allowed = {entry.strip().lower() for entry in settings.image_job_webhook_allowed_hosts.split(",") if entry.strip()}
+    if allowed:
+        if host not in allowed:
+            raise ValueError(f"webhook_url host {host} is not in IMAGE_JOB_WEBHOOK_ALLOWED_HOSTS")
+        return
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror:
+        raise ValueError(f"webhook_url host {host} does not resolve")
+    for *_, sockaddr in addresses:
+        if not _is_public(sockaddr[0]):
+            raise ValueError(
+                f"webhook_url host {host} resolves to non-public address {sockaddr[0]}; "
+                "list it in IMAGE_JOB_WEBHOOK_ALLOWED_HOSTS to allow it"
+            )
+
+
+class ImageJobQueue:
+    """
+    Priority queue of job IDs (higher priority first, then submission order) served by
+    IMAGE_JOB_WORKERS tasks; SQLite holds the job state so the queue can be rebuilt after a restart
+    """
+    def __init__(self):
+        self.queue: Optional[asyncio.PriorityQueue] = None
+        self.workers: List[asyncio.Task] = []
+        self.deliveries: Set[asyncio.Task] = set()
+        self.session_factory = None
+        self.webhook_client: Optional[httpx.AsyncClient] = None
+        self.sequence = itertools.count()
+        self.active = 0
+        self.submitted = 0
+        self.restored = 0
+        self.rejected = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.webhooks_sent = 0
+        self.webhooks_failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self.workers)
+
+    async def start(self, session_factory) -> None:
+        if self.running:
+            return
+        self.session_factory = session_factory
+        self.queue = asyncio.PriorityQueue()
+        self.webhook_client = httpx.AsyncClient(timeout=settings.image_job_webhook_timeout)
+        for job_id, priority in await run_in_threadpool(self._load_unfinished):
+            self._put(job_id, priority)
+            self.restored += 1
+        if self.restored:
+            logger.info("Restored %d unfinished image jobs", self.restored)
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(settings.image_job_workers)]
+
+    async def stop(self) -> None:
+        """
+        Stop the workers; interrupted jobs stay queued/running in the database and resume at the next start
+        """
+        for task in self.workers + list(self.deliveries):
+            task.cancel()
+        await asyncio.gather(*self.workers, *self.deliveries, return_exceptions=True)
+        self.workers = []
+        self.deliveries.clear()
+        if self.webhook_client is not None:
+            await self.webhook_client.aclose()
+            self.webhook_client = None
+
+    def _put(self, job_id: str, priority: int) -> None:
+        self.queue.put_nowait((-priority, next(self.sequence), job_id))
+
+    def _load_unfinished(self) -> List[Tuple[str, int]]:
+        db: Session = self.session_factory()
+        try:
+            jobs = (
+                db.query(ImageJob)
+                .filter(ImageJob.status.in_(UNFINISHED))
+                .order_by(ImageJob.priority.desc(), ImageJob.created_at)
+                .all()
+            )
+            for job in jobs:
+                # Interrupted mid-generation: run it again from the start
+                job.status = "queued"
+                job.started_at = None
+            db.commit()
+            return [(job.id, job.priority) for job in jobs]
+        finally:
+            db.close()
+
+    async def submit(self, prompt: str, priority: int = 0, webhook_url: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Persist a new job and queue it
+        """
+        if webhook_url:
+            await validate_webhook_url(webhook_url)
+        if self.queue.qsize() >= settings.image_job_queue_size:
+            self.rejected += 1
+            IMAGE_JOBS.inc(status="rejected")
+            raise QueueFullError(settings.image_job_queue_size)
+
+        def _insert() -> Dict[str, Any]:
+            db: Session = self.session_factory()
+            try:
+                job = ImageJob(id=uuid.uuid4().hex, prompt=prompt, priority=priority, webhook_url=webhook_url, status="queued")
+                db.add(job)
+                db.commit()
+                return job_view(job)
+            finally:
+                db.close()
+
+        view = await run_in_threadpool(_insert)
+        self._put(view["job_id"], priority)
+        self.submitted += 1
+        IMAGE_JOBS.inc(status="queued")
+        return view
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        def _load() -> Optional[Dict[str, Any]]:
+            db: Session = self.session_factory()
+            try:
+                job = db.get(ImageJob, job_id)
+                return job_view(job) if job is not None else None
+            finally:
+                db.close()
+
+        return await run_in_threadpool(_load)
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job_id = await self.queue.get()
+            self.active += 1
+            try:
+                await self._run_job(job_id)
+            except Exception:
+                logger.exception("Image job %s failed unexpectedly", job_id)
+            finally:
+                self.active -= 1
+
+    async def _run_job(self, job_id: str) -> None:
+        db: Session = self.session_factory()
+        try:
+            def _mark_running() -> Optional[Tuple[str, Optional[str], float]]:
+                job = db.get(ImageJob, job_id)
+                if job is None or job.status != "queued":
+                    return None
+                job.status = "running"
+                job.started_at = datetime.utcnow()
+                db.commit()
+                # Read in the worker thread: attributes expire on commit and would reload on the event loop
+                return job.prompt, job.webhook_url, (job.started_at - job.created_at).total_seconds()
+
+            claimed = await run_in_threadpool(_mark_running)
+            if claimed is None:
+                return
+            prompt, webhook_url, wait = claimed
+            IMAGE_JOB_WAIT.observe(wait)
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+            started = time.perf_counter()
+            try:
+                # Queued jobs wait for a model slot rather than being shed like interactive requests
+                with background():
+                    result = await generate_image(prompt, db)
+                # generate_image reports total failure as text instead of raising
+                error = None if result.startswith(IMAGE_ROUTE + "/") else result
+            except Exception as e:
+                result, error = None, str(e)
+            elapsed = time.perf_counter() - started
+            IMAGE_JOB_DURATION.observe(elapsed)
+            self.total_run += elapsed
+
+            def _mark_finished() -> Dict[str, Any]:
+                job = db.get(ImageJob, job_id)
+                job.finished_at = datetime.utcnow()
+                if error is None:
+                    job.status = "succeeded"
+                    job.result = result
+                    job.blob_hash = result[len(IMAGE_ROUTE) + 1:]
+                else:
+                    job.status = "failed"
+                    job.error = error
+                db.commit()
+                return job_view(job)
+
+            view = await run_in_threadpool(_mark_finished)
+            if error is None:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+            IMAGE_JOBS.inc(status=view["status"])
+            if webhook_url:
+                delivery = asyncio.create_task(self._deliver(webhook_url, view))
+                self.deliveries.add(delivery)
+                delivery.add_done_callback(self.deliveries.discard)
+        finally:
+            db.close()
+
+    async def _deliver(self, url: str, view: Dict[str, Any]) -> None:
+        """
+        POST the finished job to its webhook, retrying with exponential backoff
+        """
+        try:
+            # Checked again at delivery: the host may resolve differently than at submission
+            await validate_webhook_url(url)
+        except ValueError as e:
+            self.webhooks_failed += 1
+            logger.warning("Webhook for image job %s not sent: %s", view["job_id"], e)
+            return
+        for attempt in range(settings.image_job_webhook_retries + 1):
+            if attempt:
+                await asyncio.sleep(2 ** (attempt - 1))
+            try:
+                response = await self.webhook_client.post(url, json=view)
+                if response.status_code < 300:
+                    self.webhooks_sent += 1
+                    return
+                error = f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                error = str(e) or type(e).__name__
+        self.webhooks_failed += 1
+        logger.warning(
+            "Webhook for image job %s failed after %d attempts: %s", view["job_id"], settings.image_job_webhook_retries + 1, error
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        started = self.succeeded + self.failed + self.active
+        finished = self.succeeded + self.failed
+        return {
+            "workers": len(self.workers),
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "queue_capacity": settings.image_job_queue_size,
+            "running": self.active,
+            "submitted": self.submitted,
+            "restored": self.restored,
+            "rejected": self.rejected,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "avg_wait_ms": round(self.total_wait / started * 1000, 2) if started else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "avg_run_ms": round(self.total_run / finished * 1000, 2) if finished else 0.0,
+            "webhooks_sent": self.webhooks_sent,
+            "webhooks_failed": self.webhooks_failed
+        }
+
+
+image_jobs = ImageJobQueue()
+
+
+def get_image_job_stats() -> Dict[str, Any]:
+    """
+    Get image job queue depth, wait and run times
+    """
+    return image_jobs.snapshot()
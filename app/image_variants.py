@@ -0,0 +1,135 @@
+"""
+Image variants for AI Task API
+Size/format variants (IMAGE_VARIANTS, e.g. thumbnail and medium, plus the original) of a stored
+image are rendered together from a single decode in a dedicated thread or process pool, so PIL
+never runs on the event loop. Rendered variants go to the blob store and are looked up by the
+source image's digest in the image_variants table, so each is produced once per source image.
+"""
+
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+
+from app.blob_store import blob_store
+from app.coalescing import single_flight
+from app.database import ImageVariant, SessionLocal
+from app.image_processing import IMAGE_VARIANTS, render_variants
+from app.metrics import IMAGE_VARIANT_LOOKUPS, IMAGE_PROCESSING_LATENCY
+from app.settings import settings
+from app.timing import span
+
+_executor: Optional[Executor] = None
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if settings.image_executor == "process":
+            _executor = ProcessPoolExecutor(max_workers=settings.image_workers)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=settings.image_workers, thread_name_prefix="image")
+    return _executor
+
+
+async def run_image_work(fn: Callable, *args: Any) -> Any:
+    """
+    Run a function from app.image_processing in the image pool and time it
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    try:
+        return await loop.run_in_executor(_get_executor(), fn, *args)
+    finally:
+        IMAGE_PROCESSING_LATENCY.observe(loop.time() - started, operation=fn.__name__)
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _spec(variant: str, fmt: str) -> str:
+    # Changing a variant's size or the quality setting yields a new spec, so stale renders are not reused
+    return f"{variant}:{IMAGE_VARIANTS[variant] or 0}:{fmt}:{settings.image_variant_quality}"
+
+
+def _stored_variants(source: str) -> Dict[str, str]:
+    db = SessionLocal()
+    try:
+        rows = db.query(ImageVariant.spec, ImageVariant.blob_hash).filter(ImageVariant.source_hash == source).all()
+        return {spec: blob_hash for spec, blob_hash in rows}
+    finally:
+        db.close()
+
+
+def _store_variants(source: str, rendered: List[tuple]) -> Dict[str, str]:
+    """
+    Put rendered variants in the blob store and record them; returns spec -> digest
+    """
+    digests: Dict[str, str] = {}
+    records = []
+    for spec, output in rendered:
+        if output is None:
+            # Same size and format as the source
+            digests[spec] = source
+            records.append(ImageVariant(source_hash=source, spec=spec, blob_hash=source))
+            continue
+        data, width, height = output
+        digests[spec] = blob_store.put(data)
+        records.append(ImageVariant(
+            source_hash=source, spec=spec, blob_hash=digests[spec], width=width, height=height, size_bytes=len(data)
+        ))
+    db = SessionLocal()
+    try:
+        db.add_all(records)
+        db.commit()
+    except IntegrityError:
+        # Another worker rendered the same variants first; the blobs are identical
+        db.rollback()
+    finally:
+        db.close()
+    return digests
+
+
+async def _render_missing(source: str, fmt: str, data: Optional[bytes]) -> Dict[str, str]:
+    stored = await run_in_threadpool(_stored_variants, source)
+    missing = [variant for variant in IMAGE_VARIANTS if _spec(variant, fmt) not in stored]
+    if missing:
+        if data is None:
+            data = await run_in_threadpool(blob_store.get, source)
+            if data is None:
+                raise LookupError(f"Image {source} not found")
+        with span("image_variants", fmt):
+            outputs = await run_image_work(
+                render_variants, data, [(IMAGE_VARIANTS[variant], fmt, settings.image_variant_quality) for variant in missing]
+            )
+        specs = [_spec(variant, fmt) for variant in missing]
+        stored.update(await run_in_threadpool(_store_variants, source, list(zip(specs, outputs))))
+        IMAGE_VARIANT_LOOKUPS.inc(len(missing), outcome="rendered")
+    return {variant: stored[_spec(variant, fmt)] for variant in IMAGE_VARIANTS}
+
+
+async def variant_digest(source: str, variant: str = "original", fmt: Optional[str] = None, data: Optional[bytes] = None) -> str:
+    """
+    Digest of a variant of the stored image `source` (its bytes may be passed to skip a blob store read).
+    The original without an explicit format is the source itself; a missing variant is rendered
+    together with every other variant of that format.
+    """
+    if variant not in IMAGE_VARIANTS:
+        raise ValueError(f"Unknown image variant: {variant}")
+    if variant == "original" and fmt is None:
+        return source
+    fmt = fmt or settings.image_variant_format
+    stored = await run_in_threadpool(_stored_variants, source)
+    digest = stored.get(_spec(variant, fmt))
+    if digest is not None:
+        IMAGE_VARIANT_LOOKUPS.inc(outcome="hit")
+        return digest
+    # Concurrent requests for the same source and format share one render
+    variants = await single_flight.do("image_variants", f"image_variants:{source}:{fmt}", lambda: _render_missing(source, fmt, data))
+    return variants[variant]
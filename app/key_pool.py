@@ -0,0 +1,187 @@
+"""
+OpenRouter API key pool for AI Task API
+Upstream calls are spread over every configured key (OPENROUTER_API_KEY, OPENROUTER_API_KEYS and
+the lines of OPENROUTER_API_KEYS_FILE) so aggregate throughput is not capped by one key's rate
+limit. Each call takes the key with the fewest calls in flight, preferring the one rate limited
+least recently, then the least used. A key answered with 401/402 is quarantined for KEY_QUARANTINE_SECONDS, and one
+answered with 429 until its Retry-After (or KEY_RATE_LIMIT_QUARANTINE_SECONDS). The keys file is
+re-read when it changes, so keys can be rotated without a restart. Keys are only ever reported by
+fingerprint.
+"""
+
+import hashlib
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Mapping, Optional
+
+from app.metrics import UPSTREAM_KEY_REQUESTS
+from app.rate_limits import parse_retry_after
+from app.settings import settings
+
+# Responses that say the key (not the model or the request) is unusable for now
+QUARANTINE_STATUSES = (401, 402, 429)
+
+
+def fingerprint(key: str) -> str:
+    return "key-" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:12] if key else "key-none"
+
+
+class ApiKey:
+    """
+    One key with its usage counters and quarantine deadline
+    """
+    def __init__(self, key: str):
+        self.key = key
+        self.fingerprint = fingerprint(key)
+        self.in_flight = 0
+        self.requests = 0
+        self.errors: Dict[str, int] = {}
+        self.quarantined_until = 0.0
+        self.quarantine_reason = ""
+        self.last_rate_limited = 0.0
+
+    def available(self, now: float) -> bool:
+        return self.quarantined_until <= now
+
+    def record(self, status: int, headers: Mapping[str, str]) -> None:
+        self.requests += 1
+        UPSTREAM_KEY_REQUESTS.inc(key=self.fingerprint, status=str(status))
+        now = time.monotonic()
+        if status < 400:
+            # The key's quota is spent even though this call got through: rest it until the quota resets
+            if headers.get("x-ratelimit-remaining", "").strip() == "0":
+                delay = parse_retry_after({"x-ratelimit-reset": headers.get("x-ratelimit-reset", "")})
+                if delay:
+                    self.quarantined_until = max(self.quarantined_until, now + delay)
+                    self.quarantine_reason = "exhausted"
+            return
+        self.errors[str(status)] = self.errors.get(str(status), 0) + 1
+        if status not in QUARANTINE_STATUSES:
+            return
+        if status == 429:
+            self.last_rate_limited = now
+            retry_after = parse_retry_after(headers)
+            seconds = settings.key_rate_limit_quarantine_seconds if retry_after is None else retry_after
+        else:
+            seconds = settings.key_quarantine_seconds
+        self.quarantined_until = max(self.quarantined_until, now + seconds)
+        self.quarantine_reason = str(status)
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        return {
+            "fingerprint": self.fingerprint,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "quarantined_for_seconds": round(max(0.0, self.quarantined_until - now), 1),
+            "quarantine_reason": self.quarantine_reason if self.quarantined_until > now else None
+        }
+
+
+def _read_keys_file(path: str) -> List[str]:
+    """
+    One key per line; blank lines and lines starting with # are ignored
+    """
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
+
+
+class KeyPool:
+    """
+    Keys in configuration order; state survives reloads for keys that are still configured
+    """
+    def __init__(self):
+        self.keys: List[ApiKey] = []
+        self.file_mtime: Optional[float] = None
+        self.checked_at = 0.0
+        self.reloads = 0
+        self.load()
+
+    def _configured(self) -> List[str]:
+        keys = [settings.openrouter_api_key] + settings.openrouter_api_keys.split(",")
+        if settings.openrouter_api_keys_file:
+            try:
+                keys += _read_keys_file(settings.openrouter_api_keys_file)
+            except OSError as e:
+                print(f"Warning: could not read OPENROUTER_API_KEYS_FILE: {str(e)}")
+        return list(dict.fromkeys(key.strip() for key in keys if key.strip()))
+
+    def load(self) -> None:
+        """
+        (Re)build the pool from settings and the keys file
+        """
+        existing = {key.key: key for key in self.keys}
+        self.keys = [existing.get(key) or ApiKey(key) for key in self._configured()]
+        if settings.openrouter_api_keys_file:
+            try:
+                self.file_mtime = os.stat(settings.openrouter_api_keys_file).st_mtime
+            except OSError:
+                self.file_mtime = None
+
+    def _reload_if_changed(self, now: float) -> None:
+        if not settings.openrouter_api_keys_file or now - self.checked_at < settings.key_pool_reload_interval:
+            return
+        self.checked_at = now
+        try:
+            mtime = os.stat(settings.openrouter_api_keys_file).st_mtime
+        except OSError:
+            mtime = None
+        if mtime != self.file_mtime:
+            self.load()
+            self.reloads += 1
+            print(f"Reloaded OpenRouter API keys file: {len(self.keys)} keys")
+
+    def _pick(self) -> Optional[ApiKey]:
+        now = time.monotonic()
+        self._reload_if_changed(now)
+        if not self.keys:
+            return None
+        available = [key for key in self.keys if key.available(now)]
+        if not available:
+            # Every key is quarantined: use the one that recovers first rather than failing outright
+            return min(self.keys, key=lambda key: key.quarantined_until)
+        # Least loaded, then least recently rate limited, then least used (round-robin over idle keys)
+        return min(available, key=lambda key: (key.in_flight, key.last_rate_limited, key.requests))
+
+    @contextmanager
+    def use(self) -> Iterator[Optional[ApiKey]]:
+        """
+        Pick a key for one upstream call and count it as in flight meanwhile (None when no key is configured)
+        """
+        key = self._pick()
+        if key is None:
+            yield None
+            return
+        key.in_flight += 1
+        try:
+            yield key
+        finally:
+            key.in_flight -= 1
+
+    def available(self) -> bool:
+        """
+        Whether any key is out of quarantine
+        """
+        now = time.monotonic()
+        return any(key.available(now) for key in self.keys)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "keys": len(self.keys),
+            "available": sum(1 for key in self.keys if key.available(now)),
+            "keys_file": bool(settings.openrouter_api_keys_file),
+            "reloads": self.reloads,
+            "usage": [key.snapshot(now) for key in self.keys]
+        }
+
+
+key_pool = KeyPool()
+
+
+def get_key_pool_stats() -> Dict[str, Any]:
+    """
+    Get per-key usage, errors and quarantine state (by fingerprint, never the key itself)
+    """
+    return key_pool.snapshot()
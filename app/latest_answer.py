@@ -0,0 +1,80 @@
+"""
+In-memory latest answer for AI Task API
+The `latest_answer` task is polled constantly, so the most recent QA answer is kept in memory:
+loaded from the database at startup and replaced whenever a QA answer is recorded. Other uvicorn
+workers write to the same database, so the highest qa_history id is re-checked at most every
+LATEST_ANSWER_SYNC_INTERVAL seconds and the answer reloaded when it has moved.
+"""
+
+import hashlib
+import time
+from typing import Optional, Tuple
+
+from sqlalchemy import func, inspect
+from starlette.concurrency import run_in_threadpool
+
+from app.database import QAHistory, SessionLocal
+from app.settings import settings
+from app.timing import span
+
+
+class LatestAnswer:
+    """
+    The latest answer, the qa_history id it was read from (or recorded as) and its ETag
+    """
+    def __init__(self):
+        self.answer: Optional[str] = None
+        self.row_id = 0
+        self.etag: Optional[str] = None
+        self.checked_at = 0.0
+
+    def set(self, answer: str, row_id: Optional[int] = None) -> None:
+        self.answer = answer
+        self.etag = '"' + hashlib.sha256(answer.encode()).hexdigest()[:32] + '"'
+        # Without an id (record not committed yet) keep the old one so the next sync picks up the row
+        if row_id is not None and row_id > self.row_id:
+            self.row_id = row_id
+
+    def record(self, qa_record: QAHistory, answer: str) -> None:
+        """
+        Point at a newly saved answer. The row id is read from the identity map without touching the
+        database, since a queued or deferred record may not have been committed yet.
+        """
+        identity = inspect(qa_record).identity
+        self.set(answer, identity[0] if identity else None)
+
+    def load(self) -> None:
+        """
+        Read the newest qa_history row (by primary key, an O(1) index lookup)
+        """
+        db = SessionLocal()
+        try:
+            row = db.query(QAHistory.id, QAHistory.answer).order_by(QAHistory.id.desc()).first()
+        finally:
+            db.close()
+        self.checked_at = time.time()
+        if row is not None:
+            self.set(str(row.answer), row.id)
+
+    def _sync(self) -> None:
+        db = SessionLocal()
+        try:
+            max_id = db.query(func.max(QAHistory.id)).scalar() or 0
+        finally:
+            db.close()
+        self.checked_at = time.time()
+        if max_id > self.row_id:
+            self.load()
+
+    async def current(self) -> Tuple[Optional[str], Optional[str]]:
+        """
+        The latest answer and its ETag, re-checking the database when the sync interval has elapsed
+        """
+        interval = settings.latest_answer_sync_interval
+        if interval >= 0 and time.time() - self.checked_at >= interval:
+            with span("latest_sync"):
+                await run_in_threadpool(self._sync)
+        return self.answer, self.etag
+
+
+latest_answer = LatestAnswer()
@@ -0,0 +1,281 @@
+"""
+Prometheus-style metrics for AI Task API
+Counters and histograms are recorded into a per-thread shard, so the event loop and threadpool
+workers never contend on a lock; shards are only summed when /metrics is scraped. With several
+uvicorn workers, set METRICS_MULTIPROC_DIR: each worker writes its totals to a file there and
+/metrics merges every worker's file.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.settings import settings
+
+# Seconds; upstream LLM and image calls routinely take tens of seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry: List["_Metric"] = []
+_shards: List[Dict[Tuple, list]] = []
+_shards_lock = threading.Lock()
+_local = threading.local()
+
+
+def _shard() -> Dict[Tuple, list]:
+    """
+    This thread's shard: (metric name, label values) -> [value] for counters,
+    [bucket counts..., +Inf count, sum] for histograms
+    """
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _local.shard = {}
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple:
+        return (self.name, tuple(str(labels.get(label, "")) for label in self.labelnames))
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if not settings.metrics_enabled:
+            return
+        shard = _shard()
+        key = self._key(labels)
+        cell = shard.get(key)
+        if cell is None:
+            shard[key] = [amount]
+        else:
+            cell[0] += amount
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels: str) -> None:
+        if not settings.metrics_enabled:
+            return
+        shard = _shard()
+        key = self._key(labels)
+        cell = shard.get(key)
+        if cell is None:
+            cell = shard[key] = [0] * (len(self.buckets) + 2)
+        # Per-bucket (non-cumulative) count; the last bucket before the sum is +Inf
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+
+# Dispatcher
+REQUESTS = Counter("ai_task_requests_total", "Tasks handled by the /ai-task/ dispatcher", ["task", "status"])
+REQUEST_LATENCY = Histogram("ai_task_request_duration_seconds", "Task handling latency in the /ai-task/ dispatcher", ["task"])
+RESULTS = Counter(
+    "ai_task_results_total",
+    "Answers by source: primary, fallback, cache, template or placeholder (both models failed), error",
+    ["task", "source"]
+)
+CONTENT_REJECTED = Counter(
+    "content_rejected_total",
+    "Generated content that failed validation: short (model answer rejected), few_posts (under 3 posts), unparseable (multi-platform platforms re-requested)",
+    ["reason"]
+)
+
+# Upstream
+UPSTREAM_CALLS = Counter(
+    "openrouter_calls_total", "OpenRouter calls by outcome (ok, error, cancelled, circuit_open, shed, rate_limited)", ["task", "model", "outcome"]
+)
+UPSTREAM_LATENCY = Histogram("openrouter_call_duration_seconds", "OpenRouter call latency per model", ["task", "model"])
+UPSTREAM_RATE_LIMITED = Counter(
+    "openrouter_rate_limited_total",
+    "OpenRouter 429 responses retried on the same model (after a wait, or at once with another API key) or given up on",
+    ["model", "action"]
+)
+UPSTREAM_KEY_REQUESTS = Counter("openrouter_key_requests_total", "OpenRouter responses per API key fingerprint and status", ["key", "status"])
+TOKENS = Counter("openrouter_tokens_total", "Tokens reported in the OpenRouter usage field", ["model", "type"])
+
+# Admission control
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total", "Requests and upstream calls refused: rate_limited, queue_full, queue_timeout", ["reason", "model"]
+)
+ADMISSION_WAIT = Histogram("admission_wait_seconds", "Time upstream calls waited for a model concurrency slot", ["model"])
+
+# Image jobs
+IMAGE_JOBS = Counter("image_jobs_total", "Image jobs by status: queued, rejected (queue full), succeeded, failed", ["status"])
+IMAGE_JOB_WAIT = Histogram("image_job_wait_seconds", "Time image jobs spent queued before a worker picked them up")
+IMAGE_JOB_DURATION = Histogram("image_job_duration_seconds", "Image job generation time")
+
+# Image post-processing
+IMAGE_VARIANT_LOOKUPS = Counter("image_variant_lookups_total", "Image variant requests served from stored renders (hit) or rendered", ["outcome"])
+IMAGE_PROCESSING_LATENCY = Histogram("image_processing_duration_seconds", "Image pool work (variant rendering, placeholder)", ["operation"])
+
+# QA context retrieval
+CONTEXT_TOKENS = Counter(
+    "qa_context_tokens_total", "Estimated QA context tokens sent to the model, or saved by passage retrieval", ["kind"]
+)
+
+# History database
+DB_WRITE_LATENCY = Histogram("history_db_write_duration_seconds", "History record commit latency", ["mode"])
+DB_RECORDS = Counter("history_db_records_written_total", "History records committed", ["mode"])
+DB_WRITE_FAILURES = Counter("history_db_write_failures_total", "History commits that failed", ["mode"])
+DB_RECORDS_DROPPED = Counter("history_db_records_dropped_total", "History records lost to a failed commit", ["mode"])
+
+
+def record_usage(model: str, usage: Dict) -> None:
+    """
+    Count prompt/completion tokens from an OpenRouter `usage` object
+    """
+    if not usage:
+        return
+    TOKENS.inc(usage.get("prompt_tokens") or 0, model=model, type="prompt")
+    TOKENS.inc(usage.get("completion_tokens") or 0, model=model, type="completion")
+
+
+@contextmanager
+def track_task(task: str):
+    """
+    Count a dispatched task and observe its latency (for streams, the time until streaming starts)
+    """
+    started = time.perf_counter()
+    status = 200
+    try:
+        yield
+    except Exception as e:
+        status = getattr(e, "status_code", 500)
+        raise
+    finally:
+        REQUESTS.inc(task=task, status=str(status))
+        REQUEST_LATENCY.observe(time.perf_counter() - started, task=task)
+
+
+def _collect_local() -> Dict[Tuple, list]:
+    """
+    Sum every thread's shard
+    """
+    with _shards_lock:
+        shards = list(_shards)
+    totals: Dict[Tuple, list] = {}
+    for shard in shards:
+        # dict.copy() is atomic under the GIL, so the owning thread can keep writing
+        for key, cell in shard.copy().items():
+            cell = list(cell)
+            total = totals.get(key)
+            if total is None:
+                totals[key] = cell
+            else:
+                for i, value in enumerate(cell):
+                    total[i] += value
+    return totals
+
+
+def _worker_file() -> str:
+    return os.path.join(settings.metrics_multiproc_dir, f"metrics_{os.getpid()}.json")
+
+
+def write_worker_file() -> None:
+    """
+    Publish this worker's totals for the other workers' /metrics (multiprocess mode only)
+    """
+    if not settings.metrics_multiproc_dir:
+        return
+    os.makedirs(settings.metrics_multiproc_dir, exist_ok=True)
+    rows = [[name, list(labels), cell] for (name, labels), cell in _collect_local().items()]
+    path = _worker_file()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"written_at": time.time(), "metrics": rows}, f)
+    os.replace(tmp_path, path)
+
+
+async def sync_worker_file() -> None:
+    """
+    Background task (multiprocess mode): refresh this worker's file every METRICS_SYNC_INTERVAL seconds
+    """
+    while True:
+        await asyncio.sleep(settings.metrics_sync_interval)
+        await run_in_threadpool(write_worker_file)
+
+
+def _collect() -> Dict[Tuple, list]:
+    if not settings.metrics_multiproc_dir:
+        return _collect_local()
+    write_worker_file()
+    totals: Dict[Tuple, list] = {}
+    for filename in os.listdir(settings.metrics_multiproc_dir):
+        if not (filename.startswith("metrics_") and filename.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(settings.metrics_multiproc_dir, filename)) as f:
+                rows = json.load(f)["metrics"]
+        except (OSError, ValueError, KeyError):
+            continue
+        for name, labels, cell in rows:
+            key = (name, tuple(labels))
+            total = totals.get(key)
+            if total is None:
+                totals[key] = list(cell)
+            elif len(total) == len(cell):
+                for i, value in enumerate(cell):
+                    total[i] += value
+    return totals
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_metrics() -> str:
+    """
+    Render all metrics in the Prometheus text exposition format (blocking in multiprocess mode)
+    """
+    totals = _collect()
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        series = sorted((labels, cell) for (name, labels), cell in totals.items() if name == metric.name)
+        for labels, cell in series:
+            if metric.kind == "counter":
+                lines.append(f"{metric.name}{_format_labels(metric.labelnames, labels)} {_format_value(cell[0])}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float("inf"),), cell[:-1]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{metric.name}_bucket{_format_labels(metric.labelnames, labels, le)} {_format_value(cumulative)}")
+            lines.append(f"{metric.name}_sum{_format_labels(metric.labelnames, labels)} {_format_value(cell[-1])}")
+            lines.append(f"{metric.name}_count{_format_labels(metric.labelnames, labels)} {_format_value(cumulative)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,89 @@
+"""
+Database migrations for AI Task API
+
+Schema creation and upgrades for existing databases (columns and indexes added after a table was
+first created) run at startup. Moving legacy inline images into the blob store can take a while on
+a large database, so it is run explicitly:
+
+    python -m app.migrations [--batch-size 200] [--vacuum]
+"""
+
+import argparse
+import base64
+import binascii
+
+from sqlalchemy import inspect, text
+
+from app.blob_store import blob_store
+from app.database import engine, init_db, SessionLocal, ImageRecord
+
+# (table, column, DDL type) added to tables that predate them
+ADDED_COLUMNS = [
+    ("image_records", "blob_hash", "VARCHAR(64)"),
+]
+
+
+def upgrade_schema() -> None:
+    """
+    Create missing tables, then add columns and indexes missing from tables created by an older version
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, column, ddl_type in ADDED_COLUMNS:
+            if not inspector.has_table(table):
+                continue
+            existing = {col["name"] for col in inspector.get_columns(table)}
+            if column not in existing:
+                print(f"Adding column {table}.{column}")
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+    init_db()
+
+
+def migrate_image_blobs(batch_size: int = 200) -> dict:
+    """
+    Move base64 images stored inline in image_records.image_data into the blob store,
+    keeping only the digest in the row. Values that are not base64 (e.g. URLs or error text) are left as they are.
+    """
+    migrated = skipped = 0
+    last_id = 0
+    db = SessionLocal()
+    try:
+        while True:
+            rows = (
+                db.query(ImageRecord)
+                .filter(ImageRecord.id > last_id, ImageRecord.blob_hash.is_(None), ImageRecord.image_data.isnot(None))
+                .order_by(ImageRecord.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            for row in rows:
+                last_id = row.id
+                try:
+                    data = base64.b64decode(row.image_data, validate=True)
+                except (binascii.Error, ValueError):
+                    skipped += 1
+                    continue
+                row.blob_hash = blob_store.put(data)
+                row.image_data = None
+                migrated += 1
+            db.commit()
+    finally:
+        db.close()
+    return {"migrated": migrated, "skipped": skipped}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upgrade the AI Task API database")
+    parser.add_argument("--batch-size", type=int, default=200, help="Rows moved to the blob store per transaction")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM afterwards to return the freed pages to the filesystem")
+    args = parser.parse_args()
+
+    upgrade_schema()
+    result = migrate_image_blobs(args.batch_size)
+    print(f"Moved {result['migrated']} images to the blob store ({result['skipped']} non-base64 rows left in place)")
+    if args.vacuum:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+        print("Database vacuumed")
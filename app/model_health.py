@@ -0,0 +1,170 @@
+"""
+Model health tracking for AI Task API
+Keeps a rolling window of upstream call outcomes per model ID and a circuit breaker that
+lets requests skip a model that is failing (rate-limited, down) instead of paying its timeout
+"""
+
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from app.settings import settings
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a model whose circuit breaker is open
+    """
+    def __init__(self, model: str):
+        super().__init__(f"Circuit breaker open for model {model}")
+        self.model = model
+
+
+class ModelHealth:
+    """
+    Rolling window of (timestamp, latency, ok) samples for one model, plus its circuit breaker.
+    The breaker opens when the recent error rate crosses the threshold, rejects calls while open,
+    then lets a limited number of half-open probe calls through to decide whether to close again.
+    """
+    def __init__(self, model: str, window: int):
+        self.model = model
+        self.samples = deque(maxlen=window)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.probes_in_flight = 0
+        self.rejected = 0
+        # Exponentially weighted moving average of successful call latency, for routing
+        self.ewma_latency: Optional[float] = None
+
+    def allow_request(self) -> bool:
+        """
+        Whether a call to this model may go ahead now. A True result in half-open state reserves a probe slot.
+        """
+        if self.state == OPEN:
+            if time.time() - self.opened_at < settings.breaker_open_seconds:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self.probes_in_flight >= settings.breaker_half_open_probes:
+                self.rejected += 1
+                return False
+            self.probes_in_flight += 1
+        return True
+
+    def is_open(self) -> bool:
+        """
+        Whether the breaker would reject a call now (without reserving a half-open probe like allow_request)
+        """
+        if self.state == OPEN:
+            return time.time() - self.opened_at < settings.breaker_open_seconds
+        return self.state == HALF_OPEN and self.probes_in_flight >= settings.breaker_half_open_probes
+
+    def release_probe(self) -> None:
+        """
+        Give back a half-open probe slot when the call was cancelled without an outcome
+        """
+        if self.state == HALF_OPEN and self.probes_in_flight > 0:
+            self.probes_in_flight -= 1
+
+    def record(self, latency: float, ok: bool) -> None:
+        # Calls slower than the slow-call threshold count as failures for the breaker
+        slow = settings.breaker_slow_call_seconds > 0 and latency >= settings.breaker_slow_call_seconds
+        self.samples.append((time.time(), latency, ok))
+        if ok:
+            alpha = settings.routing_ewma_alpha
+            self.ewma_latency = latency if self.ewma_latency is None else alpha * latency + (1 - alpha) * self.ewma_latency
+
+        if self.state == HALF_OPEN:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+            if ok and not slow:
+                self.state = CLOSED
+                self.samples.clear()
+            else:
+                self._open()
+        elif self.state == CLOSED:
+            total, failures = self._recent_outcomes()
+            if total >= settings.breaker_min_requests and failures / total >= settings.breaker_error_threshold:
+                self._open()
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self.opened_at = time.time()
+        self.times_opened += 1
+        self.probes_in_flight = 0
+
+    def _recent_outcomes(self):
+        """
+        (calls, failures) within the breaker window, counting slow calls as failures
+        """
+        cutoff = time.time() - settings.breaker_window_seconds
+        slow_after = settings.breaker_slow_call_seconds
+        total = failures = 0
+        for timestamp, latency, ok in self.samples:
+            if timestamp < cutoff:
+                continue
+            total += 1
+            if not ok or (slow_after > 0 and latency >= slow_after):
+                failures += 1
+        return total, failures
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """
+        Latency (seconds) at the given percentile over successful calls, None if there is no data
+        """
+        latencies = sorted(latency for _, latency, ok in self.samples if ok)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+        return latencies[index]
+
+    def success_count(self) -> int:
+        return sum(1 for _, _, ok in self.samples if ok)
+
+    def snapshot(self) -> Dict[str, Any]:
+        total = len(self.samples)
+        errors = total - self.success_count()
+        p50 = self.latency_percentile(50)
+        p95 = self.latency_percentile(95)
+        recent_total, recent_failures = self._recent_outcomes()
+        return {
+            "state": self.state,
+            "open_for_seconds": round(max(0.0, settings.breaker_open_seconds - (time.time() - self.opened_at)), 1) if self.state == OPEN else 0.0,
+            "times_opened": self.times_opened,
+            "rejected_calls": self.rejected,
+            "recent_failure_rate": round(recent_failures / recent_total, 3) if recent_total else 0.0,
+            "samples": total,
+            "error_rate": round(errors / total, 3) if total else 0.0,
+            "latency_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "latency_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "latency_ewma_ms": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None
+        }
+
+
+_health: Dict[str, ModelHealth] = {}
+
+
+def get_model_health(model: str) -> ModelHealth:
+    """
+    Return the health tracker for a model, creating it on first use
+    """
+    health = _health.get(model)
+    if health is None:
+        health = _health[model] = ModelHealth(model, settings.health_window)
+    return health
+
+
+def get_health_snapshot(models: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Get breaker state and rolling health statistics for the given models plus every model that has been called
+    """
+    for model in models or []:
+        if model:
+            get_model_health(model)
+    return {model: health.snapshot() for model, health in _health.items()}
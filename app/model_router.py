@@ -0,0 +1,179 @@
+"""
+Model routing for AI Task API
+Each model kind ("chat" for QA and content generation, "image") has a pool of interchangeable
+models (CHAT_MODEL_POOL / IMAGE_MODEL_POOL, defaulting to the primary and alternative model), each
+with a weight, a cost tier and an optional latency ceiling. For every call the router orders the
+pool under ROUTING_POLICY and the first ROUTING_MAX_ATTEMPTS models become the primary
+and fallbacks handed to call_with_fallback:
+- "ordered": configuration order (the classic primary/alternative behaviour)
+- "ewma": lowest score first, where score = EWMA latency x (calls queued or in flight + 1) / weight
+- "p2c": power of two choices, two models drawn by weight and the lower score goes first
+Under "ewma" and "p2c", models whose circuit breaker is open or whose EWMA latency exceeds their
+ceiling go after every eligible model.
+"""
+
+import random
+from typing import Any, Dict, List, Optional
+
+from app.admission import admission
+from app.model_health import get_model_health
+from app.settings import settings
+
+ROUTING_POLICIES = ("ordered", "ewma", "p2c")
+
+# Score assumed for models without latency samples yet, when no pool member has any
+DEFAULT_LATENCY = 1.0
+
+
+def cost_tier(model: str) -> str:
+    return "free" if model.endswith(":free") else "paid"
+
+
+class PoolModel:
+    """
+    One routable model: weight, cost tier and latency ceiling (seconds, 0 = none)
+    """
+    def __init__(self, model: str, weight: float = 1.0, tier: Optional[str] = None, max_latency: Optional[float] = None):
+        self.model = model
+        self.weight = weight if weight > 0 else 1.0
+        self.tier = tier or cost_tier(model)
+        self.max_latency = settings.routing_max_latency if max_latency is None else max_latency
+
+
+def parse_pool(spec: str) -> List[PoolModel]:
+    """
+    "model=weight|tier=paid|max_latency=5,model,..." -> pool entries (weight, tier and max_latency are optional)
+    """
+    pool: List[PoolModel] = []
+    for item in spec.split(","):
+        fields = [field.strip() for field in item.split("|")]
+        model, _, weight = fields[0].rpartition("=")
+        if not model:
+            model, weight = fields[0], ""
+        if not model.strip():
+            continue
+        options = dict(field.partition("=")[::2] for field in fields[1:] if "=" in field)
+        pool.append(PoolModel(
+            model.strip(),
+            float(weight) if weight.strip() else 1.0,
+            options.get("tier"),
+            float(options["max_latency"]) if options.get("max_latency") else None
+        ))
+    return pool
+
+
+class ModelPool:
+    """
+    The routable models of one kind, restricted to the allowed cost tiers
+    """
+    def __init__(self, kind: str, models: List[PoolModel]):
+        tiers = {tier.strip() for tier in settings.routing_tiers.split(",") if tier.strip()}
+        self.kind = kind
+        self.models = [entry for entry in models if not tiers or entry.tier in tiers]
+        self.excluded = [entry.model for entry in models if entry not in self.models]
+        if not self.models:
+            print(f"Warning: every {kind} model is excluded by ROUTING_TIERS; ignoring the tier constraint.")
+            self.models, self.excluded = models, []
+
+    def _prior(self) -> float:
+        measured = sorted(
+            get_model_health(entry.model).ewma_latency for entry in self.models
+            if get_model_health(entry.model).ewma_latency is not None
+        )
+        return measured[len(measured) // 2] if measured else DEFAULT_LATENCY
+
+    def score(self, entry: PoolModel, prior: float) -> float:
+        """
+        Expected wait on a model: its EWMA latency scaled by the calls already in flight or queued, per unit of weight
+        """
+        latency = get_model_health(entry.model).ewma_latency
+        limiter = admission.model(entry.model)
+        load = limiter.in_flight + limiter.queue_depth + 1
+        return (prior if latency is None else latency) * load / entry.weight
+
+    def eligible(self, entry: PoolModel) -> bool:
+        health = get_model_health(entry.model)
+        if health.is_open():
+            return False
+        return not (entry.max_latency and health.ewma_latency is not None and health.ewma_latency > entry.max_latency)
+
+    def route(self, policy: Optional[str] = None) -> List[str]:
+        """
+        Models to try for one call, best first
+        """
+        policy = policy or settings.routing_policy
+        ordered = list(self.models)
+        if policy in ("ewma", "p2c"):
+            prior = self._prior()
+            scores = {entry.model: self.score(entry, prior) for entry in self.models}
+            eligible = [entry for entry in self.models if self.eligible(entry)]
+            rest = [entry for entry in self.models if entry not in eligible]
+            # Stable sort: equal scores keep configuration order
+            eligible.sort(key=lambda entry: scores[entry.model])
+            rest.sort(key=lambda entry: scores[entry.model])
+            if policy == "p2c" and len(eligible) > 2:
+                first, second = self._draw_two(eligible)
+                winner = first if scores[first.model] <= scores[second.model] else second
+                eligible.remove(winner)
+                eligible.insert(0, winner)
+            ordered = eligible + rest
+        return [entry.model for entry in ordered[:max(1, settings.routing_max_attempts)]]
+
+    @staticmethod
+    def _draw_two(entries: List[PoolModel]) -> List[PoolModel]:
+        first = random.choices(entries, weights=[entry.weight for entry in entries])[0]
+        others = [entry for entry in entries if entry is not first]
+        second = random.choices(others, weights=[entry.weight for entry in others])[0]
+        return [first, second]
+
+    def snapshot(self) -> Dict[str, Any]:
+        prior = self._prior()
+        return {
+            "models": [
+                {
+                    "model": entry.model,
+                    "weight": entry.weight,
+                    "tier": entry.tier,
+                    "max_latency": entry.max_latency or None,
+                    "eligible": self.eligible(entry),
+                    "ewma_latency_ms": (
+                        round(get_model_health(entry.model).ewma_latency * 1000, 1)
+                        if get_model_health(entry.model).ewma_latency is not None else None
+                    ),
+                    "in_flight": admission.model(entry.model).in_flight,
+                    "score": round(self.score(entry, prior), 4)
+                }
+                for entry in self.models
+            ],
+            "excluded_by_tier": self.excluded,
+            "next_route": self.route()
+        }
+
+
+def _pool(kind: str, spec: str, primary: str, alternative: str) -> ModelPool:
+    models = parse_pool(spec) or [PoolModel(model) for model in dict.fromkeys([primary, alternative])]
+    return ModelPool(kind, models)
+
+
+pools: Dict[str, ModelPool] = {
+    "chat": _pool("chat", settings.chat_model_pool, settings.chat_model, settings.chat_model_alternative),
+    "image": _pool("image", settings.image_model_pool, settings.image_model, settings.image_model_alternative)
+}
+
+
+def route(kind: str) -> List[str]:
+    """
+    Models for one "chat" or "image" call in the order they should be tried
+    """
+    return pools[kind].route()
+
+
+def get_routing_snapshot() -> Dict[str, Any]:
+    """
+    Routing policy and, per pool, each model's weight, tier, live latency, load and eligibility
+    """
+    return {
+        "policy": settings.routing_policy if settings.routing_policy in ROUTING_POLICIES else "ordered",
+        "max_attempts": settings.routing_max_attempts,
+        "pools": {kind: pool.snapshot() for kind, pool in pools.items()}
+    }
@@ -4,6 +4,10 @@ Provides functions to get model information and manage model configurations
 """
 
 from app.settings import settings
+from app.model_health import get_health_snapshot
+from app.hedging import parse_hedge_delay
+from app.key_pool import key_pool
+from app.model_router import ROUTING_POLICIES, pools, get_routing_snapshot
 from typing import Dict, List, Any
 
 def get_available_models() -> Dict[str, Any]:
@@ -44,9 +48,9 @@ def get_available_models() -> Dict[str, Any]:
         }
     }
 
-def get_model_status() -> Dict[str, str]:
+def get_model_status() -> Dict[str, Any]:
     """
-    Get the current status/configuration of all models
+    Get the current status/configuration of all models, including live circuit breaker state
     """
     return {
         "primary_chat_model": settings.chat_model,
@@ -55,7 +59,15 @@ def get_model_status() -> Dict[str, str]:
         "fallback_image_model": settings.image_model_alternative,
         "image_size": settings.image_size,
         "chat_temperature": str(settings.chat_temperature),
-        "content_temperature": str(settings.content_temperature)
+        "content_temperature": str(settings.content_temperature),
+        "api_keys": len(key_pool.keys),
+        "routing": get_routing_snapshot(),
+        "circuit_breakers": get_health_snapshot([
+            settings.chat_model,
+            settings.chat_model_alternative,
+            settings.image_model,
+            settings.image_model_alternative
+        ])
     }
 
 def get_popular_models() -> Dict[str, List[str]]:
@@ -91,7 +103,8 @@ def validate_model_config() -> Dict[str, Any]:
     warnings = []
     
     # Check if API key is set
-    if not settings.openrouter_api_key or settings.openrouter_api_key == "your_openrouter_api_key_here":
+    keys = [key for key in key_pool.keys if key.key != "your_openrouter_api_key_here"]
+    if not keys:
         issues.append("OpenRouter API key is not set or using placeholder value")
     
     # Check if models are different (recommended)
@@ -101,6 +114,17 @@ def validate_model_config() -> Dict[str, Any]:
     if settings.image_model == settings.image_model_alternative:
         warnings.append("Primary and alternative image models are the same")
     
+    if parse_hedge_delay(settings.hedge_delay) == (None, None):
+        warnings.append(f"Hedge delay ({settings.hedge_delay}) is not seconds or a percentile such as p95; using HEDGE_DEFAULT_DELAY ({settings.hedge_default_delay})")
+    
+    # Check routing configuration
+    if settings.routing_policy not in ROUTING_POLICIES:
+        warnings.append(f"Routing policy ({settings.routing_policy}) is unknown; using \"ordered\". Valid policies: {list(ROUTING_POLICIES)}")
+    
+    for kind, pool in pools.items():
+        if pool.excluded:
+            warnings.append(f"{kind.capitalize()} models excluded by ROUTING_TIERS ({settings.routing_tiers}): {pool.excluded}")
+    
     # Check temperature values
     if not 0.0 <= settings.chat_temperature <= 2.0:
         issues.append(f"Chat temperature ({settings.chat_temperature}) should be between 0.0 and 2.0")
@@ -1,10 +1,14 @@
-from pydantic import BaseModel, Field
-from typing import Optional, Union, Literal
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import Optional, Union, Literal, List
+from typing_extensions import Annotated
+from app.image_processing import IMAGE_VARIANTS
 
 class QATask(BaseModel):
     task: Literal["qa"] = "qa"
     question: str
     context: Optional[str] = None
+    cache: bool = True  # Set to false to skip the response cache and get a fresh sample
+    stream: bool = False  # Stream tokens as Server-Sent Events (also selected by Accept: text/event-stream)
 
 class LatestAnswerTask(BaseModel):
     task: Literal["latest_answer"] = "latest_answer"
@@ -12,12 +16,62 @@ class LatestAnswerTask(BaseModel):
 class ImageGenerationTask(BaseModel):
     task: Literal["image_generation"] = "image_generation"
     prompt: str
+    response_format: Literal["url", "b64_json", "binary"] = "url"  # URL of the stored image, inline base64, or the raw image bytes
+    variant: str = "original"  # A size variant from IMAGE_VARIANTS, e.g. "thumbnail"
+    image_format: Optional[Literal["webp", "jpeg", "png"]] = None  # Re-encode; variants default to IMAGE_VARIANT_FORMAT
+    job: bool = False  # Return a job ID at once and generate in the background (also selected by Prefer: respond-async)
+    priority: int = Field(0, ge=0, le=9)  # Job priority, higher runs first
+    webhook_url: Optional[str] = None  # Job mode: POSTed the finished job
+
+    @field_validator("variant")
+    @classmethod
+    def known_variant(cls, value: str) -> str:
+        value = value.lower()
+        if value not in IMAGE_VARIANTS:
+            raise ValueError(f"Unknown image variant {value}; available: {', '.join(IMAGE_VARIANTS)}")
+        return value
 
 class ContentGenerationTask(BaseModel):
     task: Literal["content_generation"] = "content_generation"
     prompt: str
-    platform: str
+    platform: Optional[str] = None
+    platforms: Optional[List[str]] = Field(None, min_length=1)  # Several platforms in one call; the result maps platform -> variations
+    cache: bool = True  # Set to false to skip the response cache and get a fresh sample
+    stream: bool = False  # Stream tokens as Server-Sent Events (also selected by Accept: text/event-stream); single platform only
+
+    @model_validator(mode="after")
+    def require_platform(self) -> "ContentGenerationTask":
+        if not self.platform and not self.platforms:
+            raise ValueError("Either platform or platforms is required")
+        return self
 
 class TaskResponse(BaseModel):
     task: str
-    result: Union[str, dict]
\ No newline at end of file
+    result: Union[str, dict]
+    metadata: Optional[dict] = None  # e.g. prompt-token savings from QA context retrieval
+
+# Any single task, discriminated on the `task` field
+AITask = Annotated[Union[QATask, LatestAnswerTask, ImageGenerationTask, ContentGenerationTask], Field(discriminator="task")]
+
+class ProfileRequest(BaseModel):
+    mode: Literal["collapsed", "pstats"] = "collapsed"  # Flamegraph collapsed stacks, or a cProfile pstats file
+    task: Optional[Literal["qa", "latest_answer", "image_generation", "content_generation"]] = None  # Only this task type
+    requests: Optional[int] = Field(None, ge=1)  # Stop after this many matching requests
+    seconds: Optional[float] = Field(None, gt=0)  # Stop after this long (capped at PROFILE_MAX_SECONDS)
+    interval_ms: Optional[float] = Field(None, ge=1)  # Sampling interval for "collapsed"
+
+class BatchTaskRequest(BaseModel):
+    tasks: List[AITask] = Field(..., min_length=1)
+    concurrency: Optional[int] = Field(None, ge=1)  # Defaults to BATCH_CONCURRENCY, capped at BATCH_MAX_CONCURRENCY
+    stream: bool = False  # Stream NDJSON results as items finish instead of one response in input order
+
+class BatchItemResult(BaseModel):
+    index: int
+    task: str
+    status_code: int = 200
+    result: Optional[Union[str, dict]] = None
+    metadata: Optional[dict] = None
+    error: Optional[str] = None
+
+class BatchTaskResponse(BaseModel):
+    results: List[BatchItemResult]
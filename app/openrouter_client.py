@@ -0,0 +1,305 @@
+"""
+Shared OpenRouter HTTP client
+Keeps one pooled httpx.AsyncClient for the application lifetime so every service reuses
+warm keep-alive (and HTTP/2) connections instead of paying a TCP+TLS handshake per call
+"""
+
+import json
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+from app.settings import settings
+from app.admission import admission
+from app.metrics import record_usage
+from app.rate_limits import rate_limits
+from app.key_pool import ApiKey, key_pool, QUARANTINE_STATUSES
+from app.timing import record_span
+
+CHAT_COMPLETIONS_PATH = "/chat/completions"
+IMAGE_GENERATIONS_PATH = "/images/generations"
+
+# Events emitted by httpcore once a request has been assigned a connection
+_CONNECTION_ACQUIRED_EVENTS = {
+    "connection.connect_tcp.started",
+    "http11.send_request_headers.started",
+    "http2.send_request_headers.started",
+}
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+class PoolStats:
+    """
+    Counters describing how requests are served by the connection pool
+    """
+    def __init__(self, window: int = 1024):
+        self.requests = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self.connections_opened = 0
+        self.wait_times = deque(maxlen=window)
+
+    def snapshot(self) -> Dict[str, Any]:
+        waits = sorted(self.wait_times)
+        return {
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "waiting_for_connection": self.waiting,
+            "connections_opened": self.connections_opened,
+            "connection_wait_ms": {
+                "avg": round(sum(waits) / len(waits) * 1000, 3) if waits else 0.0,
+                "p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 3) if waits else 0.0,
+                "max": round(waits[-1] * 1000, 3) if waits else 0.0,
+            },
+        }
+
+
+pool_stats = PoolStats()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _build_client() -> httpx.AsyncClient:
+    """
+    Create the pooled client from settings
+    """
+    http2 = settings.openrouter_http2 and _http2_available()
+    if settings.openrouter_http2 and not http2:
+        print("Warning: OPENROUTER_HTTP2 is enabled but the 'h2' package is not installed. Falling back to HTTP/1.1.")
+
+    return httpx.AsyncClient(
+        base_url=settings.openrouter_base_url,
+        headers={
+            "Content-Type": "application/json",
+            "HTTP-Referer": "http://localhost:8000",
+            "X-Title": "AI Task API"
+        },
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.openrouter_max_connections,
+            max_keepalive_connections=settings.openrouter_max_keepalive_connections,
+            keepalive_expiry=settings.openrouter_keepalive_expiry
+        ),
+        timeout=httpx.Timeout(
+            settings.content_timeout,
+            connect=settings.openrouter_connect_timeout,
+            pool=settings.openrouter_pool_timeout
+        )
+    )
+
+
+async def start_client() -> None:
+    """
+    Open the shared client (called from the FastAPI lifespan hook)
+    """
+    global _client
+    if _client is None:
+        _client = _build_client()
+
+
+async def close_client() -> None:
+    """
+    Close the shared client and release pooled connections
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Return the shared client, creating it lazily when used outside the app lifespan (e.g. scripts)
+    """
+    global _client
+    if _client is None:
+        _client = _build_client()
+    return _client
+
+
+def _auth_headers(key: Optional[ApiKey]) -> Dict[str, str]:
+    return {"Authorization": f"Bearer {key.key if key is not None else ''}"}
+
+
+def _retry_with_other_key(status: int) -> bool:
+    """
+    After a quarantining status: whether the call can be retried (429 with rate-limit control enabled,
+    or 401/402 while another key is free)
+    """
+    if status == 429:
+        return settings.rate_limit_enabled
+    return status in QUARANTINE_STATUSES and key_pool.available()
+
+
+async def _before_retry(model: str, status: int, headers: Any, attempt: int, deadline: float) -> None:
+    if status == 429:
+        await rate_limits.retry_after_429(model, headers, attempt, deadline, other_key=key_pool.available())
+
+
+class _ConnectionWaitTrace:
+    """
+    httpcore trace hook measuring how long a request waited for a pooled connection
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.acquired = False
+        pool_stats.requests += 1
+        pool_stats.in_flight += 1
+        pool_stats.waiting += 1
+
+    async def __call__(self, event_name: str, info: Dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.started":
+            pool_stats.connections_opened += 1
+        if not self.acquired and event_name in _CONNECTION_ACQUIRED_EVENTS:
+            self.acquired = True
+            pool_stats.waiting -= 1
+            wait = time.perf_counter() - self.started
+            pool_stats.wait_times.append(wait)
+            record_span("conn_wait", wait)
+
+    def finish(self) -> None:
+        pool_stats.in_flight -= 1
+        if not self.acquired:
+            pool_stats.waiting -= 1
+
+
+def _timeout(timeout: float) -> httpx.Timeout:
+    return httpx.Timeout(timeout, connect=settings.openrouter_connect_timeout, pool=settings.openrouter_pool_timeout)
+
+
+async def post_json(path: str, payload: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    """
+    POST a JSON payload to an OpenRouter endpoint and return the decoded response
+    A 429 is retried on the same model within the rate-limit retry budget (at once with another API
+    key when one is free), and a 401/402 with another key.
+    Raises httpx.HTTPStatusError for other non-2xx responses, and OverloadedError when the model's
+    admission queue is full or it stays rate limited
+    """
+    model = payload.get("model", "")
+    deadline = rate_limits.deadline()
+    attempt = 0
+    while True:
+        await rate_limits.wait_until_ready(model, deadline)
+        async with admission.slot(model):
+            trace = _ConnectionWaitTrace()
+            try:
+                with key_pool.use() as key:
+                    response = await get_client().post(
+                        path,
+                        headers=_auth_headers(key),
+                        json=payload,
+                        timeout=_timeout(timeout),
+                        extensions={"trace": trace}
+                    )
+                    if key is not None:
+                        key.record(response.status_code, response.headers)
+                if not _retry_with_other_key(response.status_code):
+                    response.raise_for_status()
+                    result = response.json()
+                    rate_limits.on_success(model, response.headers, other_key=key_pool.available())
+                    record_usage(model, result.get("usage"))
+                    return result
+            finally:
+                trace.finish()
+        # Back off outside the slot so other calls can use it meanwhile
+        await _before_retry(model, response.status_code, response.headers, attempt, deadline)
+        attempt += 1
+
+
+async def stream_chat(payload: Dict[str, Any], timeout: float) -> AsyncIterator[str]:
+    """
+    Stream a chat completion (OpenRouter `stream: true`) and yield content deltas as they arrive
+    A 429, 401 or 402 (always before the first token) is retried like in post_json.
+    Raises httpx.HTTPStatusError for other non-2xx responses, and OverloadedError (before the first
+    token) when the model's admission queue is full or it stays rate limited
+    """
+    model = payload.get("model", "")
+    deadline = rate_limits.deadline()
+    attempt = 0
+    while True:
+        await rate_limits.wait_until_ready(model, deadline)
+        # The slot is held until the stream is consumed or closed
+        async with admission.slot(model):
+            trace = _ConnectionWaitTrace()
+            try:
+                with key_pool.use() as key:
+                    response = await get_client().send(
+                        get_client().build_request(
+                            "POST",
+                            CHAT_COMPLETIONS_PATH,
+                            headers=_auth_headers(key),
+                            json={**payload, "stream": True},
+                            timeout=_timeout(timeout),
+                            extensions={"trace": trace}
+                        ),
+                        stream=True
+                    )
+                    if key is not None:
+                        key.record(response.status_code, response.headers)
+                    # The key counts as in flight until the stream is consumed or closed
+                    try:
+                        if not _retry_with_other_key(response.status_code):
+                            response.raise_for_status()
+                            rate_limits.on_success(model, response.headers, other_key=key_pool.available())
+                            async for line in response.aiter_lines():
+                                # Skip blank separators and SSE comments such as ": OPENROUTER PROCESSING"
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[len("data:"):].strip()
+                                if data == "[DONE]":
+                                    break
+                                chunk = json.loads(data)
+                                if "error" in chunk:
+                                    raise Exception(f"Upstream stream error: {chunk['error']}")
+                                # OpenRouter reports usage on the final chunk
+                                record_usage(model, chunk.get("usage"))
+                                delta = chunk.get("choices", [{}])[0].get("delta", {}).get("content")
+                                if delta:
+                                    yield delta
+                            return
+                    finally:
+                        await response.aclose()
+            finally:
+                trace.finish()
+        await _before_retry(model, response.status_code, response.headers, attempt, deadline)
+        attempt += 1
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """
+    Report connection pool usage so the limits can be sized under load
+    """
+    active = idle = 0
+    protocols: Dict[str, int] = {}
+    pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+    for connection in getattr(pool, "connections", []):
+        if connection.is_closed():
+            continue
+        if connection.is_idle():
+            idle += 1
+        else:
+            active += 1
+        info = connection.info()
+        protocol = "HTTP/2" if "HTTP/2" in info else "HTTP/1.1" if "HTTP/1.1" in info else "connecting"
+        protocols[protocol] = protocols.get(protocol, 0) + 1
+
+    return {
+        "started": _client is not None,
+        "http2": bool(_client is not None and settings.openrouter_http2 and _http2_available()),
+        "limits": {
+            "max_connections": settings.openrouter_max_connections,
+            "max_keepalive_connections": settings.openrouter_max_keepalive_connections,
+            "keepalive_expiry": settings.openrouter_keepalive_expiry
+        },
+        "connections": {"active": active, "idle": idle, "by_protocol": protocols},
+        **pool_stats.snapshot()
+    }
@@ -0,0 +1,217 @@
+"""
+On-demand profiler for AI Task API
+An admin can profile a running instance for the next N /ai-task/ requests and/or a time window,
+optionally only for one task type:
+  - "collapsed": a sampling thread records the Python stack of every busy thread while a matching
+    request is in flight and produces flamegraph-compatible collapsed stacks
+  - "pstats": cProfile runs on the event loop thread while a matching request is in flight and
+    produces a pstats file (includes any request interleaved on the loop in that window)
+With no session running, the per-request cost is a single attribute check.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Optional
+
+from app.settings import settings
+from app.timing import TimedRoute
+
+# Routes a session can capture; batch bodies have no single task type, so only unfiltered sessions match them
+PROFILED_PATHS = {"/ai-task/", "/ai-task/batch"}
+
+# Leaf frames of threads that are parked rather than doing work
+_IDLE_LEAVES = {("threading.py", "wait"), ("selectors.py", "select"), ("queue.py", "get")}
+
+
+class ProfileSession:
+    """
+    One profiling run: which requests it covers, when it ends, and what it has captured so far
+    """
+    def __init__(self, mode: str, task: Optional[str], requests: Optional[int], seconds: Optional[float], interval: float):
+        self.mode = mode
+        self.task = task
+        self.remaining = requests
+        self.started_at = time.time()
+        self.until = self.started_at + min(seconds or settings.profile_max_seconds, settings.profile_max_seconds)
+        self.interval = interval
+        self.active = 0
+        self.profiled_requests = 0
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.profile: Optional[cProfile.Profile] = None
+        self.stop_event = threading.Event()
+        self.sampler: Optional[threading.Thread] = None
+        if mode == "collapsed":
+            self.sampler = threading.Thread(target=self._sample_loop, name="profiler-sampler", daemon=True)
+            self.sampler.start()
+        else:
+            self.profile = cProfile.Profile()
+
+    @property
+    def exhausted(self) -> bool:
+        return time.time() >= self.until or (self.remaining is not None and self.remaining <= 0)
+
+    def matches(self, task: Optional[str]) -> bool:
+        return not self.exhausted and (self.task is None or self.task == task)
+
+    def begin_request(self) -> None:
+        if self.remaining is not None:
+            self.remaining -= 1
+        self.profiled_requests += 1
+        self.active += 1
+        if self.profile is not None and self.active == 1:
+            self.profile.enable()
+
+    def end_request(self) -> None:
+        self.active -= 1
+        if self.profile is not None and self.active == 0:
+            self.profile.disable()
+
+    def _sample_loop(self) -> None:
+        own_id = threading.get_ident()
+        names = {}
+        while not self.stop_event.wait(self.interval):
+            if self.active <= 0:
+                continue
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+                self.sample_count += 1
+
+    def finish(self) -> Dict[str, Any]:
+        """
+        Stop capturing and build the result
+        """
+        self.stop_event.set()
+        if self.sampler is not None:
+            self.sampler.join()
+        if self.mode == "collapsed":
+            body = "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common()).encode()
+            media_type, filename = "text/plain", "profile.collapsed"
+        else:
+            self.profile.disable()
+            with tempfile.NamedTemporaryFile(suffix=".pstats", delete=False) as tmp:
+                path = tmp.name
+            try:
+                try:
+                    pstats.Stats(self.profile).dump_stats(path)
+                except TypeError:
+                    # No call was profiled
+                    open(path, "wb").close()
+                with open(path, "rb") as f:
+                    body = f.read()
+            finally:
+                os.remove(path)
+            media_type, filename = "application/octet-stream", "profile.pstats"
+        return {
+            "body": body,
+            "media_type": media_type,
+            "filename": filename,
+            "summary": {**self.status(), "finished_at": time.time()}
+        }
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "task": self.task,
+            "started_at": self.started_at,
+            "ends_at": self.until,
+            "requests_remaining": self.remaining,
+            "profiled_requests": self.profiled_requests,
+            "in_flight": self.active,
+            "samples": self.sample_count if self.mode == "collapsed" else None
+        }
+
+
+class Profiler:
+    """
+    Holds the running session (at most one) and the result of the last finished one
+    """
+    def __init__(self):
+        self.session: Optional[ProfileSession] = None
+        self.result: Optional[Dict[str, Any]] = None
+
+    def start(self, mode: str, task: Optional[str], requests: Optional[int], seconds: Optional[float], interval_ms: Optional[float]) -> Dict[str, Any]:
+        if self.session is not None:
+            raise ValueError("A profiling session is already running")
+        interval = (interval_ms or settings.profile_sample_interval_ms) / 1000
+        self.session = ProfileSession(mode, task, requests, seconds, interval)
+        return self.session.status()
+
+    def stop(self) -> Optional[Dict[str, Any]]:
+        session, self.session = self.session, None
+        if session is None:
+            return None
+        self.result = session.finish()
+        return self.result["summary"]
+
+    def _finish_if_done(self) -> None:
+        if self.session is not None and self.session.exhausted and self.session.active == 0:
+            self.stop()
+
+    def status(self) -> Dict[str, Any]:
+        self._finish_if_done()
+        return {
+            "running": self.session.status() if self.session is not None else None,
+            "last_result": self.result["summary"] if self.result is not None else None
+        }
+
+
+profiler = Profiler()
+
+
+async def _peek_task(request) -> Optional[str]:
+    """
+    Task type of an /ai-task/ request body (Starlette caches the body for the real handler)
+    """
+    try:
+        return json.loads(await request.body()).get("task")
+    except (ValueError, AttributeError):
+        return None
+
+
+class ProfiledRoute(TimedRoute):
+    """
+    Route class that lets an active profiling session capture matching requests, from body
+    parsing through response serialization
+    """
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        if self.path not in PROFILED_PATHS:
+            return handler
+
+        async def profiled_handler(request):
+            session = profiler.session
+            if session is None:
+                return await handler(request)
+            task = await _peek_task(request) if session.task is not None else None
+            if not session.matches(task):
+                profiler._finish_if_done()
+                return await handler(request)
+            session.begin_request()
+            try:
+                return await handler(request)
+            finally:
+                session.end_request()
+                profiler._finish_if_done()
+
+        return profiled_handler
@@ -0,0 +1,215 @@
+"""
+Upstream rate-limit control for AI Task API
+OpenRouter answers a rate-limited call with 429 and, usually, Retry-After or X-RateLimit-* headers.
+Instead of treating that like a hard failure (and paying the fallback model), the call is
+retried on the same model after the advertised delay, or a jittered exponential backoff, as long
+as the wait fits RATE_LIMIT_RETRY_BUDGET. Each model's admission concurrency limit follows AIMD:
+it is cut by RATE_LIMIT_DECREASE_FACTOR on a 429 and grows back by RATE_LIMIT_INCREASE slots per
+window of successful calls, up to its configured limit. While a model is known to be limited
+(Retry-After, or X-RateLimit-Remaining: 0 until X-RateLimit-Reset) new calls wait for it to clear
+when that fits their budget, and otherwise move on to the alternative model at once.
+"""
+
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional
+
+from app.admission import OverloadedError, admission
+from app.metrics import UPSTREAM_RATE_LIMITED
+from app.settings import settings
+from app.timing import record_span
+
+
+class UpstreamRateLimited(OverloadedError):
+    """
+    A model kept answering 429 (or is known to be limited) beyond the call's retry budget
+    """
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(model, "rate_limited", retry_after)
+
+
+def _reset_delay(value: str, now: float) -> Optional[float]:
+    """
+    Seconds until an X-RateLimit-Reset value: epoch milliseconds (OpenRouter), epoch seconds or a delay
+    """
+    reset = float(value)
+    if reset > 1e12:
+        return reset / 1000 - now
+    if reset > 1e9:
+        return reset - now
+    return reset
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """
+    Seconds to wait before calling again according to Retry-After (seconds or HTTP date) or
+    X-RateLimit-Reset; None when the response gives no hint
+    """
+    now = time.time()
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    value = headers.get("x-ratelimit-reset")
+    if value:
+        try:
+            return max(0.0, _reset_delay(value, now))
+        except ValueError:
+            pass
+    return None
+
+
+class ModelRateState:
+    """
+    AIMD concurrency window and rate-limit block for one model
+    """
+    def __init__(self, model: str):
+        self.model = model
+        self.limiter = admission.model(model)
+        self.window = float(self.limiter.ceiling)
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+        self.successes = 0
+        self.rate_limited = 0
+        self.retries = 0
+        self.gave_up = 0
+        self.decreases = 0
+
+    def on_success(self, headers: Mapping[str, str], other_key: bool = False) -> None:
+        self.successes += 1
+        if self.window < self.limiter.ceiling:
+            # Additive increase: RATE_LIMIT_INCREASE slots per window's worth of successful calls
+            self.window = min(float(self.limiter.ceiling), self.window + settings.rate_limit_increase / self.window)
+            self.limiter.set_limit(int(self.window))
+        # The quota is spent even though this call got through: hold new calls until it resets
+        # (unless another API key is free; the key pool quarantines the exhausted one)
+        if not other_key and headers.get("x-ratelimit-remaining", "").strip() == "0":
+            delay = parse_retry_after({"x-ratelimit-reset": headers.get("x-ratelimit-reset", "")})
+            if delay:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+
+    def on_rate_limited(self, headers: Mapping[str, str], attempt: int) -> float:
+        """
+        Record a 429 and return how long to wait before retrying
+        """
+        now = time.monotonic()
+        self.rate_limited += 1
+        # Multiplicative decrease, once per burst of 429s from calls that were already in flight
+        if now - self.last_decrease >= settings.rate_limit_decrease_interval:
+            self.last_decrease = now
+            self.decreases += 1
+            self.window = max(float(settings.rate_limit_min_concurrency), self.window * settings.rate_limit_decrease_factor)
+            self.limiter.set_limit(int(self.window))
+
+        retry_after = parse_retry_after(headers)
+        if retry_after is None:
+            # Full jitter keeps calls that were limited together from retrying together
+            delay = random.uniform(0, min(settings.rate_limit_backoff_max, settings.rate_limit_backoff_base * 2 ** attempt))
+            self.blocked_until = max(self.blocked_until, now + delay)
+            return delay
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+        return retry_after + random.uniform(0, settings.rate_limit_jitter)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "concurrency_limit": self.limiter.limit,
+            "configured_limit": self.limiter.ceiling,
+            "window": round(self.window, 2),
+            "blocked_for_seconds": round(max(0.0, self.blocked_until - time.monotonic()), 2),
+            "successes": self.successes,
+            "rate_limited": self.rate_limited,
+            "retries": self.retries,
+            "gave_up": self.gave_up,
+            "decreases": self.decreases
+        }
+
+
+class RateLimitController:
+    """
+    Per-model rate-limit state, and the retry loop used by the OpenRouter client
+    """
+    def __init__(self):
+        self.models: Dict[str, ModelRateState] = {}
+
+    def model(self, model: str) -> ModelRateState:
+        state = self.models.get(model)
+        if state is None:
+            state = self.models[model] = ModelRateState(model)
+        return state
+
+    def deadline(self) -> float:
+        return time.monotonic() + settings.rate_limit_retry_budget
+
+    async def _sleep(self, state: ModelRateState, delay: float, deadline: float) -> None:
+        if time.monotonic() + delay > deadline:
+            state.gave_up += 1
+            UPSTREAM_RATE_LIMITED.inc(model=state.model, action="gave_up")
+            raise UpstreamRateLimited(state.model, delay)
+        await asyncio.sleep(delay)
+        record_span("rate_limit_wait", delay, state.model)
+
+    async def wait_until_ready(self, model: str, deadline: float) -> None:
+        """
+        Wait out a known rate limit on `model`; raises UpstreamRateLimited when it outlasts the budget
+        """
+        if not settings.rate_limit_enabled:
+            return
+        state = self.model(model)
+        delay = state.blocked_until - time.monotonic()
+        if delay > 0:
+            await self._sleep(state, delay + random.uniform(0, settings.rate_limit_jitter), deadline)
+
+    def on_success(self, model: str, headers: Mapping[str, str], other_key: bool = False) -> None:
+        if settings.rate_limit_enabled:
+            self.model(model).on_success(headers, other_key)
+
+    async def retry_after_429(
+        self, model: str, headers: Mapping[str, str], attempt: int, deadline: float, other_key: bool = False
+    ) -> None:
+        """
+        Back off after a 429 on attempt `attempt` (0-based); raises UpstreamRateLimited when out of retries or budget.
+        With `other_key` the limit was the API key's and another key is free: retry at once, leaving the model alone.
+        Only used with RATE_LIMIT_ENABLED; when disabled the client raises a 429 like any other upstream error.
+        """
+        state = self.model(model)
+        if not settings.rate_limit_enabled:
+            # Leave the AIMD window alone: nothing would grow it back while disabled
+            raise UpstreamRateLimited(model, parse_retry_after(headers) or 0.0)
+        if other_key and attempt < settings.rate_limit_max_retries:
+            state.retries += 1
+            UPSTREAM_RATE_LIMITED.inc(model=model, action="rotated_key")
+            return
+        delay = state.on_rate_limited(headers, attempt)
+        if attempt >= settings.rate_limit_max_retries:
+            state.gave_up += 1
+            UPSTREAM_RATE_LIMITED.inc(model=model, action="gave_up")
+            raise UpstreamRateLimited(model, delay)
+        await self._sleep(state, delay, deadline)
+        state.retries += 1
+        UPSTREAM_RATE_LIMITED.inc(model=model, action="retried")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.rate_limit_enabled,
+            "retry_budget": settings.rate_limit_retry_budget,
+            "max_retries": settings.rate_limit_max_retries,
+            "models": {model: state.snapshot() for model, state in self.models.items()}
+        }
+
+
+rate_limits = RateLimitController()
+
+
+def get_rate_limit_stats() -> Dict[str, Any]:
+    """
+    Get per-model AIMD concurrency windows and 429 retry counters
+    """
+    return rate_limits.snapshot()
@@ -0,0 +1,40 @@
+"""
+Fast response path for AI Task API
+Task results are returned as already-built responses, so FastAPI does not re-validate the
+TaskResponse model and run it through jsonable_encoder; the body is encoded with orjson when it
+is installed (falling back to the standard library).
+"""
+
+import json
+from typing import Any
+
+from starlette.responses import JSONResponse
+
+from app.models import TaskResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson (no jsonable_encoder pass; content must be plain JSON types)
+    """
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def task_response(response: TaskResponse, **kwargs: Any) -> FastJSONResponse:
+    """
+    Send a TaskResponse built by the dispatcher without validating and encoding it a second time
+    (same fields as jsonable_encoder would give, including `"metadata": null`)
+    """
+    return FastJSONResponse({"task": response.task, "result": response.result, "metadata": response.metadata}, **kwargs)
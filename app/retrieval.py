@@ -0,0 +1,214 @@
+"""
+Context retrieval for long QA contexts
+A long `context` is split into passages, indexed for BM25 with NumPy and only the best-scoring
+passages that fit RETRIEVAL_TOKEN_BUDGET are sent to the model. Indexes are kept in an LRU keyed
+by the context's hash, so repeated questions over the same document skip re-indexing.
+Token counts are estimated (about 4 characters per token) rather than computed with a tokenizer.
+"""
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+from app.metrics import CONTEXT_TOKENS
+from app.settings import settings
+from app.timing import span
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def _terms(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+def split_passages(text: str, chunk_tokens: int) -> List[str]:
+    """
+    Pack whole sentences into passages of about `chunk_tokens` tokens (oversized sentences are split on words)
+    """
+    passages: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for sentence in _SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        pieces = [sentence]
+        if estimate_tokens(sentence) > chunk_tokens:
+            words = sentence.split()
+            step = max(1, chunk_tokens * 4 // 6)  # ~6 characters per word with its space
+            pieces = [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+        for piece in pieces:
+            tokens = estimate_tokens(piece)
+            if current and current_tokens + tokens > chunk_tokens:
+                passages.append(" ".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += tokens
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+class PassageIndex:
+    """
+    BM25 index over the passages of one context, stored as postings sorted by term id.
+    Each posting's weight (idf times the saturated, length-normalized term frequency) does not
+    depend on the query, so scoring a question is a lookup of its terms plus one bincount.
+    """
+    def __init__(self, passages: List[str]):
+        self.passages = passages
+        self.tokens = np.array([estimate_tokens(p) for p in passages], dtype=np.int64)
+        self.vocabulary: Dict[str, int] = {}
+
+        term_ids: List[int] = []
+        passage_ids: List[int] = []
+        lengths = np.zeros(len(passages), dtype=np.float64)
+        for i, passage in enumerate(passages):
+            terms = _terms(passage)
+            lengths[i] = len(terms)
+            for term in terms:
+                term_ids.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+            passage_ids.extend([i] * len(terms))
+
+        # Collapse (term, passage) occurrences into postings with a term frequency
+        pairs = np.array(term_ids, dtype=np.int64) * len(passages) + np.array(passage_ids, dtype=np.int64)
+        pairs, tf = np.unique(pairs, return_counts=True)
+        self.term_ids = pairs // len(passages)
+        self.passage_ids = pairs % len(passages)
+
+        document_frequency = np.bincount(self.term_ids, minlength=len(self.vocabulary))
+        idf = np.log(1.0 + (len(passages) - document_frequency + 0.5) / (document_frequency + 0.5))
+        average_length = lengths.mean() if len(passages) else 0.0
+        norm = K1 * (1.0 - B + B * lengths[self.passage_ids] / (average_length or 1.0))
+        self.weights = idf[self.term_ids] * tf * (K1 + 1.0) / (tf + norm)
+
+    def scores(self, question: str) -> np.ndarray:
+        query_ids = sorted({self.vocabulary[term] for term in _terms(question) if term in self.vocabulary})
+        if not query_ids:
+            return np.zeros(len(self.passages))
+        starts = np.searchsorted(self.term_ids, query_ids, side="left")
+        ends = np.searchsorted(self.term_ids, query_ids, side="right")
+        postings = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+        return np.bincount(self.passage_ids[postings], weights=self.weights[postings], minlength=len(self.passages))
+
+    def select(self, question: str, token_budget: int, top_k: int) -> List[int]:
+        """
+        Indexes (in document order) of the best passages that fit the budget; the opening passages
+        when nothing in the question matches
+        """
+        if not self.passages:
+            return []
+        scores = self.scores(question)
+        # Stable sort: equal scores keep document order
+        ranked = np.argsort(-scores, kind="stable")
+        matched = scores[ranked[0]] > 0
+        if matched:
+            ranked = ranked[scores[ranked] > 0]
+        chosen: List[int] = []
+        used = 0
+        for i in ranked:
+            if len(chosen) >= top_k:
+                break
+            if used + self.tokens[i] > token_budget:
+                # A lower-ranked shorter passage may still fit; the unmatched fallback stays a contiguous opening
+                if matched:
+                    continue
+                break
+            chosen.append(int(i))
+            used += int(self.tokens[i])
+        return sorted(chosen)
+
+
+class IndexCache:
+    """
+    LRU of passage indexes keyed by the SHA-256 of the context (shared with threadpool workers)
+    """
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, PassageIndex]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[PassageIndex]:
+        with self.lock:
+            index = self.entries.get(key)
+            if index is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return index
+
+    def set(self, key: str, index: PassageIndex) -> None:
+        with self.lock:
+            self.entries[key] = index
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+index_cache = IndexCache(settings.retrieval_cache_size)
+
+
+def _build_index(context: str) -> PassageIndex:
+    return PassageIndex(split_passages(context, settings.retrieval_chunk_tokens))
+
+
+async def retrieve_context(question: str, context: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    The context to send for a question, and retrieval statistics (None when the whole context is sent)
+    """
+    context_tokens = estimate_tokens(context)
+    if not settings.retrieval_enabled or context_tokens <= settings.retrieval_min_tokens:
+        CONTEXT_TOKENS.inc(context_tokens, kind="sent")
+        return context, None
+
+    with span("retrieval"):
+        key = hashlib.sha256(context.encode("utf-8")).hexdigest()
+        index = index_cache.get(key)
+        cached = index is not None
+        if index is None:
+            index = await run_in_threadpool(_build_index, context)
+            index_cache.set(key, index)
+        chosen = index.select(question, settings.retrieval_token_budget, settings.retrieval_top_k)
+    selected = "\n\n".join(index.passages[i] for i in chosen)
+
+    sent_tokens = estimate_tokens(selected)
+    CONTEXT_TOKENS.inc(sent_tokens, kind="sent")
+    CONTEXT_TOKENS.inc(context_tokens - sent_tokens, kind="saved")
+    return selected, {
+        "context_tokens": context_tokens,
+        "sent_context_tokens": sent_tokens,
+        "saved_prompt_tokens": context_tokens - sent_tokens,
+        "passages_total": len(index.passages),
+        "passages_sent": len(chosen),
+        "index_cached": cached
+    }
+
+
+def get_retrieval_stats() -> Dict[str, Any]:
+    return {
+        "enabled": settings.retrieval_enabled,
+        "min_tokens": settings.retrieval_min_tokens,
+        "token_budget": settings.retrieval_token_budget,
+        "top_k": settings.retrieval_top_k,
+        "index_cache": index_cache.snapshot()
+    }
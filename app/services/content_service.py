@@ -1,168 +1,102 @@
-import httpx
-from typing import Optional
-from app.database import ContentRecord, get_db
+from typing import AsyncIterator, Dict, List, Optional
+from app.database import ContentRecord, save_record, save_records
 from app.settings import settings
+from app.openrouter_client import post_json, stream_chat, CHAT_COMPLETIONS_PATH
+from app.hedging import call_with_fallback, stream_with_fallback, AllModelsFailed
+from app.model_router import route
+from app.cache import response_cache
+from app.metrics import RESULTS, CONTENT_REJECTED
 from sqlalchemy.orm import Session
 import json
+import logging
+import re
 
-# Get OpenRouter API key from settings
-OPENROUTER_API_KEY = settings.openrouter_api_key
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
+logger = logging.getLogger(__name__)
 
-def generate_content(prompt: str, platform: str, db: Optional[Session] = None) -> str:
+VARIATIONS = 3
+_ORDINALS = ("first", "second", "third", "fourth", "fifth")
+
+class PlatformTemplate:
     """
-    Generate 3 platform-specific content variations based on a prompt using OpenRouter API with DeepSeek model
+    Instructions for one platform, compiled once at import: rendering only substitutes the prompt
     """
-    # Create platform-specific instructions for 3 variations
-    platform_instructions = {
-        "twitter": f"""
-        Create 3 different engaging tweets about: {prompt}.
-        
-        For each tweet:
-        - Must be under 280 characters
-        - Use different hooks or trending phrases
-        - Include 1–3 relevant trending hashtags
-        - Add appropriate emojis
-        - Make each tweet unique in style (professional, casual, humorous)
-        
-        Format your response as:
-        **Tweet 1:**
-        [first tweet content]
-        
-        **Tweet 2:**
-        [second tweet content]
-        
-        **Tweet 3:**
-        [third tweet content]
-        """,
-    
-        "facebook": f"""
-        Create 3 different Facebook posts about: {prompt}.
-        
-        For each post:
-        - Include engaging hooks
-        - Keep them personal and community-driven
-        - Use different tones (inspirational, conversational, storytelling)
-        - Add appropriate call-to-actions
-        - Include relevant emojis
-        
-        Format your response as:
-        **Post 1:**
-        [first post content]
-        
-        **Post 2:**
-        [second post content]
-        
-        **Post 3:**
-        [third post content]
-        """,
-    
-        "linkedin": f"""
-        Create 3 different professional LinkedIn posts about: {prompt}.
-        
-        For each post:
-        - Use professional, insightful tone
-        - Include thought-provoking questions or insights
-        - Emphasize career growth and industry relevance
-        - Use different structures and approaches
-        - Include industry-relevant hashtags
-        
-        Format your response as:
-        **Post 1:**
-        [first post content]
-        
-        **Post 2:**
-        [second post content]
-        
-        **Post 3:**
-        [third post content]
-        """,
-    
-        "instagram": f"""
-        Create 3 different Instagram captions about: {prompt}.
-        
-        For each caption:
-        - Use different aesthetic and emotional hooks
-        - Make them fun, creative, and visual
-        - Include varied emoji combinations
-        - Add relevant hashtags (mix of niche and popular)
-        - Include different call-to-actions
-        
-        Format your response as:
-        **Caption 1:**
-        [first caption content]
-        
-        **Caption 2:**
-        [second caption content]
-        
-        **Caption 3:**
-        [third caption content]
-        """,
-    
-        "youtube": f"""
-        Create 3 different YouTube video descriptions about: {prompt}.
-        
-        For each description:
-        - Begin with attention-grabbing hooks
-        - Summarize video content differently
-        - Include various call-to-actions
-        - Use SEO-friendly keywords naturally
-        - Add relevant hashtags
-        
-        Format your response as:
-        **Description 1:**
-        [first description content]
-        
-        **Description 2:**
-        [second description content]
-        
-        **Description 3:**
-        [third description content]
-        """,
-    
-        "tiktok": f"""
-        Create 3 different TikTok captions about: {prompt}.
-        
-        For each caption:
-        - Keep them short, punchy, and fun
-        - Use different trendy styles
-        - Include varied trending hashtags
-        - Add different emoji combinations
-        - Use different engagement hooks
-        
-        Format your response as:
-        **Caption 1:**
-        [first caption content]
-        
-        **Caption 2:**
-        [second caption content]
-        
-        **Caption 3:**
-        [third caption content]
-        """,
-    
-        "default": f"""
-        Create 3 different engaging posts about: {prompt}.
-        
-        For each post:
-        - Use different tones and approaches
-        - Make them appealing to broad audiences
-        - Include varied structures and styles
-        
-        Format your response as:
-        **Post 1:**
-        [first post content]
-        
-        **Post 2:**
-        [second post content]
-        
-        **Post 3:**
-        [third post content]
-        """
-    }
+    def __init__(self, description: str, item: str, label: str, rules: List[str]):
+        self.label = label
+        rules_text = "\n".join(f"- {rule}" for rule in rules)
+        format_text = "\n\n".join(
+            f"**{label} {i}:**\n[{_ORDINALS[i - 1]} {item} content]" for i in range(1, VARIATIONS + 1)
+        )
+        # Single-platform instruction; {prompt} is the only placeholder
+        self.instruction = (
+            f"Create {VARIATIONS} different {description} about: {{prompt}}.\n\n"
+            f"For each {item}:\n{rules_text}\n\n"
+            f"Format your response as:\n{format_text}"
+        )
+        # Section of a multi-platform prompt, which states the prompt once for all platforms
+        self.section = f"{VARIATIONS} different {description}. For each {item}:\n{rules_text}"
 
+    def render(self, prompt: str) -> str:
+        return self.instruction.format(prompt=prompt)
+
+PLATFORM_TEMPLATES: Dict[str, PlatformTemplate] = {
+    "twitter": PlatformTemplate("engaging tweets", "tweet", "Tweet", [
+        "Must be under 280 characters",
+        "Use different hooks or trending phrases",
+        "Include 1–3 relevant trending hashtags",
+        "Add appropriate emojis",
+        "Make each tweet unique in style (professional, casual, humorous)"
+    ]),
+    "facebook": PlatformTemplate("Facebook posts", "post", "Post", [
+        "Include engaging hooks",
+        "Keep them personal and community-driven",
+        "Use different tones (inspirational, conversational, storytelling)",
+        "Add appropriate call-to-actions",
+        "Include relevant emojis"
+    ]),
+    "linkedin": PlatformTemplate("professional LinkedIn posts", "post", "Post", [
+        "Use professional, insightful tone",
+        "Include thought-provoking questions or insights",
+        "Emphasize career growth and industry relevance",
+        "Use different structures and approaches",
+        "Include industry-relevant hashtags"
+    ]),
+    "instagram": PlatformTemplate("Instagram captions", "caption", "Caption", [
+        "Use different aesthetic and emotional hooks",
+        "Make them fun, creative, and visual",
+        "Include varied emoji combinations",
+        "Add relevant hashtags (mix of niche and popular)",
+        "Include different call-to-actions"
+    ]),
+    "youtube": PlatformTemplate("YouTube video descriptions", "description", "Description", [
+        "Begin with attention-grabbing hooks",
+        "Summarize video content differently",
+        "Include various call-to-actions",
+        "Use SEO-friendly keywords naturally",
+        "Add relevant hashtags"
+    ]),
+    "tiktok": PlatformTemplate("TikTok captions", "caption", "Caption", [
+        "Keep them short, punchy, and fun",
+        "Use different trendy styles",
+        "Include varied trending hashtags",
+        "Add different emoji combinations",
+        "Use different engagement hooks"
+    ]),
+    "default": PlatformTemplate("engaging posts", "post", "Post", [
+        "Use different tones and approaches",
+        "Make them appealing to broad audiences",
+        "Include varied structures and styles"
+    ])
+}
+
+def _platform_template(platform: str) -> PlatformTemplate:
+    return PLATFORM_TEMPLATES.get(platform.lower(), PLATFORM_TEMPLATES["default"])
+
+def _build_payload(prompt: str, platform: str) -> dict:
+    """
+    Prepare the OpenRouter payload with the platform-specific instructions
+    """
     # Get the instruction for the platform
-    instruction = platform_instructions.get(platform.lower(), platform_instructions["default"])
+    instruction = _platform_template(platform).render(prompt)
     
     # Prepare the payload for OpenRouter API
     payload = {
@@ -180,70 +114,272 @@ def generate_content(prompt: str, platform: str, db: Optional[Session] = None) -
         "temperature": settings.content_temperature,
         "max_tokens": settings.content_max_tokens
     }
-    
-    # Set up headers
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "http://localhost:8000",
-        "X-Title": "AI Task API"
+    return payload
+
+def _build_multi_payload(prompt: str, platforms: List[str]) -> dict:
+    """
+    Prepare one OpenRouter payload asking for every platform's variations as a JSON object
+    """
+    sections = "\n\n".join(f"{platform}: {_platform_template(platform).section}" for platform in platforms)
+    example = ", ".join(f'"{platform}": ["...", "...", "..."]' for platform in platforms)
+    instruction = (
+        f"Create social media content about: {prompt}.\n\n{sections}\n\n"
+        f"Return a JSON object with exactly these keys: {', '.join(platforms)}. "
+        f"Each value is a list of {VARIATIONS} strings, one per variation, for example: {{{example}}}"
+    )
+    return {
+        "model": settings.chat_model,
+        "messages": [
+            {
+                "role": "system",
+                "content": f"You are a creative content writer for social media. Create {VARIATIONS} engaging, platform-appropriate content variations per platform that are distinct and unique from each other. Respond with JSON only."
+            },
+            {
+                "role": "user",
+                "content": instruction
+            }
+        ],
+        "response_format": {"type": "json_object"},
+        "temperature": settings.content_temperature,
+        # The answer carries every platform's variations
+        "max_tokens": settings.content_max_tokens * len(platforms)
     }
-    
-    # Make the API call using httpx
+
+# Template-based content used when both models fail; {prompt} is the only placeholder
+TEMPLATE_CONTENT: Dict[str, str] = {
+    "twitter": "**Tweet 1:**\n🚀 Exciting developments in {prompt}! The future is here. #AI #Tech #Innovation\n\n**Tweet 2:**\n✨ Just discovered something amazing about {prompt}! Mind = blown 🤯 #Technology #Future\n\n**Tweet 3:**\n🔥 {prompt} is changing everything we know! Ready for this? #Innovation #TechNews",
+    "facebook": "**Post 1:**\n🌟 {prompt}\n\nJust discovered something amazing about this topic! The possibilities are endless when technology meets creativity. What are your thoughts?\n\n**Post 2:**\nWow! {prompt} is incredible! 🚀 The future is happening now and it's more exciting than we imagined. Can't wait to see what comes next!\n\n**Post 3:**\nFriends, have you heard about {prompt}? It's absolutely fascinating how this technology is evolving. Drop a comment with your thoughts!",
+    "linkedin": "**Post 1:**\n🔍 Insights on {prompt}\n\nAs we navigate the evolving landscape of technology, it's crucial to stay informed about developments like this. What's your perspective?\n\n**Post 2:**\n💡 The impact of {prompt} on our industry\n\nThis advancement represents a significant shift in how we approach innovation. How is your organization adapting?\n\n**Post 3:**\n🚀 Future implications of {prompt}\n\nThe intersection of technology and human creativity continues to yield remarkable results. Thoughts on the opportunities ahead?",
+    "instagram": "**Caption 1:**\n✨ {prompt} ✨\n\nWhen technology meets creativity, magic happens! 🎨🤖\n#AI #TechLife #Innovation\n\n**Caption 2:**\n🔥 Mind blown by {prompt} today! 🤯\n\nThe future is literally happening right now ✨\n#FutureTech #Innovation #DigitalLife\n\n**Caption 3:**\n💫 {prompt} vibes 💫\n\nThis is why I love technology - it never stops amazing us! 🚀\n#TechLove #Innovation #Future",
+    "youtube": "**Description 1:**\n🎥 {prompt} - Everything You Need to Know!\n\nIn this video, we explore the fascinating world of this technology. Don't forget to like and subscribe!\n\n**Description 2:**\n🔥 The Future is Here: {prompt} Explained\n\nJoin me as we dive deep into this incredible advancement. Subscribe for more tech content!\n\n**Description 3:**\n⚡ {prompt}: Game Changer or Hype?\n\nLet's analyze this technology together. Hit that notification bell for updates!",
+    "tiktok": "**Caption 1:**\n🔥 {prompt} is trending! ✨ Mind = blown 🤯 #AI #Tech #Viral\n\n**Caption 2:**\nPOV: You just discovered {prompt} 🚀 This changes everything! #TechTok #Innovation\n\n**Caption 3:**\nWait until you see this! {prompt} is insane 🤯 #FYP #Technology #MindBlown",
+    "default": "**Post 1:**\nDiscover the amazing world of {prompt}! This cutting-edge topic represents the future of technology and innovation.\n\n**Post 2:**\nExploring {prompt} - where creativity meets technology. The possibilities are truly endless!\n\n**Post 3:**\nThe fascinating realm of {prompt} continues to evolve. What an exciting time to be alive!"
+}
+
+def _template_content(prompt: str, platform: str) -> str:
+    """
+    Template-based content used when both models fail
+    """
+    return TEMPLATE_CONTENT.get(platform.lower(), TEMPLATE_CONTENT["default"]).format(prompt=prompt)
+
+_VARIATION_HEADING = re.compile(r"\*\*(?:Post|Tweet|Caption|Description) \d+:\*\*\s*")
+
+def _split_variations(content: str) -> List[str]:
+    return [part.strip() for part in _VARIATION_HEADING.split(content) if part.strip()]
+
+def _format_variations(platform: str, variations: List[str]) -> str:
+    """
+    Variations in the single-platform `**Label n:**` layout, as stored in content history
+    """
+    label = _platform_template(platform).label
+    return "\n\n".join(f"**{label} {i}:**\n{text}" for i, text in enumerate(variations, 1))
+
+def _parse_variations(content: str, platforms: List[str]) -> Dict[str, List[str]]:
+    """
+    Platforms whose variations could be read from a JSON answer (code fences and surrounding text are ignored)
+    """
+    start, end = content.find("{"), content.rfind("}")
+    if start == -1 or end <= start:
+        return {}
     try:
-        with httpx.Client() as client:
-            response = client.post(OPENROUTER_API_URL, headers=headers, json=payload, timeout=60.0)
-            response.raise_for_status()
-            result = response.json()
-            content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
-            
-            # Debug logging
-            print(f"API Response for {platform}: {len(content)} characters")
-            if len(content) < 100:
-                print(f"Warning: Short response for {platform}: {content}")
-            
-            # If content is empty or too short, use fallback
-            if not content.strip() or len(content.strip()) < 50:
-                raise Exception("Empty or incomplete response from API")
-                
-    except Exception as e:
-        # Try fallback model if primary model fails
+        data = json.loads(content[start:end + 1])
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    data = {str(key).lower(): value for key, value in data.items()}
+    
+    parsed = {}
+    for platform in platforms:
+        value = data.get(platform)
+        if isinstance(value, dict):
+            value = value.get("variations")
+        if not isinstance(value, list):
+            continue
+        variations = [item.strip() for item in value if isinstance(item, str) and item.strip()]
+        if len(variations) >= VARIATIONS:
+            parsed[platform] = variations[:VARIATIONS]
+    return parsed
+
+async def generate_content(prompt: str, platform: str, db: Optional[Session] = None, use_cache: bool = True) -> str:
+    """
+    Generate 3 platform-specific content variations based on a prompt using OpenRouter API with DeepSeek model
+    """
+    payload = _build_payload(prompt, platform)
+    models = route("chat")
+    
+    async def generate(model: str) -> str:
+        result = await post_json(CHAT_COMPLETIONS_PATH, {**payload, "model": model}, timeout=settings.content_timeout)
+        content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
+        
+        # If content is empty or too short, treat this model's answer as unacceptable
+        if not content.strip() or len(content.strip()) < 50:
+            CONTENT_REJECTED.inc(reason="short")
+            raise Exception(f"Empty or incomplete response from {model}")
+        return content
+    
+    # Serve repeated prompts from the response cache unless the caller opted out
+    cache_key = _cache_key(prompt, platform)
+    content = await response_cache.get(cache_key) if use_cache else None
+    source = "cache"
+    
+    # Call the routed model, falling back to (or hedging with) the next one in the pool
+    if content is None:
         try:
-            payload["model"] = settings.chat_model_alternative
-            with httpx.Client() as client:
-                response = client.post(OPENROUTER_API_URL, headers=headers, json=payload, timeout=60.0)
-                response.raise_for_status()
-                result = response.json()
-                content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
-                
-                print(f"Fallback API Response for {platform}: {len(content)} characters")
-                
-                if content.strip() and len(content.strip()) >= 50:
-                    content += f"\n\n(Generated using fallback model: {settings.chat_model_alternative})"
-                else:
-                    raise Exception("Empty or incomplete response from fallback model")
-                    
-        except Exception as fallback_error:
+            content, model = await call_with_fallback("content_generation", models, generate)
+            source = "primary"
+            if model != models[0]:
+                source = "fallback"
+                content += f"\n\n(Generated using fallback model: {model})"
+            if use_cache:
+                await response_cache.set(cache_key, content)
+        
+        except AllModelsFailed:
             # Fallback to template-based content if both API calls fail
-            platform_templates = {
-                "twitter": f"**Tweet 1:**\n🚀 Exciting developments in {prompt}! The future is here. #AI #Tech #Innovation\n\n**Tweet 2:**\n✨ Just discovered something amazing about {prompt}! Mind = blown 🤯 #Technology #Future\n\n**Tweet 3:**\n🔥 {prompt} is changing everything we know! Ready for this? #Innovation #TechNews",
-                "facebook": f"**Post 1:**\n🌟 {prompt}\n\nJust discovered something amazing about this topic! The possibilities are endless when technology meets creativity. What are your thoughts?\n\n**Post 2:**\nWow! {prompt} is incredible! 🚀 The future is happening now and it's more exciting than we imagined. Can't wait to see what comes next!\n\n**Post 3:**\nFriends, have you heard about {prompt}? It's absolutely fascinating how this technology is evolving. Drop a comment with your thoughts!",
-                "linkedin": f"**Post 1:**\n🔍 Insights on {prompt}\n\nAs we navigate the evolving landscape of technology, it's crucial to stay informed about developments like this. What's your perspective?\n\n**Post 2:**\n💡 The impact of {prompt} on our industry\n\nThis advancement represents a significant shift in how we approach innovation. How is your organization adapting?\n\n**Post 3:**\n🚀 Future implications of {prompt}\n\nThe intersection of technology and human creativity continues to yield remarkable results. Thoughts on the opportunities ahead?",
-                "instagram": f"**Caption 1:**\n✨ {prompt} ✨\n\nWhen technology meets creativity, magic happens! 🎨🤖\n#AI #TechLife #Innovation\n\n**Caption 2:**\n🔥 Mind blown by {prompt} today! 🤯\n\nThe future is literally happening right now ✨\n#FutureTech #Innovation #DigitalLife\n\n**Caption 3:**\n💫 {prompt} vibes 💫\n\nThis is why I love technology - it never stops amazing us! 🚀\n#TechLove #Innovation #Future",
-                "youtube": f"**Description 1:**\n🎥 {prompt} - Everything You Need to Know!\n\nIn this video, we explore the fascinating world of this technology. Don't forget to like and subscribe!\n\n**Description 2:**\n🔥 The Future is Here: {prompt} Explained\n\nJoin me as we dive deep into this incredible advancement. Subscribe for more tech content!\n\n**Description 3:**\n⚡ {prompt}: Game Changer or Hype?\n\nLet's analyze this technology together. Hit that notification bell for updates!",
-                "tiktok": f"**Caption 1:**\n🔥 {prompt} is trending! ✨ Mind = blown 🤯 #AI #Tech #Viral\n\n**Caption 2:**\nPOV: You just discovered {prompt} 🚀 This changes everything! #TechTok #Innovation\n\n**Caption 3:**\nWait until you see this! {prompt} is insane 🤯 #FYP #Technology #MindBlown",
-                "default": f"**Post 1:**\nDiscover the amazing world of {prompt}! This cutting-edge topic represents the future of technology and innovation.\n\n**Post 2:**\nExploring {prompt} - where creativity meets technology. The possibilities are truly endless!\n\n**Post 3:**\nThe fascinating realm of {prompt} continues to evolve. What an exciting time to be alive!"
-            }
-            content = platform_templates.get(platform.lower(), platform_templates["default"])
+            source = "template"
+            content = _template_content(prompt, platform)
+    RESULTS.inc(task="content_generation", source=source)
     
     # Store in database
     if db:
         content_record = ContentRecord(prompt=prompt, platform=platform, content=content)
-        db.add(content_record)
-        db.commit()
-        db.refresh(content_record)
+        await save_record(db, content_record)
+    
+    _check_post_count(content, platform)
     
-    # Final validation - ensure content has multiple posts
+    return content
+
+async def generate_multi_content(prompt: str, platforms: List[str], db: Optional[Session] = None, use_cache: bool = True) -> Dict[str, List[str]]:
+    """
+    Generate 3 variations for each of several platforms in one upstream call with JSON output.
+    Platforms whose part of the answer cannot be parsed are re-requested on their own (up to
+    CONTENT_MULTI_RETRIES times) before falling back to templates; one ContentRecord per platform
+    is stored in a single transaction.
+    """
+    platforms = list(dict.fromkeys(platform.strip().lower() for platform in platforms if platform.strip()))
+    results: Dict[str, List[str]] = {}
+    sources: Dict[str, str] = {}
+    
+    # Serve platforms generated before for this prompt from the response cache
+    if use_cache:
+        for platform in platforms:
+            cached = await response_cache.get(_multi_cache_key(prompt, platform))
+            if cached is not None:
+                results[platform] = json.loads(cached)
+                sources[platform] = "cache"
+    
+    missing = [platform for platform in platforms if platform not in results]
+    attempts = 0
+    while missing and attempts <= settings.content_multi_retries:
+        attempts += 1
+        payload = _build_multi_payload(prompt, missing)
+        
+        async def generate(model: str, payload: dict = payload, requested: List[str] = missing) -> Dict[str, List[str]]:
+            result = await post_json(CHAT_COMPLETIONS_PATH, {**payload, "model": model}, timeout=settings.content_timeout)
+            content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
+            parsed = _parse_variations(content, requested)
+            # Nothing usable: let the alternative model try
+            if not parsed:
+                raise Exception(f"No parseable platform content in the response from {model}")
+            return parsed
+        
+        models = route("chat")
+        try:
+            parsed, model = await call_with_fallback("content_generation", models, generate)
+        except AllModelsFailed:
+            break
+        source = "primary" if model == models[0] else "fallback"
+        for platform, variations in parsed.items():
+            results[platform] = variations
+            sources[platform] = source
+            if use_cache:
+                await response_cache.set(_multi_cache_key(prompt, platform), json.dumps(variations, ensure_ascii=False))
+        missing = [platform for platform in missing if platform not in results]
+        if missing:
+            CONTENT_REJECTED.inc(len(missing), reason="unparseable")
+    
+    # Fallback to template-based content for platforms that never parsed
+    for platform in missing:
+        results[platform] = _split_variations(_template_content(prompt, platform))
+        sources[platform] = "template"
+    for platform in platforms:
+        RESULTS.inc(task="content_generation", source=sources[platform])
+    
+    # Store every platform in one transaction
+    if db:
+        records = [
+            ContentRecord(prompt=prompt, platform=platform, content=_format_variations(platform, results[platform]))
+            for platform in platforms
+        ]
+        await save_records(db, records)
+    
+    return {platform: results[platform] for platform in platforms}
+
+async def stream_content(prompt: str, platform: str, db: Optional[Session] = None, use_cache: bool = True) -> AsyncIterator[str]:
+    """
+    Streaming variant of generate_content: yields tokens as they arrive and stores the
+    assembled content once the stream completes
+    """
+    payload = _build_payload(prompt, platform)
+    cache_key = _cache_key(prompt, platform)
+    cached = await response_cache.get(cache_key) if use_cache else None
+    
+    parts = []
+    source = "cache"
+    if cached is not None:
+        parts.append(cached)
+        yield cached
+    else:
+        try:
+            models = route("chat")
+            tokens, model = await stream_with_fallback(
+                "content_generation",
+                models,
+                lambda model: stream_chat({**payload, "model": model}, timeout=settings.content_timeout)
+            )
+            source = "primary" if model == models[0] else "fallback"
+            async for token in tokens:
+                parts.append(token)
+                yield token
+            if model != models[0]:
+                suffix = f"\n\n(Generated using fallback model: {model})"
+                parts.append(suffix)
+                yield suffix
+            if use_cache and len("".join(parts).strip()) >= 50:
+                await response_cache.set(cache_key, "".join(parts))
+        except AllModelsFailed:
+            # Fallback to template-based content if both streams fail before their first token
+            source = "template"
+            content = _template_content(prompt, platform)
+            parts.append(content)
+            yield content
+    RESULTS.inc(task="content_generation", source=source)
+    
+    content = "".join(parts)
+    
+    # Store the assembled content in database
+    if db:
+        content_record = ContentRecord(prompt=prompt, platform=platform, content=content)
+        await save_record(db, content_record)
+    
+    _check_post_count(content, platform)
+
+def _cache_key(prompt: str, platform: str) -> str:
+    return response_cache.make_key(
+        "content_generation", settings.chat_model, settings.content_temperature, settings.content_max_tokens,
+        prompt, platform=platform.lower()
+    )
+
+def _multi_cache_key(prompt: str, platform: str) -> str:
+    return response_cache.make_key(
+        "content_generation", settings.chat_model, settings.content_temperature, settings.content_max_tokens,
+        prompt, platform=platform, format="json"
+    )
+
+def _check_post_count(content: str, platform: str) -> None:
+    """
+    Final validation - ensure content has multiple posts
+    """
     post_count = max(
         content.count("**Post"),
         content.count("**Tweet"), 
@@ -252,8 +388,5 @@ def generate_content(prompt: str, platform: str, db: Optional[Session] = None) -
     )
     
     if post_count < 3:
-        print(f"Warning: Only {post_count} posts detected in final content for {platform}")
-        print(f"Content length: {len(content)}")
-        print(f"Content preview: {content[:200]}...")
-    
-    return content
\ No newline at end of file
+        CONTENT_REJECTED.inc(reason="few_posts")
+        logger.debug("Only %d posts detected in %d characters of %s content", post_count, len(content), platform)
@@ -1,20 +1,48 @@
-import httpx
 import base64
-from io import BytesIO
 from typing import Optional
-from PIL import Image
-from app.database import ImageRecord, get_db
+from app.database import ImageRecord, save_record
 from app.settings import settings
+from app.openrouter_client import post_json, IMAGE_GENERATIONS_PATH
+from app.hedging import call_with_fallback, AllModelsFailed
+from app.model_router import route
+from app.blob_store import blob_store
+from app.image_processing import render_placeholder
+from app.image_variants import run_image_work, variant_digest
+from app.metrics import RESULTS
+from app.timing import span, record_span
 from sqlalchemy.orm import Session
-import json
+from starlette.concurrency import run_in_threadpool
+import logging
+import time
 
-# Get OpenRouter API key from settings
-OPENROUTER_API_KEY = settings.openrouter_api_key
-OPENROUTER_IMAGE_API_URL = "https://openrouter.ai/api/v1/images/generations"
+logger = logging.getLogger(__name__)
 
-def generate_image(prompt: str, db: Optional[Session] = None) -> str:
+# Stored images are served from GET {IMAGE_ROUTE}/{digest}
+IMAGE_ROUTE = "/ai-task/images"
+
+def image_url(digest: str) -> str:
+    return f"{IMAGE_ROUTE}/{digest}"
+
+def image_media_type(header: bytes) -> str:
+    """
+    Content type of an image from its first bytes (upstream models may return PNG, JPEG or WebP)
+    """
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header.startswith(b"RIFF") and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header.startswith(b"GIF8"):
+        return "image/gif"
+    return "image/png"
+
+async def generate_image(
+    prompt: str, db: Optional[Session] = None, response_format: str = "url", variant: str = "original", image_format: Optional[str] = None
+) -> str:
     """
-    Generate an image based on a prompt using OpenRouter API with DALL-E model and return as base64 string
+    Generate an image based on a prompt using OpenRouter API with DALL-E model, store it in the blob store
+    and return its URL (or the base64 string when response_format is "b64_json"; "binary" also returns
+    the URL, which the route resolves to the stored bytes). A `variant`/`image_format` other than the
+    original returns that rendition instead.
     """
     # Prepare the payload for OpenRouter API
     payload = {
@@ -25,99 +53,60 @@ def generate_image(prompt: str, db: Optional[Session] = None) -> str:
         "response_format": "b64_json"
     }
     
-    # Set up headers
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "http://localhost:8000",
-        "X-Title": "AI Task API"
-    }
+    async def request_image(model: str) -> str:
+        result = await post_json(IMAGE_GENERATIONS_PATH, {**payload, "model": model}, timeout=settings.image_timeout)
+        
+        # Extract base64 image data
+        if "data" in result and len(result["data"]) > 0:
+            img_str = result["data"][0].get("b64_json", "")
+            if not img_str:
+                raise Exception(f"No image data received from {model}")
+            return img_str
+        raise Exception(f"Invalid response format from {model}")
     
-    # Make the API call using httpx
+    img_str, img_bytes = "", None
+    # Call the routed model, falling back to (or hedging with) the next one in the pool
+    models = route("image")
     try:
-        with httpx.Client() as client:
-            response = client.post(OPENROUTER_IMAGE_API_URL, headers=headers, json=payload, timeout=60.0)
-            response.raise_for_status()
-            result = response.json()
-            
-            # Extract base64 image data
-            if "data" in result and len(result["data"]) > 0:
-                img_str = result["data"][0].get("b64_json", "")
-                if not img_str:
-                    raise Exception("No image data received from API")
-            else:
-                raise Exception("Invalid response format from API")
-                
-    except Exception as e:
-        print(f"Primary image model ({settings.image_model}) failed: {str(e)}")
-        # Try fallback model if primary model fails
+        img_str, model = await call_with_fallback("image_generation", models, request_image)
+        RESULTS.inc(task="image_generation", source="primary" if model == models[0] else "fallback")
+    
+    except AllModelsFailed as failure:
+        logger.debug("Image models failed: %s", failure.describe(models))
+        # Create a placeholder image if both API calls fail (drawn in the image pool, off the event loop)
+        placeholder_started = time.perf_counter()
         try:
-            payload["model"] = settings.image_model_alternative
-            with httpx.Client() as client:
-                response = client.post(OPENROUTER_IMAGE_API_URL, headers=headers, json=payload, timeout=60.0)
-                response.raise_for_status()
-                result = response.json()
-                
-                # Extract base64 image data
-                if "data" in result and len(result["data"]) > 0:
-                    img_str = result["data"][0].get("b64_json", "")
-                    if not img_str:
-                        raise Exception("No image data received from fallback API")
-                    print(f"Image generated successfully using fallback model: {settings.image_model_alternative}")
-                else:
-                    raise Exception("Invalid response format from fallback API")
-                    
-        except Exception as fallback_error:
-            print(f"Fallback image model ({settings.image_model_alternative}) also failed: {str(fallback_error)}")
-            # Create a placeholder image if both API calls fail
-            try:
-                # Create a colorful placeholder with text
-                image = Image.new('RGB', (512, 512), color=(64, 128, 255))  # type: ignore
-                
-                # Try to add text if PIL supports it
-                try:
-                    from PIL import ImageDraw, ImageFont
-                    draw = ImageDraw.Draw(image)
-                    
-                    # Try to use a default font
-                    try:
-                        font = ImageFont.truetype("arial.ttf", 32)
-                    except:
-                        font = ImageFont.load_default()
-                    
-                    # Add text to image
-                    text_lines = [
-                        "AI Generated Image",
-                        f"Prompt: {prompt[:30]}...",
-                        "(Placeholder - API Unavailable)"
-                    ]
-                    
-                    y_offset = 150
-                    for line in text_lines:
-                        bbox = draw.textbbox((0, 0), line, font=font)
-                        text_width = bbox[2] - bbox[0]
-                        x = (512 - text_width) // 2
-                        draw.text((x, y_offset), line, fill=(255, 255, 255), font=font)
-                        y_offset += 60
-                        
-                except ImportError:
-                    # If PIL doesn't support text drawing, just use plain color
-                    pass
-                
-                # Convert to base64
-                buffered = BytesIO()
-                image.save(buffered, format="PNG")
-                img_str = base64.b64encode(buffered.getvalue()).decode()
-                
-            except Exception as final_fallback_error:
-                # Ultimate fallback - return error message
-                return f"Error generating image: Primary model ({settings.image_model}) failed: {str(e)}. Fallback model ({settings.image_model_alternative}) failed: {str(fallback_error)}. Placeholder generation failed: {str(final_fallback_error)}"
+            img_bytes = await run_image_work(render_placeholder, prompt)
+            record_span("placeholder", time.perf_counter() - placeholder_started)
+            RESULTS.inc(task="image_generation", source="placeholder")
+        except Exception as final_fallback_error:
+            # Ultimate fallback - return error message
+            RESULTS.inc(task="image_generation", source="error")
+            return f"Error generating image: Models failed: {failure.describe(models)}. Placeholder generation failed: {str(final_fallback_error)}"
+    
+    # Decode once and keep the raw bytes in the blob store; the database only stores the digest
+    if img_bytes is None:
+        with span("image_decode"):
+            img_bytes = base64.b64decode(img_str)
+    with span("blob_write"):
+        digest = await run_in_threadpool(blob_store.put, img_bytes)
     
     # Store in database
     if db:
-        image_record = ImageRecord(prompt=prompt, image_data=img_str)
-        db.add(image_record)
-        db.commit()
-        db.refresh(image_record)
+        image_record = ImageRecord(prompt=prompt, blob_hash=digest)
+        await save_record(db, image_record)
+    
+    # The record keeps the original; the caller gets the requested rendition
+    if variant != "original" or image_format:
+        variant_hash = await variant_digest(digest, variant, image_format, img_bytes)
+        if variant_hash != digest:
+            digest, img_str = variant_hash, ""
+            if response_format == "b64_json":
+                img_bytes = await run_in_threadpool(blob_store.get, digest)
     
-    return img_str
\ No newline at end of file
+    if response_format == "b64_json":
+        if img_str:
+            return img_str
+        with span("image_encode"):
+            return base64.b64encode(img_bytes).decode()
+    return image_url(digest)
@@ -1,29 +1,36 @@
-import httpx
-from typing import Optional
-from app.database import QAHistory, get_db
+from typing import AsyncIterator, Dict, Optional
+from app.database import QAHistory, save_record
 from app.settings import settings
+from app.openrouter_client import post_json, stream_chat, CHAT_COMPLETIONS_PATH
+from app.hedging import call_with_fallback, stream_with_fallback, AllModelsFailed
+from app.model_router import route
+from app.cache import response_cache
+from app.latest_answer import latest_answer
+from app.metrics import RESULTS
+from app.retrieval import retrieve_context
 from sqlalchemy.orm import Session
-import json
 
-# Get OpenRouter API key from settings
-OPENROUTER_API_KEY = settings.openrouter_api_key
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
+DEFAULT_CONTEXT = "Artificial intelligence (AI) is intelligence demonstrated by machines, in contrast to the natural intelligence displayed by humans and animals. Leading AI textbooks define the field as the study of \"intelligent agents\": any device that perceives its environment and takes actions that maximize its chance of successfully achieving its goals."
 
-def perform_qa(question: str, context: Optional[str] = None, db: Optional[Session] = None) -> str:
+def _cache_key(question: str, context: str) -> str:
+    return response_cache.make_key("qa", settings.chat_model, settings.chat_temperature, settings.chat_max_tokens, question, context)
+
+async def _build_payload(question: str, context: str, metadata: Optional[Dict] = None) -> Dict:
     """
-    Perform Q&A using OpenRouter API with DeepSeek model
+    Prepare the OpenRouter payload. Long contexts are reduced to the passages relevant to the
+    question; the token savings are added to `metadata` when given.
     """
-    # If no context provided, use a default one
-    if not context:
-        context = "Artificial intelligence (AI) is intelligence demonstrated by machines, in contrast to the natural intelligence displayed by humans and animals. Leading AI textbooks define the field as the study of \"intelligent agents\": any device that perceives its environment and takes actions that maximize its chance of successfully achieving its goals."
-    
+    prompt_context, retrieval = await retrieve_context(question, context)
+    if metadata is not None and retrieval is not None:
+        metadata["retrieval"] = retrieval
+
     # Prepare the payload for OpenRouter API
     payload = {
         "model": settings.chat_model,
         "messages": [
             {
                 "role": "system",
-                "content": f"You are a helpful AI assistant. Use the following context to answer questions accurately: {context}"
+                "content": f"You are a helpful AI assistant. Use the following context to answer questions accurately: {prompt_context}"
             },
             {
                 "role": "user",
@@ -33,45 +40,106 @@ def perform_qa(question: str, context: Optional[str] = None, db: Optional[Sessio
         "temperature": settings.chat_temperature,
         "max_tokens": settings.chat_max_tokens
     }
-    
-    # Set up headers
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "http://localhost:8000",
-        "X-Title": "AI Task API"
-    }
-    
-    # Make the API call using httpx
-    try:
-        with httpx.Client() as client:
-            response = client.post(OPENROUTER_API_URL, headers=headers, json=payload, timeout=30.0)
-            response.raise_for_status()
-            result = response.json()
-            answer = result.get("choices", [{}])[0].get("message", {}).get("content", "No answer found")
-    except Exception as e:
-        # Try fallback model if primary model fails
+    return payload
+
+def _failure_answer(question: str, failure: AllModelsFailed) -> str:
+    return f"Error occurred while fetching answer from AI: {str(failure.primary_error)}. Fallback model also failed: {str(failure.fallback_error)}. This is a simulated answer based on the question: {question}"
+
+async def perform_qa(
+    question: str, context: Optional[str] = None, db: Optional[Session] = None, use_cache: bool = True, metadata: Optional[Dict] = None
+) -> str:
+    """
+    Perform Q&A using OpenRouter API with DeepSeek model
+    """
+    # If no context provided, use a default one
+    context = context or DEFAULT_CONTEXT
+
+    # Serve repeated questions from the response cache unless the caller opted out.
+    # The key uses the raw context, so a hit skips passage retrieval entirely.
+    cache_key = _cache_key(question, context)
+    answer = await response_cache.get(cache_key) if use_cache else None
+    source = "cache"
+
+    # Call the routed model, falling back to (or hedging with) the next one in the pool
+    if answer is None:
+        payload = await _build_payload(question, context, metadata)
+
+        async def ask(model: str) -> str:
+            result = await post_json(CHAT_COMPLETIONS_PATH, {**payload, "model": model}, timeout=settings.qa_timeout)
+            return result.get("choices", [{}])[0].get("message", {}).get("content", "No answer found")
+
         try:
-            payload["model"] = settings.chat_model_alternative
-            with httpx.Client() as client:
-                response = client.post(OPENROUTER_API_URL, headers=headers, json=payload, timeout=30.0)
-                response.raise_for_status()
-                result = response.json()
-                answer = result.get("choices", [{}])[0].get("message", {}).get("content", "No answer found")
-                answer += f" (Generated using fallback model: {settings.chat_model_alternative})"
-        except Exception as fallback_error:
+            models = route("chat")
+            answer, model = await call_with_fallback("qa", models, ask)
+            source = "primary"
+            if model != models[0]:
+                source = "fallback"
+                answer += f" (Generated using fallback model: {model})"
+            if use_cache:
+                await response_cache.set(cache_key, answer)
+        except AllModelsFailed as failure:
             # Fallback answer if both API calls fail
-            answer = f"Error occurred while fetching answer from AI: {str(e)}. Fallback model also failed: {str(fallback_error)}. This is a simulated answer based on the question: {question}"
-    
+            source = "error"
+            answer = _failure_answer(question, failure)
+    RESULTS.inc(task="qa", source=source)
+
     # Store in database
     if db:
         qa_record = QAHistory(question=question, answer=answer, context=context)
-        db.add(qa_record)
-        db.commit()
-        db.refresh(qa_record)
-    
+        await save_record(db, qa_record)
+        latest_answer.record(qa_record, answer)
+
     return answer
 
+async def stream_qa(
+    question: str, context: Optional[str] = None, db: Optional[Session] = None, use_cache: bool = True, metadata: Optional[Dict] = None
+) -> AsyncIterator[str]:
+    """
+    Streaming variant of perform_qa: yields answer tokens as they arrive and stores the
+    assembled answer once the stream completes
+    """
+    context = context or DEFAULT_CONTEXT
+    cache_key = _cache_key(question, context)
+    cached = await response_cache.get(cache_key) if use_cache else None
+
+    parts = []
+    source = "cache"
+    if cached is not None:
+        parts.append(cached)
+        yield cached
+    else:
+        payload = await _build_payload(question, context, metadata)
+        try:
+            models = route("chat")
+            tokens, model = await stream_with_fallback(
+                "qa",
+                models,
+                lambda model: stream_chat({**payload, "model": model}, timeout=settings.qa_timeout)
+            )
+            source = "primary" if model == models[0] else "fallback"
+            async for token in tokens:
+                parts.append(token)
+                yield token
+            if model != models[0]:
+                suffix = f" (Generated using fallback model: {model})"
+                parts.append(suffix)
+                yield suffix
+            if use_cache:
+                await response_cache.set(cache_key, "".join(parts))
+        except AllModelsFailed as failure:
+            source = "error"
+            answer = _failure_answer(question, failure)
+            parts.append(answer)
+            yield answer
+    RESULTS.inc(task="qa", source=source)
+
+    # Store the assembled answer in database
+    if db:
+        answer = "".join(parts)
+        qa_record = QAHistory(question=question, answer=answer, context=context)
+        await save_record(db, qa_record)
+        latest_answer.record(qa_record, answer)
+
 def get_latest_answer(db: Session) -> Optional[str]:
     """
     Retrieve the latest answer from the database
@@ -79,4 +147,4 @@ def get_latest_answer(db: Session) -> Optional[str]:
     latest_qa = db.query(QAHistory).order_by(QAHistory.created_at.desc()).first()
     if latest_qa:
         return str(latest_qa.answer)
-    return None
\ No newline at end of file
+    return None
@@ -8,9 +8,26 @@ env_vars = dotenv_values(".env")
 class Settings(BaseSettings):
     # Database settings
     database_url: str = env_vars.get("DATABASE_URL") or os.environ.get("DATABASE_URL") or "sqlite:///./app/database/app.db"
+    database_pool_size: int = int(env_vars.get("DATABASE_POOL_SIZE") or os.environ.get("DATABASE_POOL_SIZE") or "10")
+    database_max_overflow: int = int(env_vars.get("DATABASE_MAX_OVERFLOW") or os.environ.get("DATABASE_MAX_OVERFLOW") or "20")
+    database_pool_timeout: float = float(env_vars.get("DATABASE_POOL_TIMEOUT") or os.environ.get("DATABASE_POOL_TIMEOUT") or "30.0")
+    
+    # SQLite pragmas applied to every connection
+    sqlite_journal_mode: str = env_vars.get("SQLITE_JOURNAL_MODE") or os.environ.get("SQLITE_JOURNAL_MODE") or "WAL"
+    sqlite_synchronous: str = env_vars.get("SQLITE_SYNCHRONOUS") or os.environ.get("SQLITE_SYNCHRONOUS") or "NORMAL"
+    sqlite_busy_timeout: float = float(env_vars.get("SQLITE_BUSY_TIMEOUT") or os.environ.get("SQLITE_BUSY_TIMEOUT") or "5.0")
+    sqlite_mmap_size: int = int(env_vars.get("SQLITE_MMAP_SIZE") or os.environ.get("SQLITE_MMAP_SIZE") or "268435456")
+    sqlite_cache_size_kb: int = int(env_vars.get("SQLITE_CACHE_SIZE_KB") or os.environ.get("SQLITE_CACHE_SIZE_KB") or "65536")
     
     # API Keys
     openrouter_api_key: str = env_vars.get("OPENROUTER_API_KEY") or os.environ.get("OPENROUTER_API_KEY") or ""
+    # Extra keys pooled with OPENROUTER_API_KEY (comma-separated, and/or one per line in a file re-read when it changes)
+    openrouter_api_keys: str = env_vars.get("OPENROUTER_API_KEYS") or os.environ.get("OPENROUTER_API_KEYS") or ""
+    openrouter_api_keys_file: str = env_vars.get("OPENROUTER_API_KEYS_FILE") or os.environ.get("OPENROUTER_API_KEYS_FILE") or ""
+    key_pool_reload_interval: float = float(env_vars.get("KEY_POOL_RELOAD_INTERVAL") or os.environ.get("KEY_POOL_RELOAD_INTERVAL") or "5.0")
+    key_quarantine_seconds: float = float(env_vars.get("KEY_QUARANTINE_SECONDS") or os.environ.get("KEY_QUARANTINE_SECONDS") or "300")  # after 401/402
+    key_rate_limit_quarantine_seconds: float = float(env_vars.get("KEY_RATE_LIMIT_QUARANTINE_SECONDS") or os.environ.get("KEY_RATE_LIMIT_QUARANTINE_SECONDS") or "10")  # after a 429 without Retry-After
+    openrouter_base_url: str = env_vars.get("OPENROUTER_BASE_URL") or os.environ.get("OPENROUTER_BASE_URL") or "https://openrouter.ai/api/v1"
     
     # AI Model Configuration
     chat_model: str = env_vars.get("CHAT_MODEL") or os.environ.get("CHAT_MODEL") or "deepseek/deepseek-r1-0528:free"
@@ -23,8 +40,148 @@ class Settings(BaseSettings):
     chat_max_tokens: int = int(env_vars.get("CHAT_MAX_TOKENS") or os.environ.get("CHAT_MAX_TOKENS") or "500")
     content_temperature: float = float(env_vars.get("CONTENT_TEMPERATURE") or os.environ.get("CONTENT_TEMPERATURE") or "0.8")
     content_max_tokens: int = int(env_vars.get("CONTENT_MAX_TOKENS") or os.environ.get("CONTENT_MAX_TOKENS") or "300")
+    content_multi_retries: int = int(env_vars.get("CONTENT_MULTI_RETRIES") or os.environ.get("CONTENT_MULTI_RETRIES") or "1")  # Re-requests for platforms whose JSON did not parse
     image_size: str = env_vars.get("IMAGE_SIZE") or os.environ.get("IMAGE_SIZE") or "1024x1024"
     
+    # OpenRouter connection pool
+    openrouter_max_connections: int = int(env_vars.get("OPENROUTER_MAX_CONNECTIONS") or os.environ.get("OPENROUTER_MAX_CONNECTIONS") or "100")
+    openrouter_max_keepalive_connections: int = int(env_vars.get("OPENROUTER_MAX_KEEPALIVE_CONNECTIONS") or os.environ.get("OPENROUTER_MAX_KEEPALIVE_CONNECTIONS") or "20")
+    openrouter_keepalive_expiry: float = float(env_vars.get("OPENROUTER_KEEPALIVE_EXPIRY") or os.environ.get("OPENROUTER_KEEPALIVE_EXPIRY") or "30.0")
+    openrouter_http2: bool = (env_vars.get("OPENROUTER_HTTP2") or os.environ.get("OPENROUTER_HTTP2") or "True").lower() == "true"
+    openrouter_connect_timeout: float = float(env_vars.get("OPENROUTER_CONNECT_TIMEOUT") or os.environ.get("OPENROUTER_CONNECT_TIMEOUT") or "10.0")
+    openrouter_pool_timeout: float = float(env_vars.get("OPENROUTER_POOL_TIMEOUT") or os.environ.get("OPENROUTER_POOL_TIMEOUT") or "10.0")
+    
+    # Per-endpoint upstream timeouts (seconds)
+    qa_timeout: float = float(env_vars.get("QA_TIMEOUT") or os.environ.get("QA_TIMEOUT") or "30.0")
+    content_timeout: float = float(env_vars.get("CONTENT_TIMEOUT") or os.environ.get("CONTENT_TIMEOUT") or "60.0")
+    image_timeout: float = float(env_vars.get("IMAGE_TIMEOUT") or os.environ.get("IMAGE_TIMEOUT") or "60.0")
+    
+    # Fallback hedging: "sequential" (alternative only after the primary fails), "hedged"
+    # (alternative fired after HEDGE_DELAY) or "race" (both fired at once)
+    hedge_policy: str = env_vars.get("HEDGE_POLICY") or os.environ.get("HEDGE_POLICY") or "sequential"
+    hedge_delay: str = env_vars.get("HEDGE_DELAY") or os.environ.get("HEDGE_DELAY") or "p95"  # seconds, or a percentile of observed primary latency
+    hedge_default_delay: float = float(env_vars.get("HEDGE_DEFAULT_DELAY") or os.environ.get("HEDGE_DEFAULT_DELAY") or "5.0")
+    health_window: int = int(env_vars.get("HEALTH_WINDOW") or os.environ.get("HEALTH_WINDOW") or "200")
+    
+    # Per-model circuit breaker
+    breaker_error_threshold: float = float(env_vars.get("BREAKER_ERROR_THRESHOLD") or os.environ.get("BREAKER_ERROR_THRESHOLD") or "0.5")
+    breaker_min_requests: int = int(env_vars.get("BREAKER_MIN_REQUESTS") or os.environ.get("BREAKER_MIN_REQUESTS") or "5")
+    breaker_window_seconds: float = float(env_vars.get("BREAKER_WINDOW_SECONDS") or os.environ.get("BREAKER_WINDOW_SECONDS") or "60.0")
+    breaker_open_seconds: float = float(env_vars.get("BREAKER_OPEN_SECONDS") or os.environ.get("BREAKER_OPEN_SECONDS") or "30.0")
+    breaker_half_open_probes: int = int(env_vars.get("BREAKER_HALF_OPEN_PROBES") or os.environ.get("BREAKER_HALF_OPEN_PROBES") or "1")
+    breaker_slow_call_seconds: float = float(env_vars.get("BREAKER_SLOW_CALL_SECONDS") or os.environ.get("BREAKER_SLOW_CALL_SECONDS") or "0")  # 0 disables slow-call tracking
+    
+    # How often (seconds) the in-memory latest answer re-checks the database for rows written by other workers
+    # (0 = on every request, negative = never)
+    latest_answer_sync_interval: float = float(env_vars.get("LATEST_ANSWER_SYNC_INTERVAL") or os.environ.get("LATEST_ANSWER_SYNC_INTERVAL") or "1.0")
+    
+    # Write-behind history persistence: records are queued and committed in batches by a background task
+    history_write_behind: bool = (env_vars.get("HISTORY_WRITE_BEHIND") or os.environ.get("HISTORY_WRITE_BEHIND") or "False").lower() == "true"
+    history_queue_size: int = int(env_vars.get("HISTORY_QUEUE_SIZE") or os.environ.get("HISTORY_QUEUE_SIZE") or "1000")
+    history_batch_size: int = int(env_vars.get("HISTORY_BATCH_SIZE") or os.environ.get("HISTORY_BATCH_SIZE") or "100")
+    history_flush_interval: float = float(env_vars.get("HISTORY_FLUSH_INTERVAL") or os.environ.get("HISTORY_FLUSH_INTERVAL") or "0.5")
+    history_enqueue_timeout: float = float(env_vars.get("HISTORY_ENQUEUE_TIMEOUT") or os.environ.get("HISTORY_ENQUEUE_TIMEOUT") or "1.0")
+    
+    # Response cache for QA and content generation ("memory", "sqlite" or "none")
+    cache_backend: str = env_vars.get("CACHE_BACKEND") or os.environ.get("CACHE_BACKEND") or "memory"
+    cache_ttl_seconds: float = float(env_vars.get("CACHE_TTL_SECONDS") or os.environ.get("CACHE_TTL_SECONDS") or "3600")
+    cache_max_entries: int = int(env_vars.get("CACHE_MAX_ENTRIES") or os.environ.get("CACHE_MAX_ENTRIES") or "1000")
+    cache_max_bytes: int = int(env_vars.get("CACHE_MAX_BYTES") or os.environ.get("CACHE_MAX_BYTES") or "52428800")  # 0 = no size bound
+    cache_sqlite_path: str = env_vars.get("CACHE_SQLITE_PATH") or os.environ.get("CACHE_SQLITE_PATH") or "./app/database/cache.db"
+    
+    # Collapse identical concurrent /ai-task/ requests onto one execution
+    coalesce_requests: bool = (env_vars.get("COALESCE_REQUESTS") or os.environ.get("COALESCE_REQUESTS") or "True").lower() == "true"
+    
+    # Content-addressed store for generated images
+    blob_store_backend: str = env_vars.get("BLOB_STORE_BACKEND") or os.environ.get("BLOB_STORE_BACKEND") or "local"
+    blob_store_path: str = env_vars.get("BLOB_STORE_PATH") or os.environ.get("BLOB_STORE_PATH") or "./app/database/blobs"
+    
+    # Batch endpoint settings
+    batch_concurrency: int = int(env_vars.get("BATCH_CONCURRENCY") or os.environ.get("BATCH_CONCURRENCY") or "6")
+    batch_max_concurrency: int = int(env_vars.get("BATCH_MAX_CONCURRENCY") or os.environ.get("BATCH_MAX_CONCURRENCY") or "20")
+    batch_max_tasks: int = int(env_vars.get("BATCH_MAX_TASKS") or os.environ.get("BATCH_MAX_TASKS") or "100")
+    
+    # Prometheus-style /metrics; with several workers point METRICS_MULTIPROC_DIR at a shared, initially empty directory
+    metrics_enabled: bool = (env_vars.get("METRICS_ENABLED") or os.environ.get("METRICS_ENABLED") or "True").lower() == "true"
+    metrics_multiproc_dir: str = env_vars.get("METRICS_MULTIPROC_DIR") or os.environ.get("METRICS_MULTIPROC_DIR") or ""
+    metrics_sync_interval: float = float(env_vars.get("METRICS_SYNC_INTERVAL") or os.environ.get("METRICS_SYNC_INTERVAL") or "5.0")
+    
+    # Per-request Server-Timing header and optional JSON-lines timing log ("stdout" to print)
+    server_timing_enabled: bool = (env_vars.get("SERVER_TIMING_ENABLED") or os.environ.get("SERVER_TIMING_ENABLED") or "True").lower() == "true"
+    timing_log_path: str = env_vars.get("TIMING_LOG_PATH") or os.environ.get("TIMING_LOG_PATH") or ""
+    timing_log_min_ms: float = float(env_vars.get("TIMING_LOG_MIN_MS") or os.environ.get("TIMING_LOG_MIN_MS") or "0")
+    
+    # Admin endpoints (/ai-task/admin/*) are disabled while ADMIN_TOKEN is empty
+    admin_token: str = env_vars.get("ADMIN_TOKEN") or os.environ.get("ADMIN_TOKEN") or ""
+    profile_sample_interval_ms: float = float(env_vars.get("PROFILE_SAMPLE_INTERVAL_MS") or os.environ.get("PROFILE_SAMPLE_INTERVAL_MS") or "5")
+    profile_max_seconds: float = float(env_vars.get("PROFILE_MAX_SECONDS") or os.environ.get("PROFILE_MAX_SECONDS") or "300")
+    
+    # Image generation jobs (queued in SQLite, run by a worker pool, polled or reported by webhook)
+    image_job_workers: int = int(env_vars.get("IMAGE_JOB_WORKERS") or os.environ.get("IMAGE_JOB_WORKERS") or "2")
+    image_job_queue_size: int = int(env_vars.get("IMAGE_JOB_QUEUE_SIZE") or os.environ.get("IMAGE_JOB_QUEUE_SIZE") or "1000")
+    image_job_webhook_timeout: float = float(env_vars.get("IMAGE_JOB_WEBHOOK_TIMEOUT") or os.environ.get("IMAGE_JOB_WEBHOOK_TIMEOUT") or "10.0")
+    image_job_webhook_retries: int = int(env_vars.get("IMAGE_JOB_WEBHOOK_RETRIES") or os.environ.get("IMAGE_JOB_WEBHOOK_RETRIES") or "3")
+    image_job_webhook_allowed_hosts: str = env_vars.get("IMAGE_JOB_WEBHOOK_ALLOWED_HOSTS") or os.environ.get("IMAGE_JOB_WEBHOOK_ALLOWED_HOSTS") or ""  # Comma-separated; empty allows any host resolving to public addresses
+    
+    # Image variants (name:longest edge in pixels, plus "original") rendered in a "thread" or "process" pool
+    image_variants: str = env_vars.get("IMAGE_VARIANTS") or os.environ.get("IMAGE_VARIANTS") or "thumbnail:256,medium:512"
+    image_variant_format: str = (env_vars.get("IMAGE_VARIANT_FORMAT") or os.environ.get("IMAGE_VARIANT_FORMAT") or "webp").lower()
+    image_variant_quality: int = int(env_vars.get("IMAGE_VARIANT_QUALITY") or os.environ.get("IMAGE_VARIANT_QUALITY") or "80")
+    image_executor: str = (env_vars.get("IMAGE_EXECUTOR") or os.environ.get("IMAGE_EXECUTOR") or "thread").lower()
+    image_workers: int = int(env_vars.get("IMAGE_WORKERS") or os.environ.get("IMAGE_WORKERS") or "2")
+    
+    # Response compression negotiated on Accept-Encoding (zstd/br when their packages are installed, else gzip)
+    compression_enabled: bool = (env_vars.get("COMPRESSION_ENABLED") or os.environ.get("COMPRESSION_ENABLED") or "True").lower() == "true"
+    compression_min_size: int = int(env_vars.get("COMPRESSION_MIN_SIZE") or os.environ.get("COMPRESSION_MIN_SIZE") or "1024")
+    compression_gzip_level: int = int(env_vars.get("COMPRESSION_GZIP_LEVEL") or os.environ.get("COMPRESSION_GZIP_LEVEL") or "6")
+    compression_brotli_quality: int = int(env_vars.get("COMPRESSION_BROTLI_QUALITY") or os.environ.get("COMPRESSION_BROTLI_QUALITY") or "4")
+    compression_zstd_level: int = int(env_vars.get("COMPRESSION_ZSTD_LEVEL") or os.environ.get("COMPRESSION_ZSTD_LEVEL") or "3")
+    compression_offload_size: int = int(env_vars.get("COMPRESSION_OFFLOAD_SIZE") or os.environ.get("COMPRESSION_OFFLOAD_SIZE") or "65536")
+    
+    # QA contexts longer than RETRIEVAL_MIN_TOKENS are cut down to the top passages within RETRIEVAL_TOKEN_BUDGET
+    retrieval_enabled: bool = (env_vars.get("RETRIEVAL_ENABLED") or os.environ.get("RETRIEVAL_ENABLED") or "True").lower() == "true"
+    retrieval_min_tokens: int = int(env_vars.get("RETRIEVAL_MIN_TOKENS") or os.environ.get("RETRIEVAL_MIN_TOKENS") or "1500")
+    retrieval_token_budget: int = int(env_vars.get("RETRIEVAL_TOKEN_BUDGET") or os.environ.get("RETRIEVAL_TOKEN_BUDGET") or "1000")
+    retrieval_chunk_tokens: int = int(env_vars.get("RETRIEVAL_CHUNK_TOKENS") or os.environ.get("RETRIEVAL_CHUNK_TOKENS") or "120")
+    retrieval_top_k: int = int(env_vars.get("RETRIEVAL_TOP_K") or os.environ.get("RETRIEVAL_TOP_K") or "8")
+    retrieval_cache_size: int = int(env_vars.get("RETRIEVAL_CACHE_SIZE") or os.environ.get("RETRIEVAL_CACHE_SIZE") or "64")
+    
+    # Admission control: per-client token buckets on /ai-task/ (0 rate disables) and per-model upstream concurrency
+    # limits; calls over the limit queue (ADMISSION_QUEUE_SIZE per model) and are shed with 503 when it is full
+    admission_enabled: bool = (env_vars.get("ADMISSION_ENABLED") or os.environ.get("ADMISSION_ENABLED") or "True").lower() == "true"
+    admission_client_rate: float = float(env_vars.get("ADMISSION_CLIENT_RATE") or os.environ.get("ADMISSION_CLIENT_RATE") or "5.0")  # requests/s
+    admission_client_burst: float = float(env_vars.get("ADMISSION_CLIENT_BURST") or os.environ.get("ADMISSION_CLIENT_BURST") or "20")
+    admission_client_header: str = env_vars.get("ADMISSION_CLIENT_HEADER") or os.environ.get("ADMISSION_CLIENT_HEADER") or ""  # e.g. X-Client-ID set by a gateway; empty = client address
+    admission_max_clients: int = int(env_vars.get("ADMISSION_MAX_CLIENTS") or os.environ.get("ADMISSION_MAX_CLIENTS") or "10000")
+    admission_model_concurrency: int = int(env_vars.get("ADMISSION_MODEL_CONCURRENCY") or os.environ.get("ADMISSION_MODEL_CONCURRENCY") or "8")  # 0 = unlimited
+    admission_model_limits: str = env_vars.get("ADMISSION_MODEL_LIMITS") or os.environ.get("ADMISSION_MODEL_LIMITS") or ""  # model=limit,... overrides
+    admission_queue_size: int = int(env_vars.get("ADMISSION_QUEUE_SIZE") or os.environ.get("ADMISSION_QUEUE_SIZE") or "32")
+    admission_queue_timeout: float = float(env_vars.get("ADMISSION_QUEUE_TIMEOUT") or os.environ.get("ADMISSION_QUEUE_TIMEOUT") or "10.0")
+    admission_retry_after: float = float(env_vars.get("ADMISSION_RETRY_AFTER") or os.environ.get("ADMISSION_RETRY_AFTER") or "5")
+    
+    # Upstream 429 handling: retry the same model after Retry-After (or jittered backoff) within RATE_LIMIT_RETRY_BUDGET
+    # seconds, and adapt each model's admission concurrency limit with AIMD (cut on 429, grown back on success)
+    rate_limit_enabled: bool = (env_vars.get("RATE_LIMIT_ENABLED") or os.environ.get("RATE_LIMIT_ENABLED") or "True").lower() == "true"
+    rate_limit_retry_budget: float = float(env_vars.get("RATE_LIMIT_RETRY_BUDGET") or os.environ.get("RATE_LIMIT_RETRY_BUDGET") or "8.0")
+    rate_limit_max_retries: int = int(env_vars.get("RATE_LIMIT_MAX_RETRIES") or os.environ.get("RATE_LIMIT_MAX_RETRIES") or "3")
+    rate_limit_backoff_base: float = float(env_vars.get("RATE_LIMIT_BACKOFF_BASE") or os.environ.get("RATE_LIMIT_BACKOFF_BASE") or "0.5")
+    rate_limit_backoff_max: float = float(env_vars.get("RATE_LIMIT_BACKOFF_MAX") or os.environ.get("RATE_LIMIT_BACKOFF_MAX") or "8.0")
+    rate_limit_jitter: float = float(env_vars.get("RATE_LIMIT_JITTER") or os.environ.get("RATE_LIMIT_JITTER") or "0.25")  # max seconds added to Retry-After
+    rate_limit_decrease_factor: float = float(env_vars.get("RATE_LIMIT_DECREASE_FACTOR") or os.environ.get("RATE_LIMIT_DECREASE_FACTOR") or "0.5")
+    rate_limit_decrease_interval: float = float(env_vars.get("RATE_LIMIT_DECREASE_INTERVAL") or os.environ.get("RATE_LIMIT_DECREASE_INTERVAL") or "1.0")
+    rate_limit_increase: float = float(env_vars.get("RATE_LIMIT_INCREASE") or os.environ.get("RATE_LIMIT_INCREASE") or "1.0")
+    rate_limit_min_concurrency: int = int(env_vars.get("RATE_LIMIT_MIN_CONCURRENCY") or os.environ.get("RATE_LIMIT_MIN_CONCURRENCY") or "1")
+    
+    # Model routing pools ("model=weight|tier=free|max_latency=5,..."; empty = the primary and alternative model).
+    # ROUTING_POLICY is "ordered" (pool order), "ewma" (lowest latency x load / weight) or "p2c" (power of two choices)
+    routing_policy: str = (env_vars.get("ROUTING_POLICY") or os.environ.get("ROUTING_POLICY") or "ordered").lower()
+    chat_model_pool: str = env_vars.get("CHAT_MODEL_POOL") or os.environ.get("CHAT_MODEL_POOL") or ""
+    image_model_pool: str = env_vars.get("IMAGE_MODEL_POOL") or os.environ.get("IMAGE_MODEL_POOL") or ""
+    routing_tiers: str = env_vars.get("ROUTING_TIERS") or os.environ.get("ROUTING_TIERS") or "free,paid"  # allowed cost tiers
+    routing_max_latency: float = float(env_vars.get("ROUTING_MAX_LATENCY") or os.environ.get("ROUTING_MAX_LATENCY") or "0")  # default ceiling, 0 = none
+    routing_max_attempts: int = int(env_vars.get("ROUTING_MAX_ATTEMPTS") or os.environ.get("ROUTING_MAX_ATTEMPTS") or "2")
+    routing_ewma_alpha: float = float(env_vars.get("ROUTING_EWMA_ALPHA") or os.environ.get("ROUTING_EWMA_ALPHA") or "0.3")
+    
     # Server settings
     host: str = env_vars.get("HOST") or os.environ.get("HOST") or "127.0.0.1"  # Default to localhost for security
     port: int = int(env_vars.get("PORT") or os.environ.get("PORT") or "8000")
@@ -38,5 +195,5 @@ class Settings(BaseSettings):
 settings = Settings()
 
 # Validate that required environment variables are set
-if not settings.openrouter_api_key:
+if not (settings.openrouter_api_key or settings.openrouter_api_keys or settings.openrouter_api_keys_file):
     print("Warning: OPENROUTER_API_KEY environment variable is not set. Some features may not work.")
\ No newline at end of file
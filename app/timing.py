@@ -0,0 +1,197 @@
+"""
+Per-request phase timing for AI Task API
+Code on the request path records named spans (upstream model calls, connection wait, DB commit,
+cache, image encoding...) into the current request's timing via a context variable. The middleware
+returns them in a `Server-Timing` header with an `X-Request-ID`, and can append one JSON line per
+request to a timing log.
+"""
+
+import asyncio
+import functools
+import json
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.routing import APIRoute
+
+from app.settings import settings
+
+
+class RequestTiming:
+    """
+    Spans recorded for one request; repeated names are summed
+    """
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans: Dict[str, List[Any]] = {}  # name -> [total seconds, description]
+        self.endpoint_started: Optional[float] = None
+        self.endpoint_finished: Optional[float] = None
+
+    def add(self, name: str, seconds: float, description: str = "") -> None:
+        span = self.spans.get(name)
+        if span is None:
+            self.spans[name] = [seconds, description]
+        else:
+            span[0] += seconds
+
+    def header(self) -> str:
+        entries = []
+        for name, (seconds, description) in self.spans.items():
+            entry = f"{name};dur={seconds * 1000:.1f}"
+            if description:
+                entry += f';desc="{description}"'
+            entries.append(entry)
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+
+def current_timing() -> Optional[RequestTiming]:
+    return _current.get()
+
+
+def record_span(name: str, seconds: float, description: str = "") -> None:
+    """
+    Add a measured duration to the current request (no-op outside a request)
+    """
+    timing = _current.get()
+    if timing is not None:
+        timing.add(name, seconds, description)
+
+
+@contextmanager
+def span(name: str, description: str = ""):
+    """
+    Time the enclosed block (sync or around awaits) as a span of the current request
+    """
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - started, description)
+
+
+def _timed_endpoint(endpoint: Callable) -> Callable:
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        timing = _current.get()
+        if timing is not None:
+            timing.endpoint_started = time.perf_counter()
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            if timing is not None:
+                timing.endpoint_finished = time.perf_counter()
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    """
+    Route class splitting FastAPI's handler into `parse` (body parsing and validation of the task
+    union, dependencies) before the endpoint and `serialize` (response model validation and JSON
+    rendering) after it
+    """
+    def __init__(self, path: str, endpoint: Callable, **kwargs: Any):
+        if settings.server_timing_enabled and asyncio.iscoroutinefunction(endpoint):
+            endpoint = _timed_endpoint(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            timing = _current.get()
+            if timing is None:
+                return await handler(request)
+            started = time.perf_counter()
+            response = await handler(request)
+            finished = time.perf_counter()
+            if timing.endpoint_started is not None:
+                timing.add("parse", timing.endpoint_started - started)
+            if timing.endpoint_finished is not None:
+                timing.add("serialize", finished - timing.endpoint_finished)
+            return response
+
+        return timed_handler
+
+
+class _TimingLog:
+    """
+    Append-only JSON-lines log of request timings ("stdout" prints instead)
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+
+    def write(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, ensure_ascii=False)
+        if self.path == "stdout":
+            print(line)
+            return
+        if self.file is None:
+            # Line-buffered: each entry is one small write to the page cache
+            self.file = open(self.path, "a", buffering=1)
+        self.file.write(line + "\n")
+
+
+_timing_log = _TimingLog(settings.timing_log_path) if settings.timing_log_path else None
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware (streaming-safe) that opens a RequestTiming per HTTP request and adds
+    `Server-Timing` and `X-Request-ID` to the response
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.server_timing_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        request_id = ""
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:128]
+                break
+        timing = RequestTiming(request_id or uuid.uuid4().hex)
+        token = _current.set(timing)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timing.header().encode("latin-1", "replace")))
+                headers.append((b"x-request-id", timing.request_id.encode("latin-1", "replace")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            if _timing_log is not None:
+                total = time.perf_counter() - timing.started
+                if total * 1000 >= settings.timing_log_min_ms:
+                    _timing_log.write({
+                        "ts": round(time.time(), 3),
+                        "request_id": timing.request_id,
+                        "method": scope.get("method"),
+                        "path": scope.get("path"),
+                        "status": status,
+                        "total_ms": round(total * 1000, 2),
+                        "spans": {name: round(seconds * 1000, 2) for name, (seconds, _) in timing.spans.items()}
+                    })
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Concurrent throughput benchmark for the /ai-task/ dispatcher
+
+Starts the mock OpenRouter server and compares two servers under the same load:
+  - blocking: the previous pattern, a synchronous httpx.Client call inside an async handler
+  - async:    the real application using the non-blocking service layer
+
+Usage:
+    python benchmarks/async_dispatch_benchmark.py --requests 200 --concurrency 50 --latency 0.5
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_openrouter import create_mock_app
+
+MOCK_PORT = 8765
+BLOCKING_PORT = 8766
+ASYNC_PORT = 8767
+
+
+def start_server(app, port: int) -> uvicorn.Server:
+    """
+    Run a uvicorn server in a background thread and wait until it accepts requests
+    """
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def create_blocking_app(upstream_url: str) -> FastAPI:
+    """
+    Reproduce the old dispatcher: an async route doing a blocking upstream call
+    """
+    app = FastAPI()
+
+    @app.post("/ai-task/")
+    async def handle_ai_task(task_data: dict):
+        with httpx.Client() as client:
+            response = client.post(upstream_url, json={"model": "mock", "messages": []}, timeout=60.0)
+            response.raise_for_status()
+            result = response.json()
+        return {"task": task_data.get("task"), "result": result["choices"][0]["message"]["content"]}
+
+    return app
+
+
+async def drive(url: str, total: int, concurrency: int) -> dict:
+    """
+    Send `total` content generation requests with at most `concurrency` in flight
+    Each prompt is distinct and skips the response cache, so every request reaches the upstream
+    instead of being answered from the cache or coalesced with an identical one in flight
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async with httpx.AsyncClient(timeout=300.0, limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def one(index: int):
+            payload = {"task": "content_generation", "prompt": f"benchmark prompt {index}", "platform": "twitter", "cache": False}
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(url, json=payload)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(index) for index in range(total)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare blocking vs async dispatcher throughput")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.5, help="Mock upstream latency in seconds")
+    args = parser.parse_args()
+
+    mock_base = f"http://127.0.0.1:{MOCK_PORT}/api/v1"
+    workdir = tempfile.mkdtemp(prefix="async_dispatch_")
+    os.environ["OPENROUTER_BASE_URL"] = mock_base
+    # Without a key the services answer from local templates and never call the upstream
+    os.environ.setdefault("OPENROUTER_API_KEY", "mock-key")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir}/app.db")
+    os.environ.setdefault("BLOB_STORE_PATH", f"{workdir}/blobs")
+    # One load generator stands for many clients: don't throttle it as a single one, and let every
+    # request in flight reach the upstream like the blocking server does
+    os.environ.setdefault("ADMISSION_CLIENT_RATE", "0")
+    os.environ.setdefault("ADMISSION_MODEL_CONCURRENCY", str(args.concurrency))
+    start_server(create_mock_app(args.latency), MOCK_PORT)
+
+    from main import app
+
+    start_server(create_blocking_app(f"{mock_base}/chat/completions"), BLOCKING_PORT)
+    start_server(app, ASYNC_PORT)
+
+    for name, port in (("blocking", BLOCKING_PORT), ("async", ASYNC_PORT)):
+        stats = asyncio.run(drive(f"http://127.0.0.1:{port}/ai-task/", args.requests, args.concurrency))
+        print(f"{name:>9}: {stats}")
+
+
+if __name__ == "__main__":
+    main()
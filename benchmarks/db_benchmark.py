@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+History database micro-benchmark
+
+Builds a qa_history table with N rows twice, once with the previous configuration (default
+journal mode, no created_at index) and once with the engine from app/database.py (WAL and
+pragmas, indexes), and measures:
+  - bulk insert throughput (rows/s, batched executemany)
+  - per-request insert throughput (one add + commit per row, as save_record does)
+  - latest-answer query latency (ORDER BY created_at DESC LIMIT 1)
+
+Usage:
+    python benchmarks/db_benchmark.py --rows 1000000 --commits 2000 --queries 50
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import Base, QAHistory, build_engine, init_db
+
+BATCH_SIZE = 10000
+
+
+def build_baseline_engine(url: str):
+    """
+    The previous configuration: default pool and pragmas, no created_at index
+    """
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_qa_history_created_at"))
+    return engine
+
+
+def build_tuned_engine(url: str):
+    engine = build_engine(url)
+    init_db(engine)
+    return engine
+
+
+def bench_bulk_insert(engine, rows: int) -> float:
+    start_time = datetime(2024, 1, 1)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        for offset in range(0, rows, BATCH_SIZE):
+            batch = [
+                {
+                    "question": f"Question {i}",
+                    "answer": f"Answer {i} " * 8,
+                    "context": None,
+                    "created_at": start_time + timedelta(seconds=i)
+                }
+                for i in range(offset, min(rows, offset + BATCH_SIZE))
+            ]
+            conn.execute(QAHistory.__table__.insert(), batch)
+    return rows / (time.perf_counter() - started)
+
+
+def bench_commits(engine, commits: int) -> float:
+    Session = sessionmaker(bind=engine)
+    started = time.perf_counter()
+    for i in range(commits):
+        db = Session()
+        try:
+            db.add(QAHistory(question=f"Live question {i}", answer=f"Live answer {i}"))
+            db.commit()
+        finally:
+            db.close()
+    return commits / (time.perf_counter() - started)
+
+
+def bench_latest(engine, queries: int) -> float:
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    try:
+        started = time.perf_counter()
+        for _ in range(queries):
+            db.query(QAHistory).order_by(QAHistory.created_at.desc()).first()
+            db.expire_all()
+        return (time.perf_counter() - started) / queries * 1000
+    finally:
+        db.close()
+
+
+def run(name: str, builder, rows: int, commits: int, queries: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = builder(url)
+        print(f"[{name}] inserting {rows} rows...")
+        result = {
+            "bulk_insert_rows_per_s": round(bench_bulk_insert(engine, rows)),
+            "commits_per_s": round(bench_commits(engine, commits)),
+            "latest_answer_ms": round(bench_latest(engine, queries), 3)
+        }
+        engine.dispose()
+    print(f"[{name}] {result}")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark history inserts and latest-answer lookups")
+    parser.add_argument("--rows", type=int, default=1000000, help="Rows loaded before measuring queries")
+    parser.add_argument("--commits", type=int, default=2000, help="Single-row add + commit round trips")
+    parser.add_argument("--queries", type=int, default=50, help="Latest-answer queries to time")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {
+        "rows": args.rows,
+        "baseline": run("baseline", build_baseline_engine, args.rows, args.commits, args.queries),
+        "tuned": run("tuned", build_tuned_engine, args.rows, args.commits, args.queries)
+    }
+
+    print()
+    print(f"{'metric':<26}{'baseline':>14}{'tuned':>14}")
+    for metric in results["tuned"]:
+        print(f"{metric:<26}{results['baseline'][metric]:>14}{results['tuned'][metric]:>14}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Image variant benchmark
+
+Renders each configured variant (IMAGE_VARIANTS plus the original) in each format from a
+synthetic 1024x1024 PNG and reports bytes served and CPU time per image, then measures how long
+the event loop stalls while images are processed inline versus in the image pool
+(app/image_variants.py).
+
+Usage:
+    python benchmarks/image_variants_benchmark.py --images 20 --size 1024
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.image_processing import IMAGE_VARIANTS, VARIANT_FORMATS, render_variants
+from app.image_variants import run_image_work, shutdown
+from app.settings import settings
+
+
+def synthetic_png(size: int, seed: int = 0) -> bytes:
+    """
+    Smooth gradients with mild noise, closer to a generated picture than pure noise or a flat colour
+    """
+    rng = np.random.RandomState(seed)
+    x = np.linspace(0, 1, size)
+    base = np.stack([np.outer(x, x), np.outer(x[::-1], x), np.outer(x, x[::-1])], axis=-1) * 220
+    pixels = np.clip(base + rng.normal(0, 8, base.shape), 0, 255).astype("uint8")
+    buffered = BytesIO()
+    Image.fromarray(pixels).save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+def bench_variants(source: bytes, images: int) -> dict:
+    results = {}
+    for variant, max_edge in IMAGE_VARIANTS.items():
+        for fmt in VARIANT_FORMATS:
+            spec = [(max_edge, fmt, settings.image_variant_quality)]
+            started = time.process_time()
+            for _ in range(images):
+                output = render_variants(source, spec)[0]
+            cpu_ms = (time.process_time() - started) / images * 1000
+            size = len(source) if output is None else len(output[0])
+            results[f"{variant}/{fmt}"] = {"bytes": size, "cpu_ms": round(cpu_ms, 2)}
+            print(f"[{variant}/{fmt}] {results[f'{variant}/{fmt}']}")
+    return results
+
+
+async def max_loop_stall(work) -> float:
+    """
+    Longest gap between 1 ms ticks of a heartbeat task while `work` runs
+    """
+    stall = 0.0
+    running = True
+
+    async def heartbeat():
+        nonlocal stall
+        last = time.perf_counter()
+        while running:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            stall = max(stall, now - last)
+            last = now
+
+    beat = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0.01)
+    await work()
+    running = False
+    await beat
+    return stall * 1000
+
+
+async def bench_loop(source: bytes, images: int) -> dict:
+    specs = [(edge, settings.image_variant_format, settings.image_variant_quality) for edge in IMAGE_VARIANTS.values()]
+
+    async def inline():
+        for _ in range(images):
+            render_variants(source, specs)
+
+    async def pooled():
+        await asyncio.gather(*(run_image_work(render_variants, source, specs) for _ in range(images)))
+
+    result = {}
+    for name, work in (("inline", inline), ("pool", pooled)):
+        started = time.perf_counter()
+        stall = await max_loop_stall(work)
+        result[name] = {"max_loop_stall_ms": round(stall, 1), "wall_ms": round((time.perf_counter() - started) * 1000, 1)}
+        print(f"[{name}] {result[name]}")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark image variant size and CPU cost")
+    parser.add_argument("--images", type=int, default=20, help="Renders timed per variant and format")
+    parser.add_argument("--size", type=int, default=1024, help="Edge of the synthetic source image")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    source = synthetic_png(args.size)
+    print(f"source PNG: {len(source)} bytes, as base64 JSON: {len(base64.b64encode(source))} bytes")
+    results = {
+        "source_png_bytes": len(source),
+        "source_b64_bytes": len(base64.b64encode(source)),
+        "executor": settings.image_executor,
+        "workers": settings.image_workers,
+        "variants": bench_variants(source, args.images),
+        "event_loop": asyncio.run(bench_loop(source, args.images))
+    }
+    shutdown()
+
+    print()
+    print(f"{'variant/format':<22}{'bytes':>12}{'vs b64 PNG':>12}{'cpu ms':>10}")
+    for name, result in results["variants"].items():
+        ratio = result["bytes"] / results["source_b64_bytes"]
+        print(f"{name:<22}{result['bytes']:>12}{ratio:>11.1%}{result['cpu_ms']:>10}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
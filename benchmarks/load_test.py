@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test for the /ai-task/ dispatcher
+
+Keeps `--concurrency` requests in flight against /ai-task/ for `--duration` seconds (or until
+`--requests` have been sent), drawing task types from `--mix`, and reports throughput, errors and
+p50/p95/p99 latency per task type (plus time to first token for streamed QA and content). Unless
+`--url` points at a running server, the application is started in-process against the mock
+OpenRouter server (benchmarks/mock_openrouter.py, all of whose options apply) with a throwaway
+database and client rate limiting off. Results are written as JSON with `--output`; `--compare`
+prints the change against an earlier results file and `--max-regression` turns a slowdown into a
+non-zero exit status.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 50 --duration 30 --output results.json
+    python benchmarks/load_test.py --mix qa=4,content_generation=4,image_generation=1,latest_answer=1 \
+        --stream-ratio 0.5 --latency 0.8 --distribution lognormal --spread 0.5 --rate-limit-rate 0.05
+    python benchmarks/load_test.py --compare baseline.json --max-regression 10 --output current.json
+    python benchmarks/load_test.py --url http://localhost:8000 --concurrency 20 --duration 60
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_openrouter import add_mock_arguments, mock_app_from_args
+
+MOCK_PORT = 8765
+APP_PORT = 8768
+PLATFORMS = ["twitter", "linkedin", "facebook", "instagram"]
+STREAMABLE = ("qa", "content_generation")
+
+
+def start_server(app, port: int) -> uvicorn.Server:
+    """
+    Run a uvicorn server in a background thread and wait until it accepts requests
+    """
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """
+    "qa=4,content_generation=4,image_generation=1" -> {task: weight}
+    """
+    mix: Dict[str, float] = {}
+    for item in spec.split(","):
+        task, _, weight = item.strip().partition("=")
+        if task.strip():
+            mix[task.strip()] = float(weight) if weight.strip() else 1.0
+    return mix
+
+
+def build_payload(task: str, n: int, distinct: int) -> dict:
+    """
+    Request body for the n-th request; with `distinct` prompts repeat every `distinct` requests
+    so the response cache and request coalescing get hits
+    """
+    key = n % distinct if distinct else n
+    if task == "qa":
+        return {"task": "qa", "question": f"Load test question {key}: what is the capital of France?"}
+    if task == "content_generation":
+        return {"task": "content_generation", "prompt": f"Load test announcement {key}", "platform": PLATFORMS[key % len(PLATFORMS)]}
+    if task == "image_generation":
+        return {"task": "image_generation", "prompt": f"Load test landscape {key}"}
+    return {"task": task}
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """
+    Nearest-rank percentile of sorted `values`, in milliseconds
+    """
+    if not values:
+        return None
+    index = max(0, min(len(values), math.ceil(pct / 100 * len(values))) - 1)
+    return round(values[index] * 1000, 1)
+
+
+class Recorder:
+    """
+    Latencies and status codes per task type ("qa/stream" for streamed requests)
+    """
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.first_token: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+
+    def record(self, name: str, status: str, latency: float, first_token: Optional[float] = None) -> None:
+        self.statuses[name][status] += 1
+        if status == "200":
+            self.latencies[name].append(latency)
+            if first_token is not None:
+                self.first_token[name].append(first_token)
+
+    def summary(self, name: Optional[str], elapsed: float) -> dict:
+        names = [name] if name else list(self.statuses)
+        latencies = sorted(value for key in names for value in self.latencies[key])
+        first_token = sorted(value for key in names for value in self.first_token[key])
+        statuses = sum((self.statuses[key] for key in names), Counter())
+        requests = sum(statuses.values())
+        result = {
+            "requests": requests,
+            "ok": statuses["200"],
+            "errors": {status: count for status, count in sorted(statuses.items()) if status != "200"},
+            "error_rate": round(1 - statuses["200"] / requests, 4) if requests else 0.0,
+            "rps": round(statuses["200"] / elapsed, 2) if elapsed else 0.0,
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "max_ms": round(latencies[-1] * 1000, 1) if latencies else None
+        }
+        if first_token:
+            result.update({
+                "first_token_p50_ms": percentile(first_token, 50),
+                "first_token_p95_ms": percentile(first_token, 95),
+                "first_token_p99_ms": percentile(first_token, 99)
+            })
+        return result
+
+
+async def send(client: httpx.AsyncClient, url: str, task: str, payload: dict, stream: bool, recorder: Recorder) -> None:
+    name = f"{task}/stream" if stream else task
+    start = time.perf_counter()
+    first_token = None
+    try:
+        if stream:
+            async with client.stream("POST", url, json={**payload, "stream": True}) as response:
+                async for chunk in response.aiter_bytes():
+                    if first_token is None and chunk.strip():
+                        first_token = time.perf_counter() - start
+            status = str(response.status_code)
+        else:
+            response = await client.post(url, json=payload)
+            status = str(response.status_code)
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    recorder.record(name, status, time.perf_counter() - start, first_token)
+
+
+async def drive(url: str, args: argparse.Namespace, mix: Dict[str, float]) -> Tuple[Recorder, float]:
+    """
+    Closed loop: `concurrency` workers each send their next request as soon as the previous one finishes
+    """
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    tasks, weights = list(mix), list(mix.values())
+    counter = iter(range(sys.maxsize))
+    deadline = time.perf_counter() + args.duration if args.duration else None
+    headers = {args.client_header: "load-test"} if args.client_header else {}
+
+    async with httpx.AsyncClient(
+        timeout=args.timeout, headers=headers, limits=httpx.Limits(max_connections=args.concurrency)
+    ) as client:
+        async def worker():
+            while True:
+                n = next(counter)
+                if (args.requests and n >= args.requests) or (deadline and time.perf_counter() >= deadline):
+                    return
+                task = rng.choices(tasks, weights=weights)[0]
+                stream = task in STREAMABLE and rng.random() < args.stream_ratio
+                await send(client, url, task, build_payload(task, n, args.distinct), stream, recorder)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    return recorder, elapsed
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict) -> List[str]:
+    """
+    Print the change per task type against `baseline`; returns the regressions beyond --max-regression
+    """
+    limit = results["config"]["max_regression"]
+    regressions = []
+    print()
+    print(f"vs {baseline.get('revision') or 'baseline'} ({baseline.get('timestamp', '?')})")
+    print(f"{'task':<28}{'rps':>16}{'p95 ms':>20}{'p99 ms':>20}")
+    for name, current in results["tasks"].items():
+        before = baseline.get("tasks", {}).get(name)
+        if not before:
+            continue
+        cells = []
+        for metric, higher_is_better in (("rps", True), ("p95_ms", False), ("p99_ms", False)):
+            old, new = before.get(metric), current.get(metric)
+            if not old or new is None:
+                cells.append(f"{'-':>20}")
+                continue
+            change = (new - old) / old * 100
+            cells.append(f"{old:>8} -> {new:<8}{change:+.0f}%".rjust(20))
+            worse = -change if higher_is_better else change
+            if limit is not None and worse > limit:
+                regressions.append(f"{name} {metric}: {old} -> {new} ({change:+.1f}%)")
+        print(f"{name:<28}{''.join(cells)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /ai-task/ and report throughput and tail latency per task type")
+    parser.add_argument("--url", help="Base URL of a running server; by default the app is started in-process against the mock")
+    parser.add_argument("--concurrency", type=int, default=20, help="Requests kept in flight")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds to run (0 = until --requests)")
+    parser.add_argument("--requests", type=int, default=0, help="Stop after this many requests (0 = until --duration)")
+    parser.add_argument("--mix", default="qa=4,content_generation=4,image_generation=1,latest_answer=1", help="Task weights")
+    parser.add_argument("--stream-ratio", type=float, default=0.0, help="Share of QA and content requests sent with stream: true")
+    parser.add_argument("--distinct", type=int, default=0, help="Distinct prompts per task type (0 = every prompt unique)")
+    parser.add_argument("--client-header", default="", help="Header identifying the client (ADMISSION_CLIENT_HEADER)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--max-regression", type=float, help="With --compare, exit 1 when rps drops or p95/p99 grow by more than this percent")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    if not args.duration and not args.requests:
+        parser.error("one of --duration or --requests is required")
+
+    mix = parse_mix(args.mix)
+    upstream = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        mock_base = f"http://127.0.0.1:{MOCK_PORT}"
+        start_server(mock_app_from_args(args), MOCK_PORT)
+        workdir = tempfile.mkdtemp(prefix="load_test_")
+        os.environ["OPENROUTER_BASE_URL"] = f"{mock_base}/api/v1"
+        os.environ.setdefault("OPENROUTER_API_KEY", "mock-key")
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir}/app.db")
+        os.environ.setdefault("BLOB_STORE_PATH", f"{workdir}/blobs")
+        # One load generator stands for many clients: don't throttle it as a single one
+        os.environ.setdefault("ADMISSION_CLIENT_RATE", "0")
+
+        from main import app
+
+        start_server(app, APP_PORT)
+        base_url = f"http://127.0.0.1:{APP_PORT}"
+
+    print(f"load: {args.concurrency} concurrent, {args.duration or '-'} s / {args.requests or '-'} requests, mix {mix}")
+    recorder, elapsed = asyncio.run(drive(f"{base_url}/ai-task/", args, mix))
+    if not args.url:
+        upstream = httpx.get(f"http://127.0.0.1:{MOCK_PORT}/mock/stats").json()
+
+    results = {
+        "revision": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "elapsed_s": round(elapsed, 2),
+        "overall": recorder.summary(None, elapsed),
+        "tasks": {name: recorder.summary(name, elapsed) for name in sorted(recorder.statuses)},
+        "upstream": upstream
+    }
+
+    print()
+    print(f"{'task':<28}{'requests':>10}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ttft p95':>10}")
+    for name, summary in list(results["tasks"].items()) + [("overall", results["overall"])]:
+        print(
+            f"{name:<28}{summary['requests']:>10}{sum(summary['errors'].values()):>8}{summary['rps']:>9}"
+            f"{str(summary['p50_ms']):>10}{str(summary['p95_ms']):>10}{str(summary['p99_ms']):>10}"
+            f"{str(summary.get('first_token_p95_ms', '-')):>10}"
+        )
+    if upstream:
+        print(f"upstream calls: {upstream['calls']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f))
+        if regressions:
+            print()
+            print("Regressions beyond --max-regression:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
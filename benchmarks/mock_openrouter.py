@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Local mock of the OpenRouter API used by the benchmark scripts
+
+Serves /api/v1/chat/completions (including `stream: true`, and JSON answers when `response_format`
+asks for a JSON object) and /api/v1/images/generations with an artificial latency so upstream
+behaviour is reproducible without network access or quota. Latency can be fixed or drawn from a
+uniform, exponential or lognormal distribution (optionally per model), a share of calls can fail
+with 500 or be rate limited with 429 + Retry-After, and response sizes are configurable.
+GET /mock/stats counts the calls answered per model and status.
+
+Usage:
+    python benchmarks/mock_openrouter.py --port 8765 --latency 0.5
+    python benchmarks/mock_openrouter.py --latency 0.8 --distribution lognormal --spread 0.5 \
+        --error-rate 0.01 --rate-limit-rate 0.05 --retry-after 1 --words 200 --image-size 512
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import random
+import re
+from collections import Counter
+from io import BytesIO
+from typing import Callable, Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from PIL import Image
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+
+def latency_sampler(distribution: str, latency: float, spread: float, rng: random.Random) -> Callable[[], float]:
+    """
+    Seconds to wait per call: `latency` is the fixed value, the mean (uniform, exponential) or the
+    median (lognormal); `spread` is the +/- range (uniform) or sigma (lognormal)
+    """
+    if distribution == "uniform":
+        return lambda: rng.uniform(max(0.0, latency - spread), latency + spread)
+    if distribution == "exponential":
+        return lambda: rng.expovariate(1 / latency) if latency > 0 else 0.0
+    if distribution == "lognormal":
+        return lambda: latency * rng.lognormvariate(0, spread)
+    if distribution != "fixed":
+        raise ValueError(f"Unknown latency distribution {distribution}; available: {', '.join(LATENCY_DISTRIBUTIONS)}")
+    return lambda: latency
+
+
+def parse_model_latency(spec: str) -> Dict[str, float]:
+    """
+    "model-a=0.2,model-b=1.5" -> {model: latency}
+    """
+    latencies: Dict[str, float] = {}
+    for item in spec.split(","):
+        model, _, latency = item.strip().rpartition("=")
+        if model.strip() and latency.strip():
+            latencies[model.strip()] = float(latency)
+    return latencies
+
+
+def create_mock_app(
+    latency: float = 0.5,
+    distribution: str = "fixed",
+    spread: float = 0.0,
+    model_latency: Optional[Dict[str, float]] = None,
+    error_rate: float = 0.0,
+    rate_limit_rate: float = 0.0,
+    retry_after: float = 1.0,
+    words: int = 0,
+    image_size: int = 64,
+    token_delay: float = 0.005,
+    seed: Optional[int] = None
+) -> FastAPI:
+    """
+    Build a FastAPI app that imitates the OpenRouter endpoints used by the services.
+    `words` pads each chat post with that many extra words; `image_size` is the edge of the returned PNG.
+    """
+    app = FastAPI(title="Mock OpenRouter")
+    rng = random.Random(seed)
+    samplers = {None: latency_sampler(distribution, latency, spread, rng)}
+    for model, median in (model_latency or {}).items():
+        samplers[model] = latency_sampler(distribution, median, spread, rng)
+    stats: Counter = Counter()
+
+    buffered = BytesIO()
+    Image.new("RGB", (image_size, image_size), color=(64, 128, 255)).save(buffered, format="PNG")
+    image_b64 = base64.b64encode(buffered.getvalue()).decode()
+    filler = " ".join(f"word{i}" for i in range(words))
+
+    async def upstream(payload: dict) -> Optional[JSONResponse]:
+        """
+        Wait out the sampled latency; returns an error response for calls picked to fail
+        """
+        model = payload.get("model")
+        roll = rng.random()
+        if roll < rate_limit_rate:
+            # Like OpenRouter, a rate-limited call is refused at once
+            stats[(model, 429)] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit exceeded (mock)", "code": 429}},
+                status_code=429,
+                headers={"Retry-After": f"{retry_after:g}"}
+            )
+        await asyncio.sleep((samplers.get(model) or samplers[None])())
+        if roll < rate_limit_rate + error_rate:
+            stats[(model, 500)] += 1
+            return JSONResponse({"error": {"message": "Internal error (mock)", "code": 500}}, status_code=500)
+        stats[(model, 200)] += 1
+        return None
+
+    @app.post("/api/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        failure = await upstream(payload)
+        if failure is not None:
+            return failure
+        content = "\n\n".join(
+            f"**Post {i}:**\nMock response from {payload.get('model')} with enough text to pass validation. {filler}".rstrip()
+            for i in range(1, 4)
+        )
+        if (payload.get("response_format") or {}).get("type") == "json_object":
+            content = json_content(payload)
+        if payload.get("stream"):
+            return StreamingResponse(stream_completion(payload.get("model"), content), media_type="text/event-stream")
+        return {
+            "id": "mock-completion",
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 50, "completion_tokens": 60 + 3 * words, "total_tokens": 110 + 3 * words},
+        }
+
+    def json_content(payload: dict) -> str:
+        # Multi-platform content prompts name the expected keys
+        match = re.search(r"exactly these keys: ([^.]+)\.", payload["messages"][-1]["content"])
+        keys = [key.strip() for key in match.group(1).split(",")] if match else ["result"]
+        return json.dumps({
+            key: [f"Mock {key} variation {i} from {payload.get('model')}. {filler}".rstrip() for i in range(1, 4)]
+            for key in keys
+        })
+
+    async def stream_completion(model: str, content: str):
+        yield ": OPENROUTER PROCESSING\n\n"
+        for word in content.split(" "):
+            chunk = {"model": model, "choices": [{"index": 0, "delta": {"content": word + " "}}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(token_delay)
+        yield "data: [DONE]\n\n"
+
+    @app.post("/api/v1/images/generations")
+    async def images_generations(request: Request):
+        failure = await upstream(await request.json())
+        if failure is not None:
+            return failure
+        return {"created": 0, "data": [{"b64_json": image_b64}]}
+
+    @app.get("/mock/stats")
+    async def mock_stats():
+        """
+        Calls answered so far, per model and status code
+        """
+        per_model: Dict[str, Dict[str, int]] = {}
+        for (model, status), count in stats.items():
+            per_model.setdefault(str(model), {})[str(status)] = count
+        return {"calls": sum(stats.values()), "models": per_model}
+
+    return app
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Mock behaviour options, shared with the benchmarks that start the mock themselves
+    """
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds to wait before answering (mean or median)")
+    parser.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS, default="fixed", help="Latency distribution")
+    parser.add_argument("--spread", type=float, default=0.0, help="Uniform +/- range, or lognormal sigma")
+    parser.add_argument("--model-latency", default="", help="Per-model latency overrides, e.g. 'model-a=0.2,model-b=1.5'")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of calls answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--words", type=int, default=0, help="Extra words per chat post (response size)")
+    parser.add_argument("--image-size", type=int, default=64, help="Edge of the generated PNG in pixels")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="Seconds between streamed tokens")
+    parser.add_argument("--seed", type=int, help="Seed for latency and failure sampling")
+
+
+def mock_app_from_args(args: argparse.Namespace) -> FastAPI:
+    return create_mock_app(
+        latency=args.latency,
+        distribution=args.distribution,
+        spread=args.spread,
+        model_latency=parse_model_latency(args.model_latency),
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        words=args.words,
+        image_size=args.image_size,
+        token_delay=args.token_delay,
+        seed=args.seed
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run a local mock of the OpenRouter API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    uvicorn.run(mock_app_from_args(args), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Response serialization benchmark
+
+For a representative result of each task type, compares:
+  - the default FastAPI path: response_model re-validation of TaskResponse, jsonable_encoder,
+    stdlib json rendering in JSONResponse
+  - the fast path in app/responses.py: the TaskResponse rendered directly (orjson when installed)
+and reports the bytes on the wire uncompressed and with each available encoding from
+app/compression.py (with the time to compress), plus the raw-bytes image mode.
+
+Usage:
+    python benchmarks/serialization_benchmark.py --iterations 200 --image-kb 1200
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.compression import ENCODERS
+from app.models import TaskResponse
+from app.responses import task_response
+
+WORDS = (
+    "the a of to and in for with on at by from async python service request response latency cache model "
+    "database image content platform post audience engagement strategy growth brand story launch product team "
+    "users data scale performance stream token prompt answer question context summary insight trend"
+).split()
+
+
+def prose(words: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def build_payloads(image_kb: int) -> dict:
+    # Random bytes stand in for an already-compressed PNG, so compression gains on images are realistic
+    image_bytes = os.urandom(image_kb * 1024)
+    return {
+        "qa": TaskResponse(task="qa", result=prose(120)),
+        "content_generation": TaskResponse(task="content_generation", result=prose(1500)),
+        "image_generation (url)": TaskResponse(task="image_generation", result="/ai-task/images/" + "ab" * 32),
+        "image_generation (b64_json)": TaskResponse(task="image_generation", result=base64.b64encode(image_bytes).decode()),
+        "image_generation (binary)": image_bytes
+    }
+
+
+def default_path(response: TaskResponse) -> bytes:
+    validated = TaskResponse.model_validate(response.model_dump())
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+def fast_path(response: TaskResponse) -> bytes:
+    return task_response(response).body
+
+
+def time_ms(fn, arg, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn(arg)
+    return (time.perf_counter() - started) / iterations * 1000
+
+
+def bench(name: str, payload, iterations: int) -> dict:
+    if isinstance(payload, bytes):
+        # Raw image mode: the body is the stored bytes, nothing to serialize
+        result = {"default_ms": None, "fast_ms": 0.0}
+        body = payload
+    else:
+        result = {
+            "default_ms": round(time_ms(default_path, payload, iterations), 4),
+            "fast_ms": round(time_ms(fast_path, payload, iterations), 4)
+        }
+        body = fast_path(payload)
+        if json.loads(body) != json.loads(default_path(payload)):
+            raise AssertionError(f"{name}: fast path output differs from the default path")
+    result["bytes"] = {"identity": len(body)}
+    result["compress_ms"] = {}
+    for encoding, encode in ENCODERS.items():
+        runs = max(1, iterations // 10)
+        result["compress_ms"][encoding] = round(time_ms(encode, body, runs), 3)
+        result["bytes"][encoding] = len(encode(body))
+    print(f"[{name}] {result}")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark task response serialization and compression")
+    parser.add_argument("--iterations", type=int, default=200, help="Serializations timed per payload")
+    parser.add_argument("--image-kb", type=int, default=1200, help="Size of the generated image in KiB")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {name: bench(name, payload, args.iterations) for name, payload in build_payloads(args.image_kb).items()}
+
+    print()
+    encodings = list(ENCODERS)
+    print(f"{'task':<30}{'default ms':>12}{'fast ms':>10}{'identity B':>12}" + "".join(f"{e + ' B':>12}" for e in encodings))
+    for name, result in results.items():
+        default_ms = "-" if result["default_ms"] is None else result["default_ms"]
+        print(
+            f"{name:<30}{default_ms:>12}{result['fast_ms']:>10}{result['bytes']['identity']:>12}"
+            + "".join(f"{result['bytes'][e]:>12}" for e in encodings)
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -1,14 +1,52 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 import os
 from app.api import router as api_router
 from app.settings import settings
+from app import openrouter_client
+from app.migrations import upgrade_schema
+from app.database import SessionLocal
+from app.history_writer import history_writer
+from app.latest_answer import latest_answer
+from app.image_jobs import image_jobs
+from app import image_variants
+from app import metrics
+from app.timing import TimingMiddleware
+from app.compression import CompressionMiddleware
+import asyncio
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Bring databases created by older versions up to the current schema
+    upgrade_schema()
+    latest_answer.load()
+    if settings.history_write_behind:
+        history_writer.start(SessionLocal)
+    # Image job workers, starting with the jobs left unfinished by the previous run
+    await image_jobs.start(SessionLocal)
+    # In multiprocess mode, publish this worker's metrics for the other workers' /metrics
+    metrics_sync = asyncio.create_task(metrics.sync_worker_file()) if settings.metrics_multiproc_dir else None
+    # Open the shared OpenRouter connection pool for the application lifetime
+    await openrouter_client.start_client()
+    yield
+    await image_jobs.stop()
+    image_variants.shutdown()
+    await openrouter_client.close_client()
+    # Commit every history record still queued before the process exits
+    await history_writer.stop()
+    if metrics_sync is not None:
+        metrics_sync.cancel()
+        metrics.write_worker_file()
 
 app = FastAPI(
     title="AI Task API",
     description="An API for handling various AI tasks including Q&A, image generation, and content creation",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -18,8 +56,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["Server-Timing", "X-Request-ID"]
 )
 
+# Negotiated zstd/br/gzip compression of large non-streaming responses
+app.add_middleware(CompressionMiddleware)
+
+# Per-request phase timing (Server-Timing / X-Request-ID headers, optional JSON-lines log)
+app.add_middleware(TimingMiddleware)
+
 # Mount frontend files
 frontend_path = os.path.join(os.path.dirname(__file__), "app", "frontend")
 if os.path.exists(frontend_path):
@@ -27,6 +72,11 @@ if os.path.exists(frontend_path):
 
 app.include_router(api_router)
 
+# Prometheus scrape endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(await run_in_threadpool(metrics.render_metrics), media_type="text/plain; version=0.0.4")
+
 # Serve the main page
 @app.get("/")
 async def root():
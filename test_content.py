@@ -26,7 +26,7 @@ async def test_content_generation():
         print("-" * 30)
         
         try:
-            content = generate_content(test_prompt, platform, db=None)
+            content = await generate_content(test_prompt, platform, db=None)
             print(f"✅ Generated content length: {len(content)} characters")
             print(f"📝 Content preview:\n{content[:200]}...")
             
@@ -0,0 +1,64 @@
+"""
+Shared fixtures: a fresh copy of every piece of process-wide upstream state per test, and
+settings overrides that are undone afterwards
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import hedging, model_health, openrouter_client, rate_limits
+from app.admission import AdmissionController
+from app.key_pool import KeyPool
+from app.rate_limits import RateLimitController
+from app.settings import settings
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def configure(monkeypatch):
+    """
+    configure(hedge_policy="race", ...) sets settings for the duration of the test
+    """
+    def apply(**values):
+        for name, value in values.items():
+            assert hasattr(settings, name), name
+            monkeypatch.setattr(settings, name, value)
+    return apply
+
+
+@pytest.fixture(autouse=True)
+def fresh_health(monkeypatch):
+    """
+    Circuit breakers and hedging stats start empty in every test
+    """
+    monkeypatch.setattr(model_health, "_health", {})
+    monkeypatch.setattr(hedging, "hedging_stats", hedging.HedgingStats())
+
+
+@pytest.fixture
+def upstream(monkeypatch, configure):
+    """
+    upstream(transport, keys=[...]) points the OpenRouter client at `transport` (an ASGITransport over
+    benchmarks/mock_openrouter.py, or an httpx.MockTransport) with fresh admission, rate-limit and
+    key pool state, and returns that state
+    """
+    def connect(transport: httpx.AsyncBaseTransport, keys=("key-one",)):
+        configure(openrouter_api_key=keys[0], openrouter_api_keys=",".join(keys[1:]), openrouter_api_keys_file="")
+        state = SimpleNamespace(admission=AdmissionController(), rate_limits=RateLimitController(), key_pool=KeyPool())
+        monkeypatch.setattr(openrouter_client, "admission", state.admission)
+        monkeypatch.setattr(rate_limits, "admission", state.admission)
+        monkeypatch.setattr(openrouter_client, "rate_limits", state.rate_limits)
+        monkeypatch.setattr(openrouter_client, "key_pool", state.key_pool)
+        monkeypatch.setattr(openrouter_client, "_client", httpx.AsyncClient(transport=transport, base_url="http://mock/api/v1"))
+        return state
+    return connect
@@ -0,0 +1,147 @@
+"""
+Client token buckets and per-model concurrency limits with their bounded FIFO queue
+"""
+
+import asyncio
+
+import pytest
+
+from app.admission import (
+    AdmissionController, ClientLimiter, ModelLimiter, OverloadedError, RateLimitedError, background, parse_model_limits
+)
+
+pytestmark = pytest.mark.anyio
+
+
+async def settle():
+    """
+    Let woken waiters run (the queue timeout wraps each wait in its own task)
+    """
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.fixture
+def limits(configure):
+    configure(
+        admission_enabled=True, admission_client_rate=1.0, admission_client_burst=3.0,
+        admission_model_concurrency=2, admission_queue_size=2, admission_queue_timeout=5.0, admission_retry_after=5.0
+    )
+
+
+def test_parse_model_limits():
+    assert parse_model_limits("a/b:free=2, c/d=4,,bad") == {"a/b:free": 2, "c/d": 4}
+
+
+async def test_client_bucket_allows_burst_then_rejects_with_retry_after(limits):
+    clients = ClientLimiter(max_clients=10)
+    for _ in range(3):
+        clients.check("ip:1")
+    with pytest.raises(RateLimitedError) as rejected:
+        clients.check("ip:1")
+    assert rejected.value.status_code == 429
+    assert 0 < rejected.value.retry_after <= 1.0
+    assert rejected.value.headers == {"Retry-After": "1"}
+    # Other clients have their own bucket
+    clients.check("ip:2")
+
+
+async def test_oversized_batch_empties_the_bucket_instead_of_never_fitting(limits):
+    clients = ClientLimiter(max_clients=10)
+    clients.check("ip:1", cost=50)
+    with pytest.raises(RateLimitedError):
+        clients.check("ip:1")
+
+
+async def test_client_limiter_forgets_least_recently_seen_clients(limits):
+    clients = ClientLimiter(max_clients=2)
+    for client in ("a", "b", "c"):
+        clients.check(client)
+    assert list(clients.buckets) == ["b", "c"]
+
+
+async def test_slots_are_handed_to_waiters_in_arrival_order(limits):
+    limiter = ModelLimiter("model", 1)
+    await limiter.acquire()
+    order = []
+
+    async def wait(name):
+        await limiter.acquire()
+        order.append(name)
+
+    waiters = [asyncio.ensure_future(wait(name)) for name in ("first", "second")]
+    await settle()
+    assert limiter.queue_depth == 2
+    limiter.release()
+    await settle()
+    assert order == ["first"]
+    assert limiter.in_flight == 1
+    # A late arrival queues behind the waiter still queued
+    late = asyncio.ensure_future(wait("late"))
+    await settle()
+    assert limiter.queue_depth == 2
+    limiter.release()
+    limiter.release()
+    await asyncio.gather(*waiters, late)
+    assert order == ["first", "second", "late"]
+
+
+async def test_full_queue_sheds_at_once(limits):
+    limiter = ModelLimiter("model", 1)
+    await limiter.acquire()
+    waiters = [asyncio.ensure_future(limiter.acquire()) for _ in range(2)]
+    await settle()
+    with pytest.raises(OverloadedError) as shed:
+        await limiter.acquire()
+    assert shed.value.reason == "queue_full"
+    assert shed.value.status_code == 503
+    assert limiter.shed == 1
+    for _ in waiters:
+        limiter.release()
+    await asyncio.gather(*waiters)
+
+
+async def test_queue_timeout_sheds_and_leaves_no_waiter_behind(limits, configure):
+    configure(admission_queue_timeout=0.05)
+    limiter = ModelLimiter("model", 1)
+    await limiter.acquire()
+    with pytest.raises(OverloadedError) as shed:
+        await limiter.acquire()
+    assert shed.value.reason == "queue_timeout"
+    assert limiter.queue_depth == 0
+    limiter.release()
+    assert limiter.in_flight == 0
+
+
+async def test_lowering_the_limit_holds_new_calls_until_in_flight_drops(limits):
+    limiter = ModelLimiter("model", 2)
+    await limiter.acquire()
+    await limiter.acquire()
+    limiter.set_limit(1)
+    waiter = asyncio.ensure_future(limiter.acquire())
+    limiter.release()
+    await settle()
+    assert not waiter.done()
+    limiter.release()
+    await waiter
+    assert limiter.in_flight == 1
+
+
+async def test_background_work_queues_past_the_queue_size(limits):
+    admission = AdmissionController()
+    held = [admission.slot("model") for _ in range(2)]
+    for slot in held:
+        await slot.__aenter__()
+
+    async def call():
+        async with admission.slot("model"):
+            pass
+
+    with background():
+        queued = [asyncio.ensure_future(call()) for _ in range(4)]
+        await settle()
+    assert admission.model("model").queue_depth == 4
+    for slot in held:
+        await slot.__aexit__(None, None, None)
+    await asyncio.gather(*queued)
+    assert admission.model("model").in_flight == 0
@@ -0,0 +1,134 @@
+"""
+Content-addressed blob store and the image route: put/dedupe/read_range, Range requests (including
+malformed headers) and ETag revalidation
+"""
+
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import api
+from app.api import _etag_matches, _parse_range
+from app.blob_store import BlobStore, LocalBlobStore, blob_digest
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalBlobStore(str(tmp_path / "blobs"))
+
+
+@pytest.fixture
+def client(store, monkeypatch):
+    monkeypatch.setattr(api, "blob_store", store)
+    app = FastAPI()
+    app.include_router(api.router)
+    return TestClient(app)
+
+
+def test_put_is_content_addressed_and_deduplicated(store):
+    digest = store.put(PNG)
+    assert digest == blob_digest(PNG)
+    assert store.put(PNG) == digest
+    files = [name for _, _, names in os.walk(store.root) for name in names]
+    assert files == [digest]
+    assert store.path(digest).endswith(os.path.join(digest[:2], digest[2:4], digest))
+
+
+def test_read_range_and_size(store):
+    digest = store.put(PNG)
+    assert store.size(digest) == len(PNG)
+    assert b"".join(store.read_range(digest, 8, 11, chunk_size=3)) == PNG[8:12]
+    assert list(store.read_range(digest, 0, 9, chunk_size=4)) == [PNG[0:4], PNG[4:8], PNG[8:10]]
+    # Past the end the read stops at the last byte
+    assert b"".join(store.read_range(digest, len(PNG) - 2, len(PNG) + 10)) == PNG[-2:]
+    assert store.get(digest) == PNG
+    assert store.head(digest, 8) == PNG[:8]
+
+
+def test_missing_and_invalid_digests(store):
+    assert store.size("0" * 64) is None
+    assert store.get("0" * 64) is None
+    assert store.size("../../etc/passwd") is None
+    with pytest.raises(ValueError):
+        store.path("not-a-digest")
+
+
+def test_backend_must_implement_the_interface():
+    class Incomplete(BlobStore):
+        def put(self, data):
+            return blob_digest(data)
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, (0, 99)),
+    ("bytes=0-9", (0, 9)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=90-500", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    # Malformed or multi-range headers are ignored: the whole blob
+    ("bytes=0-9,20-29", (0, 99)),
+    ("items=0-9", (0, 99)),
+    ("bytes=abc-def", (0, 99)),
+    ("bytes=-", (0, 99)),
+    ("bytes=9-5", (0, 99)),
+    ("bytes=--5", (0, 99)),
+    ("bytes=1-2-3", (0, 99)),
+    # Unsatisfiable
+    ("bytes=100-", None),
+    ("bytes=-0", None),
+])
+def test_parse_range(header, expected):
+    assert _parse_range(header, 100) == expected
+
+
+def test_etag_matches():
+    etag = '"abc"'
+    assert _etag_matches('"abc"', etag)
+    assert _etag_matches('W/"abc"', etag)
+    assert _etag_matches('"other", "abc"', etag)
+    assert _etag_matches("*", etag)
+    assert not _etag_matches('"abcd"', etag)
+    assert not _etag_matches(None, etag)
+
+
+def test_image_route_serves_ranges(client, store):
+    digest = store.put(PNG)
+    url = f"/ai-task/images/{digest}"
+    full = client.get(url)
+    assert full.status_code == 200
+    assert full.content == PNG
+    assert full.headers["content-type"] == "image/png"
+    assert full.headers["etag"] == f'"{digest}"'
+
+    partial = client.get(url, headers={"Range": "bytes=8-15"})
+    assert partial.status_code == 206
+    assert partial.content == PNG[8:16]
+    assert partial.headers["content-range"] == f"bytes 8-15/{len(PNG)}"
+
+    assert client.get(url, headers={"Range": "bytes=x-y"}).content == PNG
+    unsatisfiable = client.get(url, headers={"Range": f"bytes={len(PNG)}-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == f"bytes */{len(PNG)}"
+
+
+def test_image_route_revalidates_with_etag(client, store):
+    digest = store.put(PNG)
+    url = f"/ai-task/images/{digest}"
+    etag = client.get(url).headers["etag"]
+    not_modified = client.get(url, headers={"If-None-Match": f"W/{etag}"})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert client.get(url, headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_image_route_unknown_digest(client):
+    assert client.get(f"/ai-task/images/{'0' * 64}").status_code == 404
+    assert client.get("/ai-task/images/not-a-digest").status_code == 404
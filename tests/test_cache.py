@@ -0,0 +1,113 @@
+"""
+Response cache: key normalization, the memory and SQLite backends, and cache hits, misses and the
+`cache: false` bypass in the QA service
+"""
+
+import time
+
+import httpx
+import pytest
+
+from app.cache import CacheStats, MemoryCacheBackend, ResponseCache, SQLiteCacheBackend
+from app.services import qa_service
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def cache(configure, monkeypatch):
+    configure(cache_ttl_seconds=60.0, cache_max_entries=100, cache_max_bytes=0, hedge_policy="sequential", routing_policy="ordered")
+    response_cache = ResponseCache("memory")
+    monkeypatch.setattr(qa_service, "response_cache", response_cache)
+    return response_cache
+
+
+@pytest.fixture
+def answers(upstream):
+    """
+    Upstream answering every chat completion with a numbered answer; returns the list of calls
+    """
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(200, json={"choices": [{"message": {"content": f"answer {len(calls)}"}}]})
+
+    upstream(httpx.MockTransport(handler))
+    return calls
+
+
+def test_key_ignores_whitespace_and_case_but_not_parameters():
+    key = ResponseCache.make_key("qa", "model", 0.7, 500, "What is AI?", "Some context")
+    assert key == ResponseCache.make_key("qa", "model", 0.7, 500, "  what   is ai? ", "some  CONTEXT")
+    assert key != ResponseCache.make_key("qa", "model", 0.2, 500, "What is AI?", "Some context")
+    assert key != ResponseCache.make_key("qa", "other-model", 0.7, 500, "What is AI?", "Some context")
+    assert key != ResponseCache.make_key("qa", "model", 0.7, 500, "What is AI?", "Other context")
+    assert key != ResponseCache.make_key("content", "model", 0.7, 500, "What is AI?", "Some context", platform="x")
+
+
+def test_memory_backend_evicts_least_recently_used():
+    stats = CacheStats()
+    backend = MemoryCacheBackend(stats, max_entries=2, max_bytes=0)
+    backend.set("a", "1", ttl=60)
+    backend.set("b", "2", ttl=60)
+    assert backend.get("a") == "1"
+    backend.set("c", "3", ttl=60)
+    assert backend.get("b") is None
+    assert (backend.get("a"), backend.get("c")) == ("1", "3")
+    assert stats.evictions == 1
+
+
+def test_memory_backend_bounds_total_size_and_expires_entries():
+    stats = CacheStats()
+    backend = MemoryCacheBackend(stats, max_entries=10, max_bytes=10)
+    backend.set("a", "x" * 6, ttl=60)
+    backend.set("b", "y" * 6, ttl=60)
+    assert backend.get("a") is None
+    assert backend.size_bytes == 6
+    backend.set("stale", "z", ttl=-1)
+    assert backend.get("stale") is None
+    assert stats.expirations == 1
+
+
+def test_sqlite_backend_survives_a_restart_and_evicts(tmp_path):
+    path = str(tmp_path / "cache" / "responses.db")
+    backend = SQLiteCacheBackend(CacheStats(), path, max_entries=2, max_bytes=0)
+    backend.set("a", "1", ttl=60)
+    backend.set("b", "2", ttl=60)
+    time.sleep(0.01)
+    backend.get("a")
+    backend.set("c", "3", ttl=60)
+    reopened = SQLiteCacheBackend(CacheStats(), path, max_entries=2, max_bytes=0)
+    assert (reopened.get("a"), reopened.get("b"), reopened.get("c")) == ("1", None, "3")
+    assert reopened.info()["entries"] == 2
+
+
+async def test_disabled_cache_never_hits():
+    disabled = ResponseCache("none")
+    await disabled.set("key", "value")
+    assert await disabled.get("key") is None
+    assert disabled.info()["backend"] == "none"
+
+
+async def test_repeated_question_is_served_from_the_cache(cache, answers):
+    first = await qa_service.perform_qa("What is AI?", "Some context")
+    again = await qa_service.perform_qa("  what is ai? ", "Some context")
+    assert first == again == "answer 1"
+    assert len(answers) == 1
+    assert (cache.stats.misses, cache.stats.hits, cache.stats.sets) == (1, 1, 1)
+
+
+async def test_cache_false_bypasses_the_cache(cache, answers):
+    await qa_service.perform_qa("What is AI?", "Some context")
+    fresh = await qa_service.perform_qa("What is AI?", "Some context", use_cache=False)
+    assert fresh == "answer 2"
+    assert len(answers) == 2
+    # Neither looked up nor stored: the cached answer is still the first one
+    assert (cache.stats.hits, cache.stats.sets) == (0, 1)
+    assert await qa_service.perform_qa("What is AI?", "Some context") == "answer 1"
+
+
+async def test_different_context_is_a_miss(cache, answers):
+    await qa_service.perform_qa("What is AI?", "Some context")
+    assert await qa_service.perform_qa("What is AI?", "Another context") == "answer 2"
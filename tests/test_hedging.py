@@ -0,0 +1,145 @@
+"""
+Fallback, hedging and race policies of call_with_fallback / stream_with_fallback
+"""
+
+import asyncio
+
+import pytest
+
+from app import hedging
+from app.admission import OverloadedError
+from app.hedging import AllModelsFailed, call_with_fallback, stream_with_fallback
+from app.model_health import get_model_health
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeModels:
+    """
+    call(model) sleeps for the model's delay, then fails or answers; records starts and cancellations
+    """
+    def __init__(self, delays, failing=()):
+        self.delays = delays
+        self.failing = set(failing)
+        self.started = []
+        self.cancelled = []
+
+    async def call(self, model):
+        self.started.append(model)
+        try:
+            await asyncio.sleep(self.delays[model])
+        except asyncio.CancelledError:
+            self.cancelled.append(model)
+            raise
+        if model in self.failing:
+            raise Exception(f"{model} failed")
+        return f"answer from {model}"
+
+
+async def test_sequential_falls_back_only_after_primary_fails():
+    models = FakeModels({"a": 0.01, "b": 0.01}, failing={"a"})
+    result, winner = await call_with_fallback("qa", ["a", "b"], models.call, policy="sequential")
+    assert (result, winner) == ("answer from b", "b")
+    assert models.started == ["a", "b"]
+    assert get_model_health("a").snapshot()["samples"] == 1
+
+
+async def test_sequential_does_not_start_alternative_when_primary_succeeds():
+    models = FakeModels({"a": 0.01, "b": 0.01})
+    _, winner = await call_with_fallback("qa", ["a", "b"], models.call, policy="sequential")
+    assert winner == "a"
+    assert models.started == ["a"]
+
+
+async def test_hedged_fires_alternative_after_delay_and_cancels_the_loser(configure):
+    configure(hedge_delay="0.05")
+    models = FakeModels({"a": 5.0, "b": 0.01})
+    _, winner = await call_with_fallback("qa", ["a", "b"], models.call, policy="hedged")
+    assert winner == "b"
+    assert models.started == ["a", "b"]
+    assert models.cancelled == ["a"]
+    assert hedging.hedging_stats.kinds["qa"]["hedges_fired"] == 1
+    # A cancelled call is not a failure of the slow model
+    assert get_model_health("a").snapshot()["samples"] == 0
+
+
+async def test_hedged_does_not_fire_when_primary_answers_in_time(configure):
+    configure(hedge_delay="1.0")
+    models = FakeModels({"a": 0.01, "b": 0.01})
+    _, winner = await call_with_fallback("qa", ["a", "b"], models.call, policy="hedged")
+    assert winner == "a"
+    assert models.started == ["a"]
+    assert hedging.hedging_stats.kinds["qa"]["hedges_fired"] == 0
+
+
+async def test_race_starts_every_model_and_cancels_the_slower_one():
+    models = FakeModels({"a": 5.0, "b": 0.01})
+    _, winner = await call_with_fallback("qa", ["a", "b"], models.call, policy="race")
+    assert winner == "b"
+    assert sorted(models.started) == ["a", "b"]
+    assert models.cancelled == ["a"]
+
+
+async def test_all_models_failing_raises_with_every_error():
+    models = FakeModels({"a": 0.0, "b": 0.0}, failing={"a", "b"})
+    with pytest.raises(AllModelsFailed) as failure:
+        await call_with_fallback("qa", ["a", "b"], models.call)
+    assert str(failure.value.primary_error) == "a failed"
+    assert str(failure.value.fallback_error) == "b failed"
+    assert hedging.hedging_stats.kinds["qa"]["all_failed"] == 1
+
+
+async def test_all_models_failed_describes_every_model(configure):
+    configure(hedge_policy="sequential")
+    models = FakeModels({"a": 0.0, "b": 0.0, "c": 0.0}, failing={"a", "b", "c"})
+    with pytest.raises(AllModelsFailed) as failure:
+        await call_with_fallback("qa", ["a", "b", "c"], models.call)
+    assert failure.value.describe(["a", "b", "c"]) == "a: a failed; b: b failed; c: c failed"
+
+
+async def test_open_breaker_is_skipped_without_calling_the_model(configure):
+    configure(breaker_open_seconds=60.0)
+    get_model_health("a")._open()
+    models = FakeModels({"a": 0.0, "b": 0.0})
+    _, winner = await call_with_fallback("qa", ["a", "b"], models.call)
+    assert winner == "b"
+    assert models.started == ["b"]
+
+
+async def test_shed_models_raise_overloaded_instead_of_all_models_failed():
+    async def shed(model):
+        raise OverloadedError(model, "queue_full", 5)
+
+    with pytest.raises(OverloadedError):
+        await call_with_fallback("qa", ["a", "b"], shed)
+    # Shedding is not a model failure
+    assert get_model_health("a").snapshot()["samples"] == 0
+
+
+async def test_stream_falls_back_before_the_first_token():
+    async def open_stream(model):
+        if model == "a":
+            raise Exception("a failed")
+        for token in ("one ", "two"):
+            yield token
+
+    tokens, model = await stream_with_fallback("qa", ["a", "b"], open_stream)
+    assert model == "b"
+    assert [token async for token in tokens] == ["one ", "two"]
+    assert get_model_health("a").snapshot()["error_rate"] == 1.0
+    assert get_model_health("b").snapshot()["error_rate"] == 0.0
+
+
+def test_parse_hedge_delay():
+    assert hedging.parse_hedge_delay("p95") == (95.0, None)
+    assert hedging.parse_hedge_delay(" 0.8 ") == (None, 0.8)
+    for malformed in ("fast", "p", "p0", "p150", "-1"):
+        assert hedging.parse_hedge_delay(malformed) == (None, None)
+
+
+async def test_malformed_hedge_delay_uses_the_default(configure):
+    configure(hedge_delay="soon", hedge_default_delay=0.05)
+    assert hedging.get_hedge_delay("a") == 0.05
+    models = FakeModels({"a": 5.0, "b": 0.01})
+    _, winner = await call_with_fallback("qa", ["a", "b"], models.call, policy="hedged")
+    assert winner == "b"
@@ -0,0 +1,196 @@
+"""
+Image jobs: the priority queue and its workers, polling job status, restoring unfinished jobs, and
+webhook URL validation and delivery
+"""
+
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app import image_jobs as image_jobs_module
+from app.database import ImageJob, build_engine, init_db
+from app.image_jobs import ImageJobQueue, QueueFullError, validate_webhook_url
+from app.services.image_service import IMAGE_ROUTE
+
+pytestmark = pytest.mark.anyio
+
+IMAGE_URL = f"{IMAGE_ROUTE}/{'ab' * 32}"
+
+
+class FakeGenerator:
+    """
+    Stands in for generate_image: records prompts and holds every call while `gate` is clear
+    """
+    def __init__(self):
+        self.prompts = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def __call__(self, prompt, db):
+        await self.gate.wait()
+        self.prompts.append(prompt)
+        if prompt == "fail":
+            # generate_image reports total failure as text
+            return "Image generation failed: upstream unavailable"
+        return IMAGE_URL
+
+
+@pytest.fixture
+def sessions(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path}/jobs.db")
+    init_db(engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def generator(monkeypatch, configure):
+    configure(image_job_workers=1, image_job_queue_size=10, image_job_webhook_retries=0, image_job_webhook_allowed_hosts="")
+    fake = FakeGenerator()
+    monkeypatch.setattr(image_jobs_module, "generate_image", fake)
+    return fake
+
+
+@pytest.fixture
+async def jobs(sessions, generator):
+    queue = ImageJobQueue()
+    await queue.start(sessions)
+    yield queue
+    await queue.stop()
+
+
+async def until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+async def poll(jobs, job_id: str):
+    """
+    Poll a job like a client would until it has finished
+    """
+    deadline = time.monotonic() + 5.0
+    while True:
+        view = await jobs.get(job_id)
+        if view["status"] not in ("queued", "running"):
+            return view
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+async def test_job_is_polled_until_it_succeeds(jobs):
+    submitted = await jobs.submit("a lighthouse")
+    assert submitted["status"] == "queued"
+    assert submitted["status_url"] == f"/ai-task/jobs/{submitted['job_id']}"
+    finished = await poll(jobs, submitted["job_id"])
+    assert finished["status"] == "succeeded"
+    assert finished["result"] == IMAGE_URL
+    assert finished["started_at"] and finished["finished_at"]
+    assert jobs.snapshot()["succeeded"] == 1
+
+
+async def test_failed_generation_is_reported_on_the_job(jobs):
+    finished = await poll(jobs, (await jobs.submit("fail"))["job_id"])
+    assert finished["status"] == "failed"
+    assert finished["result"] is None
+    assert "upstream unavailable" in finished["error"]
+    assert jobs.snapshot()["failed"] == 1
+
+
+async def test_unknown_job_is_none(jobs):
+    assert await jobs.get("missing") is None
+
+
+async def test_higher_priority_runs_first(jobs, generator):
+    generator.gate.clear()
+    await jobs.submit("blocker")
+    await until(lambda: jobs.active == 1)
+    low = await jobs.submit("low", priority=0)
+    high = await jobs.submit("high", priority=9)
+    generator.gate.set()
+    for job in (low, high):
+        await poll(jobs, job["job_id"])
+    assert generator.prompts == ["blocker", "high", "low"]
+
+
+async def test_full_queue_rejects_new_jobs(jobs, generator, configure):
+    configure(image_job_queue_size=1)
+    generator.gate.clear()
+    await jobs.submit("blocker")
+    await until(lambda: jobs.active == 1)
+    await jobs.submit("queued")
+    with pytest.raises(QueueFullError):
+        await jobs.submit("rejected")
+    assert jobs.snapshot()["rejected"] == 1
+    generator.gate.set()
+
+
+async def test_unfinished_jobs_are_restored_at_start(sessions, generator):
+    db = sessions()
+    db.add(ImageJob(id="interrupted", prompt="half done", priority=0, status="running"))
+    db.commit()
+    db.close()
+    queue = ImageJobQueue()
+    await queue.start(sessions)
+    try:
+        assert queue.restored == 1
+        assert (await poll(queue, "interrupted"))["status"] == "succeeded"
+    finally:
+        await queue.stop()
+
+
+async def test_webhook_receives_the_finished_job(jobs, configure):
+    configure(image_job_webhook_allowed_hosts="hooks.example")
+    delivered = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        delivered.append((str(request.url), json.loads(request.content)))
+        return httpx.Response(204)
+
+    await jobs.webhook_client.aclose()
+    jobs.webhook_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    submitted = await jobs.submit("a lighthouse", webhook_url="http://hooks.example/done")
+    await until(lambda: jobs.webhooks_sent == 1)
+    url, body = delivered[0]
+    assert url == "http://hooks.example/done"
+    assert (body["job_id"], body["status"], body["result"]) == (submitted["job_id"], "succeeded", IMAGE_URL)
+
+
+async def test_private_webhook_is_rejected_at_submission(jobs):
+    with pytest.raises(ValueError):
+        await jobs.submit("a lighthouse", webhook_url="http://127.0.0.1:8000/hook")
+    assert jobs.snapshot()["submitted"] == 0
+
+
+@pytest.mark.parametrize("url", [
+    "ftp://hooks.example/done",
+    "/relative/hook",
+    "http://127.0.0.1/hook",
+    "http://localhost:8000/hook",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://10.1.2.3/hook",
+    "http://192.168.0.10/hook",
+    "http://[::1]/hook",
+    "http://[::ffff:127.0.0.1]/hook",
+    "http://0.0.0.0/hook",
+])
+async def test_non_public_webhook_urls_are_rejected(url, configure):
+    configure(image_job_webhook_allowed_hosts="")
+    with pytest.raises(ValueError):
+        await validate_webhook_url(url)
+
+
+async def test_public_webhook_url_is_accepted(configure):
+    configure(image_job_webhook_allowed_hosts="")
+    await validate_webhook_url("https://93.184.216.34/hook")
+
+
+async def test_allow_list_replaces_the_address_check(configure):
+    configure(image_job_webhook_allowed_hosts="localhost, hooks.example")
+    await validate_webhook_url("http://localhost:8000/hook")
+    with pytest.raises(ValueError):
+        await validate_webhook_url("https://93.184.216.34/hook")
@@ -0,0 +1,120 @@
+"""
+API key pool: spreading calls over keys, quarantining keys answered with 429/401, rotating to
+another key, and reloading the keys file
+"""
+
+import json
+import os
+import time
+
+import httpx
+import pytest
+
+from app.key_pool import KeyPool, fingerprint
+from app.openrouter_client import CHAT_COMPLETIONS_PATH, post_json
+
+pytestmark = pytest.mark.anyio
+
+PAYLOAD = {"model": "model-a", "messages": [{"role": "user", "content": "hi"}]}
+
+
+@pytest.fixture(autouse=True)
+def quarantine(configure):
+    configure(
+        rate_limit_enabled=True, rate_limit_retry_budget=5.0, rate_limit_max_retries=2, rate_limit_jitter=0.0,
+        key_quarantine_seconds=300.0, key_rate_limit_quarantine_seconds=10.0, key_pool_reload_interval=0.0
+    )
+
+
+def by_key(statuses):
+    """
+    MockTransport answering each API key with its status (200 by default), recording the keys used
+    """
+    used = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        key = request.headers["authorization"].removeprefix("Bearer ")
+        used.append(key)
+        status = statuses.get(key, 200)
+        if status != 200:
+            return httpx.Response(status, headers={"Retry-After": "60"} if status == 429 else {})
+        return httpx.Response(200, json={"choices": [{"message": {"content": f"answer via {key}"}}]})
+
+    return httpx.MockTransport(handler), used
+
+
+async def test_calls_rotate_over_idle_keys(upstream):
+    transport, used = by_key({})
+    upstream(transport, keys=("key-one", "key-two", "key-three"))
+    for _ in range(6):
+        await post_json(CHAT_COMPLETIONS_PATH, PAYLOAD, timeout=5)
+    assert sorted(used) == sorted(["key-one", "key-two", "key-three"] * 2)
+
+
+async def test_concurrent_calls_take_the_least_loaded_key(upstream):
+    state = upstream(by_key({})[0], keys=("key-one", "key-two"))
+    with state.key_pool.use() as first, state.key_pool.use() as second:
+        assert {first.key, second.key} == {"key-one", "key-two"}
+
+
+async def test_rate_limited_key_is_quarantined_and_the_call_rotates_at_once(upstream):
+    transport, used = by_key({"key-one": 429})
+    state = upstream(transport, keys=("key-one", "key-two"))
+    started = time.monotonic()
+    result = await post_json(CHAT_COMPLETIONS_PATH, PAYLOAD, timeout=5)
+    assert result["choices"][0]["message"]["content"] == "answer via key-two"
+    assert used == ["key-one", "key-two"]
+    # No Retry-After wait and no model backoff: the limit was the key's
+    assert time.monotonic() - started < 1.0
+    assert state.rate_limits.model("model-a").rate_limited == 0
+    usage = {key["fingerprint"]: key for key in state.key_pool.snapshot()["usage"]}
+    assert usage[fingerprint("key-one")]["quarantine_reason"] == "429"
+    assert 50 < usage[fingerprint("key-one")]["quarantined_for_seconds"] <= 60
+
+
+async def test_unauthorized_key_is_quarantined_and_skipped_afterwards(upstream):
+    transport, used = by_key({"key-one": 401})
+    state = upstream(transport, keys=("key-one", "key-two"))
+    for _ in range(3):
+        await post_json(CHAT_COMPLETIONS_PATH, PAYLOAD, timeout=5)
+    assert used == ["key-one", "key-two", "key-two", "key-two"]
+    snapshot = state.key_pool.snapshot()
+    assert snapshot["available"] == 1
+    assert snapshot["usage"][0]["errors"] == {"401": 1}
+
+
+async def test_401_with_no_other_key_is_raised(upstream):
+    upstream(by_key({"key-one": 401})[0], keys=("key-one",))
+    with pytest.raises(httpx.HTTPStatusError):
+        await post_json(CHAT_COMPLETIONS_PATH, PAYLOAD, timeout=5)
+
+
+async def test_exhausted_quota_rests_the_key_until_reset(upstream):
+    state = upstream(by_key({})[0], keys=("key-one", "key-two"))
+    key = state.key_pool.keys[0]
+    key.record(200, {"x-ratelimit-remaining": "0", "x-ratelimit-reset": str(int((time.time() + 30) * 1000))})
+    assert not key.available(time.monotonic())
+    assert key.quarantine_reason == "exhausted"
+
+
+def test_keys_file_reload_keeps_state_of_surviving_keys(tmp_path, configure):
+    keys_file = tmp_path / "keys.txt"
+    keys_file.write_text("# rotated weekly\nkey-one\nkey-two\n")
+    configure(openrouter_api_key="", openrouter_api_keys="", openrouter_api_keys_file=str(keys_file), key_pool_reload_interval=0.0)
+    pool = KeyPool()
+    assert [key.key for key in pool.keys] == ["key-one", "key-two"]
+    pool.keys[1].record(401, {})
+
+    keys_file.write_text("key-two\nkey-three\n")
+    os.utime(keys_file, (time.time() + 5, time.time() + 5))
+    with pool.use():
+        pass
+    assert [key.key for key in pool.keys] == ["key-two", "key-three"]
+    assert pool.reloads == 1
+    # key-two is still quarantined after the reload
+    assert pool.snapshot()["available"] == 1
+
+
+def test_snapshot_never_exposes_keys(configure):
+    configure(openrouter_api_key="sk-or-secret-one", openrouter_api_keys="sk-or-secret-two", openrouter_api_keys_file="")
+    assert "secret" not in json.dumps(KeyPool().snapshot())
@@ -0,0 +1,96 @@
+"""
+Circuit breaker transitions CLOSED -> OPEN -> HALF_OPEN -> CLOSED / OPEN
+"""
+
+import pytest
+
+from app.model_health import CLOSED, HALF_OPEN, OPEN, ModelHealth
+
+
+@pytest.fixture
+def breaker(configure):
+    configure(
+        breaker_error_threshold=0.5, breaker_min_requests=4, breaker_window_seconds=60.0,
+        breaker_open_seconds=30.0, breaker_half_open_probes=1, breaker_slow_call_seconds=0.0
+    )
+    return ModelHealth("model", window=50)
+
+
+def trip(health):
+    for _ in range(4):
+        health.record(0.1, ok=False)
+
+
+def expire_open_period(health):
+    health.opened_at -= 31.0
+
+
+def test_stays_closed_below_min_requests(breaker):
+    for _ in range(3):
+        breaker.record(0.1, ok=False)
+    assert breaker.state == CLOSED
+    assert breaker.allow_request()
+
+
+def test_stays_closed_below_error_threshold(breaker):
+    for ok in (True, True, True, False, True, False, True):
+        breaker.record(0.1, ok=ok)
+    assert breaker.state == CLOSED
+
+
+def test_opens_at_error_threshold_and_rejects_calls(breaker):
+    trip(breaker)
+    assert breaker.state == OPEN
+    assert breaker.is_open()
+    assert not breaker.allow_request()
+    assert breaker.snapshot()["rejected_calls"] == 1
+
+
+def test_half_open_admits_a_single_probe(breaker):
+    trip(breaker)
+    expire_open_period(breaker)
+    assert not breaker.is_open()
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+    # The one probe slot is taken until the probe reports back
+    assert breaker.is_open()
+    assert not breaker.allow_request()
+
+
+def test_successful_probe_closes_and_forgets_old_failures(breaker):
+    trip(breaker)
+    expire_open_period(breaker)
+    assert breaker.allow_request()
+    breaker.record(0.1, ok=True)
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["samples"] == 0
+    # A single failure afterwards does not reopen it
+    breaker.record(0.1, ok=False)
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens(breaker):
+    trip(breaker)
+    expire_open_period(breaker)
+    assert breaker.allow_request()
+    breaker.record(0.1, ok=False)
+    assert breaker.state == OPEN
+    assert breaker.times_opened == 2
+    assert not breaker.allow_request()
+
+
+def test_released_probe_lets_the_next_call_probe(breaker):
+    trip(breaker)
+    expire_open_period(breaker)
+    assert breaker.allow_request()
+    breaker.release_probe()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+
+
+def test_slow_calls_count_as_failures(breaker, configure):
+    configure(breaker_slow_call_seconds=1.0)
+    for _ in range(4):
+        breaker.record(2.0, ok=True)
+    assert breaker.state == OPEN
+
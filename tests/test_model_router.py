@@ -0,0 +1,119 @@
+"""
+Model routing: pool parsing, tier filtering and the ordered / ewma / p2c policies
+"""
+
+import random
+
+import pytest
+
+from app import model_router
+from app.admission import AdmissionController
+from app.model_health import ModelHealth, get_model_health
+from app.model_router import ModelPool, PoolModel, parse_pool
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def routing(configure, monkeypatch):
+    configure(
+        routing_tiers="free,paid", routing_max_latency=0.0, routing_max_attempts=3, routing_ewma_alpha=0.5,
+        breaker_error_threshold=0.5, breaker_min_requests=2, breaker_open_seconds=30.0, breaker_slow_call_seconds=0.0,
+        admission_enabled=True, admission_model_concurrency=8, admission_model_limits=""
+    )
+    admission = AdmissionController()
+    monkeypatch.setattr(model_router, "admission", admission)
+    return admission
+
+
+def pool(*models, **options):
+    return ModelPool("chat", [PoolModel(model, **options) for model in models])
+
+
+def measured(model, seconds):
+    get_model_health(model).ewma_latency = seconds
+
+
+def test_parse_pool():
+    entries = parse_pool("a/fast:free=3|max_latency=5, b/slow|tier=premium,,c/plain")
+    assert [(entry.model, entry.weight, entry.tier, entry.max_latency) for entry in entries] == [
+        ("a/fast:free", 3.0, "free", 5.0), ("b/slow", 1.0, "premium", 0.0), ("c/plain", 1.0, "paid", 0.0)
+    ]
+
+
+def test_ordered_keeps_configuration_order():
+    measured("a", 5.0)
+    measured("b", 0.1)
+    assert pool("a", "b", "c").route("ordered") == ["a", "b", "c"]
+
+
+def test_max_attempts_truncates_the_route(configure):
+    configure(routing_max_attempts=2)
+    assert pool("a", "b", "c").route("ordered") == ["a", "b"]
+    configure(routing_max_attempts=0)
+    assert pool("a", "b", "c").route("ordered") == ["a"]
+
+
+def test_tier_filter_and_fallback_when_everything_is_excluded(configure):
+    configure(routing_tiers="free")
+    chat = pool("a:free", "b", "c:free")
+    assert chat.route("ordered") == ["a:free", "c:free"]
+    assert chat.excluded == ["b"]
+    everything_paid = pool("b", "d")
+    assert everything_paid.route("ordered") == ["b", "d"]
+    assert everything_paid.excluded == []
+
+
+async def test_ewma_orders_by_latency_times_load_over_weight(routing):
+    measured("a", 2.0)
+    measured("b", 1.0)
+    measured("c", 0.5)
+    chat = ModelPool("chat", [PoolModel("a", weight=4.0), PoolModel("b"), PoolModel("c")])
+    # Scores: a 2.0 * 1 / 4 = 0.5, b 1.0, c 0.5 (ties keep configuration order)
+    assert chat.route("ewma") == ["a", "c", "b"]
+    # Two calls in flight on "c" triple its score
+    for _ in range(2):
+        await routing.model("c").acquire()
+    assert chat.route("ewma") == ["a", "b", "c"]
+
+
+def test_unmeasured_models_score_at_the_median_latency():
+    measured("a", 1.0)
+    measured("c", 3.0)
+    # "b" has no samples yet and scores the median of the measured models (3.0)
+    assert pool("a", "b", "c").route("ewma") == ["a", "b", "c"]
+
+
+def test_open_breaker_and_slow_models_go_last():
+    measured("fast-but-broken", 0.1)
+    measured("too-slow", 0.2)
+    measured("steady", 1.0)
+    for _ in range(2):
+        get_model_health("fast-but-broken").record(0.1, ok=False)
+    assert get_model_health("fast-but-broken").is_open()
+    chat = ModelPool("chat", [
+        PoolModel("fast-but-broken"), PoolModel("too-slow", max_latency=0.15), PoolModel("steady")
+    ])
+    assert chat.route("ewma") == ["steady", "fast-but-broken", "too-slow"]
+    assert chat.route("p2c")[0] == "steady"
+
+
+def test_p2c_never_routes_to_the_worst_model_first(monkeypatch):
+    monkeypatch.setattr(model_router, "random", random.Random(7))
+    for model, seconds in (("a", 0.5), ("b", 1.0), ("c", 1.5), ("d", 4.0)):
+        measured(model, seconds)
+    chat = pool("a", "b", "c", "d")
+    firsts = [chat.route("p2c")[0] for _ in range(200)]
+    assert "d" not in firsts
+    # Unlike "ewma", the best model does not take every call
+    assert {"a", "b"} <= set(firsts)
+
+
+def test_ewma_latency_tracks_successful_calls_only():
+    health = ModelHealth("model", window=50)
+    health.record(1.0, ok=True)
+    assert health.ewma_latency == 1.0
+    health.record(3.0, ok=True)
+    assert health.ewma_latency == 2.0
+    health.record(30.0, ok=False)
+    assert health.ewma_latency == 2.0
@@ -0,0 +1,120 @@
+"""
+Multi-platform content generation: parsing the JSON answer per platform, re-requesting the
+platforms that did not parse, template fallback and the per-platform cache
+"""
+
+import json
+
+import httpx
+import pytest
+
+from app.cache import ResponseCache
+from app.services import content_service
+from app.services.content_service import _parse_variations, generate_multi_content
+
+pytestmark = pytest.mark.anyio
+
+TWEETS = ["tweet one", "tweet two", "tweet three"]
+POSTS = ["post one", "post two", "post three"]
+
+
+@pytest.fixture(autouse=True)
+def content(configure, monkeypatch):
+    configure(
+        content_multi_retries=1, hedge_policy="sequential", routing_policy="ordered", routing_max_attempts=2,
+        cache_ttl_seconds=60.0, cache_max_entries=100, cache_max_bytes=0
+    )
+    monkeypatch.setattr(content_service, "response_cache", ResponseCache("memory"))
+
+
+def answering(*contents):
+    """
+    MockTransport answering chat completions with `contents` in turn (the last one repeats); records each payload
+    """
+    payloads = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payloads.append(json.loads(request.content))
+        content = contents[min(len(payloads), len(contents)) - 1]
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+    return httpx.MockTransport(handler), payloads
+
+
+def requested(payload) -> list:
+    instruction = payload["messages"][1]["content"]
+    return instruction.split("exactly these keys: ")[1].split(".")[0].split(", ")
+
+
+def answering_requested(variations):
+    """
+    MockTransport answering every requested platform with its entry in `variations`; records each payload
+    """
+    payloads = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        payloads.append(payload)
+        content = json.dumps({platform: variations[platform] for platform in requested(payload)})
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+    return httpx.MockTransport(handler), payloads
+
+
+def test_parse_variations_per_platform():
+    content = 'Here you go:\n```json\n{"Twitter": ["a", "b", "c", "d"], "linkedin": {"variations": ["x", "y", "z"]}}\n```'
+    assert _parse_variations(content, ["twitter", "linkedin"]) == {"twitter": ["a", "b", "c"], "linkedin": ["x", "y", "z"]}
+
+
+def test_parse_variations_rejects_incomplete_platforms():
+    content = json.dumps({"twitter": ["a", " ", "b"], "linkedin": "not a list", "facebook": ["x", "y", "z"]})
+    assert _parse_variations(content, ["twitter", "linkedin", "facebook"]) == {"facebook": ["x", "y", "z"]}
+
+
+@pytest.mark.parametrize("content", ["", "no json here", "[1, 2, 3]", '{"twitter": ["a", "b", "c"'])
+def test_parse_variations_without_a_json_object(content):
+    assert _parse_variations(content, ["twitter"]) == {}
+
+
+async def test_one_call_serves_every_platform(upstream):
+    transport, payloads = answering(json.dumps({"twitter": TWEETS, "linkedin": POSTS}))
+    upstream(transport)
+    result = await generate_multi_content("launch day", ["Twitter", " linkedin", "twitter"])
+    assert result == {"twitter": TWEETS, "linkedin": POSTS}
+    assert len(payloads) == 1
+    assert payloads[0]["response_format"] == {"type": "json_object"}
+
+
+async def test_unparsed_platform_is_requested_again_on_its_own(upstream):
+    transport, payloads = answering(
+        json.dumps({"twitter": TWEETS, "linkedin": ["only one"]}),
+        json.dumps({"linkedin": POSTS})
+    )
+    upstream(transport)
+    result = await generate_multi_content("launch day", ["twitter", "linkedin"])
+    assert result == {"twitter": TWEETS, "linkedin": POSTS}
+    assert len(payloads) == 2
+    assert requested(payloads[1]) == ["linkedin"]
+    assert "twitter" not in payloads[1]["messages"][1]["content"]
+
+
+async def test_platforms_that_never_parse_fall_back_to_templates(upstream):
+    transport, payloads = answering("Sorry, I can't help with that.")
+    upstream(transport)
+    result = await generate_multi_content("launch day", ["twitter"])
+    # Both models rejected the request: it is not retried
+    assert len(payloads) == 2
+    assert len(result["twitter"]) == 3
+    assert "launch day" in result["twitter"][0]
+
+
+async def test_cached_platforms_are_not_requested_again(upstream):
+    transport, payloads = answering_requested({"twitter": TWEETS, "linkedin": POSTS})
+    upstream(transport)
+    await generate_multi_content("launch day", ["twitter"])
+    result = await generate_multi_content("launch day", ["twitter", "linkedin"])
+    assert result == {"twitter": TWEETS, "linkedin": POSTS}
+    assert [requested(payload) for payload in payloads] == [["twitter"], ["linkedin"]]
+    # cache: false asks for every platform again
+    await generate_multi_content("launch day", ["twitter", "linkedin"], use_cache=False)
+    assert requested(payloads[-1]) == ["twitter", "linkedin"]
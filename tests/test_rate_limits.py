@@ -0,0 +1,152 @@
+"""
+OpenRouter 429 handling: Retry-After parsing, retry on the same model, giving up past the retry
+budget, and the AIMD concurrency window
+"""
+
+import json
+import time
+from email.utils import formatdate
+
+import httpx
+import pytest
+
+from app.hedging import call_with_fallback
+from app.model_health import get_model_health
+from app.openrouter_client import CHAT_COMPLETIONS_PATH, post_json
+from app.rate_limits import ModelRateState, UpstreamRateLimited, parse_retry_after
+from benchmarks.mock_openrouter import create_mock_app
+
+pytestmark = pytest.mark.anyio
+
+PAYLOAD = {"model": "model-a", "messages": [{"role": "user", "content": "hi"}]}
+
+
+@pytest.fixture(autouse=True)
+def rate_limiting(configure):
+    configure(
+        rate_limit_enabled=True, rate_limit_retry_budget=5.0, rate_limit_max_retries=2, rate_limit_jitter=0.0,
+        rate_limit_backoff_base=0.01, rate_limit_backoff_max=0.05, rate_limit_decrease_factor=0.5,
+        rate_limit_decrease_interval=1.0, rate_limit_increase=1.0, rate_limit_min_concurrency=1,
+        admission_enabled=True, admission_model_concurrency=8, admission_model_limits=""
+    )
+
+
+def completion(model: str) -> httpx.Response:
+    return httpx.Response(200, json={"model": model, "choices": [{"message": {"content": f"answer from {model}"}}]})
+
+
+def scripted(*responses):
+    """
+    MockTransport answering with `responses` in turn, recording each request
+    """
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return responses[min(len(calls), len(responses)) - 1]
+
+    return httpx.MockTransport(handler), calls
+
+
+async def mock_calls(transport: httpx.ASGITransport) -> int:
+    async with httpx.AsyncClient(transport=transport, base_url="http://mock") as client:
+        return (await client.get("/mock/stats")).json()["calls"]
+
+
+def test_parse_retry_after():
+    assert parse_retry_after({"retry-after": "3"}) == 3.0
+    assert 8 <= parse_retry_after({"retry-after": formatdate(time.time() + 10, usegmt=True)}) <= 10
+    assert 4 <= parse_retry_after({"x-ratelimit-reset": str(int((time.time() + 5) * 1000))}) <= 5
+    assert parse_retry_after({"x-ratelimit-reset": "2"}) == 2.0
+    assert parse_retry_after({"retry-after": "soon"}) is None
+    assert parse_retry_after({}) is None
+
+
+async def test_429_is_retried_on_the_same_model(upstream):
+    # A non-zero Retry-After keeps the only API key quarantined, so this is the model's limit, not the key's
+    transport, calls = scripted(httpx.Response(429, headers={"Retry-After": "0.01"}), completion("model-a"))
+    state = upstream(transport)
+    result = await post_json(CHAT_COMPLETIONS_PATH, PAYLOAD, timeout=5)
+    assert result["choices"][0]["message"]["content"] == "answer from model-a"
+    assert len(calls) == 2
+    model = state.rate_limits.model("model-a")
+    assert (model.rate_limited, model.retries, model.gave_up) == (1, 1, 0)
+    # Multiplicative decrease of the model's concurrency limit
+    assert state.admission.model("model-a").limit == 4
+
+
+async def test_persistent_429_gives_up_after_max_retries(upstream):
+    transport = httpx.ASGITransport(app=create_mock_app(latency=0, rate_limit_rate=1.0, retry_after=0.01))
+    state = upstream(transport)
+    with pytest.raises(UpstreamRateLimited) as gave_up:
+        await post_json(CHAT_COMPLETIONS_PATH, PAYLOAD, timeout=5)
+    assert gave_up.value.reason == "rate_limited"
+    assert await mock_calls(transport) == 3
+    model = state.rate_limits.model("model-a")
+    assert (model.rate_limited, model.retries, model.gave_up) == (3, 2, 1)
+
+
+async def test_retry_after_beyond_the_budget_gives_up_without_waiting(upstream, configure):
+    configure(rate_limit_retry_budget=1.0)
+    transport = httpx.ASGITransport(app=create_mock_app(latency=0, rate_limit_rate=1.0, retry_after=30))
+    upstream(transport)
+    started = time.monotonic()
+    with pytest.raises(UpstreamRateLimited):
+        await post_json(CHAT_COMPLETIONS_PATH, PAYLOAD, timeout=5)
+    # The model stays blocked: the next call gives up before calling upstream at all
+    with pytest.raises(UpstreamRateLimited):
+        await post_json(CHAT_COMPLETIONS_PATH, PAYLOAD, timeout=5)
+    assert time.monotonic() - started < 1.0
+    assert await mock_calls(transport) == 1
+
+
+async def test_rate_limited_primary_falls_back_without_tripping_its_breaker(upstream, configure):
+    configure(breaker_min_requests=1, breaker_error_threshold=0.5)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if json.loads(request.content)["model"] == "model-a":
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        return completion("model-b")
+
+    upstream(httpx.MockTransport(handler))
+
+    async def call(model):
+        return await post_json(CHAT_COMPLETIONS_PATH, {**PAYLOAD, "model": model}, timeout=5)
+
+    _, winner = await call_with_fallback("qa", ["model-a", "model-b"], call)
+    assert winner == "model-b"
+    assert get_model_health("model-a").state == "closed"
+    assert get_model_health("model-a").snapshot()["samples"] == 0
+
+
+async def test_window_grows_back_to_the_configured_limit(upstream):
+    state = upstream(httpx.MockTransport(lambda request: completion("model-a")))
+    model = ModelRateState("model-a")
+    model.on_rate_limited({"retry-after": "0"}, attempt=0)
+    assert model.limiter.limit == 4
+    for _ in range(100):
+        model.on_success({})
+    assert model.window == 8.0
+    assert state.admission.model("model-a").limit == 8
+
+
+async def test_disabled_429_is_an_upstream_error_and_leaves_the_limit_alone(upstream, configure):
+    configure(rate_limit_enabled=False)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if json.loads(request.content)["model"] == "model-a":
+            return httpx.Response(429, headers={"Retry-After": "0.01"})
+        return completion("model-b")
+
+    state = upstream(httpx.MockTransport(handler))
+    for _ in range(3):
+        with pytest.raises(httpx.HTTPStatusError):
+            await post_json(CHAT_COMPLETIONS_PATH, PAYLOAD, timeout=5)
+    assert state.admission.model("model-a").limit == 8
+    assert state.rate_limits.model("model-a").rate_limited == 0
+
+    async def call(model):
+        return await post_json(CHAT_COMPLETIONS_PATH, {**PAYLOAD, "model": model}, timeout=5)
+
+    _, winner = await call_with_fallback("qa", ["model-a", "model-b"], call)
+    assert winner == "model-b"
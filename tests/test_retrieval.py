@@ -0,0 +1,81 @@
+"""
+QA context retrieval: passage splitting, BM25 passage selection and the short-context pass-through
+"""
+
+import pytest
+
+from app import retrieval
+from app.retrieval import IndexCache, PassageIndex, estimate_tokens, retrieve_context, split_passages
+
+pytestmark = pytest.mark.anyio
+
+PASSAGES = [
+    "The lighthouse keeper climbed the tower every evening to light the lamp.",
+    "Tides along the northern coast rise twice a day and flood the harbour road.",
+    "Ships avoided the reef because the lighthouse lamp could be seen for miles.",
+    "The village bakery sold bread, pastries and a famous apple cake.",
+]
+
+
+@pytest.fixture(autouse=True)
+def retrieval_settings(configure, monkeypatch):
+    configure(
+        retrieval_enabled=True, retrieval_min_tokens=50, retrieval_token_budget=1000,
+        retrieval_chunk_tokens=20, retrieval_top_k=8
+    )
+    monkeypatch.setattr(retrieval, "index_cache", IndexCache(max_entries=4))
+
+
+def test_split_packs_whole_sentences_up_to_the_chunk_size():
+    text = "One short sentence. Another short one! A third? " + "word " * 40
+    passages = split_passages(text, chunk_tokens=10)
+    assert passages[0] == "One short sentence. Another short one!"
+    assert all(estimate_tokens(passage) <= 12 for passage in passages)
+    # The oversized run of words is split rather than dropped
+    assert sum(passage.count("word") for passage in passages) == 40
+
+
+def test_select_returns_matching_passages_in_document_order():
+    index = PassageIndex(PASSAGES)
+    assert index.select("lighthouse lamp", token_budget=1000, top_k=8) == [0, 2]
+
+
+def test_select_ranks_by_relevance_within_top_k():
+    index = PassageIndex(PASSAGES)
+    assert index.select("lighthouse lamp reef", token_budget=1000, top_k=1) == [2]
+
+
+def test_select_skips_passages_over_the_budget_for_shorter_matches():
+    index = PassageIndex(["lamp " * 100, "A short note about the lamp."])
+    assert index.select("lamp", token_budget=20, top_k=8) == [1]
+
+
+def test_select_falls_back_to_the_opening_passages_without_a_match():
+    index = PassageIndex(PASSAGES)
+    budget = int(index.tokens[0] + index.tokens[1])
+    assert index.select("quantum chromodynamics", token_budget=budget, top_k=8) == [0, 1]
+
+
+async def test_short_context_is_passed_through():
+    context = " ".join(PASSAGES[:2])
+    assert estimate_tokens(context) <= 50
+    assert await retrieve_context("lighthouse", context) == (context, None)
+
+
+async def test_disabled_retrieval_passes_long_context_through(configure):
+    configure(retrieval_enabled=False)
+    context = " ".join(PASSAGES * 5)
+    assert await retrieve_context("lighthouse", context) == (context, None)
+
+
+async def test_long_context_sends_only_relevant_passages_and_reuses_the_index():
+    context = " ".join(PASSAGES * 3)
+    selected, stats = await retrieve_context("bakery bread", context)
+    assert "bakery" in selected
+    assert "lighthouse" not in selected
+    assert stats["context_tokens"] == estimate_tokens(context)
+    assert stats["saved_prompt_tokens"] == stats["context_tokens"] - stats["sent_context_tokens"] > 0
+    assert stats["index_cached"] is False
+    _, again = await retrieve_context("tides flood", context)
+    assert again["index_cached"] is True
+    assert retrieval.index_cache.snapshot() == {"entries": 1, "hits": 1, "misses": 1}